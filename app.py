@@ -1,62 +1,197 @@
 import os
 import logging
-import io
-import csv
+import tempfile
 from datetime import datetime, timedelta
-from collections import defaultdict
-from flask import Flask, render_template, request, flash, redirect, url_for, send_file, jsonify, send_from_directory
+from functools import wraps
+from flask import (Flask, Response, render_template, request, flash, redirect, url_for, jsonify,
+                   send_from_directory, stream_with_context, current_app)
+from flask.cli import AppGroup
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from sqlalchemy import func, desc, and_
-from sqlalchemy.orm import aliased
-from models import db, Vehicle, ParkingSpace, User
+from sqlalchemy import func
+import click
+import archive
+import assets
+import compression
+import etags
+import events
+import gate
+import metrics
+import occupancy
+import plate_search
+import reconcile
+import stats
+import user_cache
+import versions
+from models import db, Vehicle, VehicleArchive, ParkingSpace, User, HourlyStat, GateOperation
+from reports import (ReportFilter, ReportFilterError, report_rows, report_summary,
+                     calculate_checkins_trend, export_csv, paginate, page_size)
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-# Initialize Flask app
-app = Flask(__name__, static_url_path='/static')
-app.secret_key = os.environ.get("SESSION_SECRET")
+# Routes and CLI commands are declared on these at import time and attached
+# to every app create_app() builds. Unlike a blueprint, they keep the plain
+# endpoint names ('dashboard', 'login', ...) that url_for and the metrics use
+routes = []
+cli = AppGroup(__name__)
 
-# Configure database
-logger.info("Configuring database connection...")
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL")
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
+def route(rule, **options):
+    """app.route for the apps built by create_app()"""
+    def decorator(view):
+        routes.append((rule, view, options))
+        return view
+    return decorator
 
-# Initialize extensions
-db.init_app(app)
 login_manager = LoginManager()
-login_manager.init_app(app)
 login_manager.login_view = 'login'
 login_manager.login_message = 'Please log in to access the parking system.'
 
+def create_app(config=None):
+    """Build the Flask app; config overrides the settings read from the environment.
+
+    Does no database I/O, so gunicorn workers, scripts and benchmarks start
+    without connecting. The schema and default data are created out of band
+    by `flask init-db`. Extensions keep their per-app state in app.extensions,
+    so each call builds an independent app; main.py holds the one served.
+    """
+    app = Flask(__name__, static_url_path='/static')
+    app.secret_key = os.environ.get("SESSION_SECRET")
+
+    # Configure database
+    logger.info("Configuring database connection...")
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL")
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        "pool_recycle": 300,
+        "pool_pre_ping": True,
+    }
+
+    # Per-worker metrics snapshots are merged from this directory, so it must
+    # be shared by all gunicorn workers of the deployment
+    app.config["METRICS_DIR"] = os.environ.get("METRICS_DIR", metrics.DEFAULT_DIRECTORY)
+    # Version files that let workers invalidate each other's caches
+    app.config["SHARED_STATE_DIR"] = os.environ.get(
+        "SHARED_STATE_DIR", os.path.join(tempfile.gettempdir(), "chinopark-state"))
+
+    # Completed sessions older than this are moved to vehicle_archive by the
+    # archive-sessions command
+    app.config["ARCHIVE_AFTER_DAYS"] = int(os.environ.get(
+        "ARCHIVE_AFTER_DAYS", archive.ARCHIVE_AFTER_DAYS))
+
+    # Seconds between background occupancy reconciliation passes; 0 disables it
+    app.config["RECONCILE_INTERVAL"] = float(os.environ.get("RECONCILE_INTERVAL", "0"))
+    app.config["RECONCILE_REPAIR"] = os.environ.get("RECONCILE_REPAIR", "1") == "1"
+    if config:
+        app.config.update(config)
+
+    # Initialize extensions
+    db.init_app(app)
+    metrics.init_app(app)
+    versions.init_app(app)
+    occupancy.init_app(app)
+    user_cache.init_app(app)
+    plate_search.init_app(app)
+    archive.init_app(app)
+    reconcile.init_app(app)
+    events.init_app(app)
+    assets.init_app(app)
+    compression.init_app(app)
+    login_manager.init_app(app)
+
+    for rule, view, options in routes:
+        app.add_url_rule(rule, view_func=view, **options)
+    for command in cli.commands.values():
+        app.cli.add_command(command)
+    return app
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # Served from a per-worker cache; admin changes to the account bump the
+    # user's version so the next request reloads it
+    return user_cache.get_user(int(user_id))
 
 # Add a route to serve the manifest file
-@app.route('/manifest.json')
+# These keep fixed URLs, so browsers revalidate them on every use instead of
+# caching them for a year like the fingerprinted assets
+@route('/manifest.json')
 def manifest():
-    return send_from_directory('static', 'manifest.json')
+    response = send_from_directory('static', 'manifest.json')
+    response.cache_control.no_cache = True
+    return response
 
 # Add a route to serve the service worker
-@app.route('/service-worker.js')
+@route('/service-worker.js')
 def service_worker():
-    return send_from_directory('static/js', 'service-worker.js')
+    response = send_from_directory('static/js', 'service-worker.js')
+    response.cache_control.no_cache = True
+    return response
 
 def create_tables():
     """Create database tables"""
     try:
         logger.info("Creating database tables...")
         db.create_all()
+        create_indexes()
         logger.info("Database tables created successfully")
     except Exception as e:
         logger.error(f"Error creating tables: {str(e)}")
         raise
 
+def create_indexes():
+    """Create declared indexes that are missing from existing tables"""
+    # create_all() skips tables that already exist, so indexes declared after
+    # a table was first created have to be added here
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+
+@cli.command('create-indexes')
+def create_indexes_command():
+    """Add missing indexes to an existing database"""
+    create_indexes()
+    logger.info("Database indexes are up to date")
+
+@cli.command('build-assets')
+def build_assets_command():
+    """Write fingerprinted, precompressed copies of the static files"""
+    built = assets.build(current_app.static_folder)
+    logger.info(f"Built {len(built)} static assets into static/{assets.BUILD_DIR}"
+                f"{'' if assets.brotli else ' (gzip only; brotli is not installed)'}")
+
+@cli.command('archive-sessions')
+@click.option('--days', type=int, default=None,
+              help='Archive sessions checked out more than this many days ago')
+@click.option('--batch-size', type=int, default=archive.ARCHIVE_BATCH_SIZE,
+              help='Rows moved per transaction')
+def archive_sessions_command(days, batch_size):
+    """Move old completed sessions to vehicle_archive and prune expired idempotency keys"""
+    days = current_app.config["ARCHIVE_AFTER_DAYS"] if days is None else days
+    moved = archive.archive_sessions(days, batch_size)
+    logger.info(f"Archived {moved} sessions checked out more than {days} days ago")
+    # Idempotency keys only matter while a device may still replay them;
+    # init-db prunes them on every start as well
+    pruned = gate.prune_operations()
+    logger.info(f"Pruned {pruned} expired gate idempotency keys")
+
+@cli.command('reconcile-occupancy')
+@click.option('--repair', is_flag=True, help='Correct the drifting counters')
+def reconcile_occupancy_command(repair):
+    """Compare occupied spaces with the active vehicles and report drift"""
+    # Each drifting vehicle type is logged as a warning by reconcile()
+    drifts = reconcile.reconcile(repair=repair)
+    if not drifts:
+        logger.info("Occupancy counters match the active vehicles")
+    elif repair:
+        logger.info(f"Occupancy repaired for {len(drifts)} vehicle types")
+    else:
+        raise SystemExit(1)
+
+@cli.command('rebuild-stats')
+def rebuild_stats_command():
+    """Recompute the hourly statistics rollup from the vehicle table"""
+    rows = stats.rebuild()
+    logger.info(f"Hourly statistics rebuilt ({rows} rows)")
+
 def initialize_default_data():
     """Initialize default spaces and admin user"""
     try:
@@ -99,24 +234,41 @@ def initialize_default_data():
         db.session.rollback()
         raise
 
-# Initialize database and default data
-with app.app_context():
+def init_db():
+    """Create missing tables and indexes, then the default spaces and admin.
+
+    A database upgraded from before the hourly rollup has sessions but no
+    hourly_stat rows; those are backfilled here so dashboard totals are
+    right from the first request. Expired idempotency keys are pruned here
+    too: the deployment runs `flask init-db` before every start, so
+    gate_operation stays bounded without a separate scheduled job.
+    """
     create_tables()
     initialize_default_data()
+    stats.backfill()
+    pruned = gate.prune_operations()
+    if pruned:
+        logger.info(f"Pruned {pruned} expired gate idempotency keys")
+
+@cli.command('init-db')
+def init_db_command():
+    """Create the database schema and default data; safe to run again"""
+    init_db()
+    logger.info("Database is ready")
 
 # Authentication routes
-@app.route('/')
+@route('/')
 def landing():
     return render_template('landing.html')
 
-@app.route('/dashboard')
+@route('/dashboard')
 @login_required
 def dashboard():
     spaces = {space.vehicle_type: {"total": space.total_spaces, "occupied": space.occupied_spaces}
-             for space in ParkingSpace.query.all()}
+             for space in occupancy.get_spaces()}
     return render_template('index.html', spaces=spaces)
 
-@app.route('/login', methods=['GET', 'POST'])
+@route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
         return redirect(url_for('dashboard'))
@@ -146,7 +298,7 @@ def login():
 
     return render_template('auth/login.html')
 
-@app.route('/register', methods=['GET', 'POST'])
+@route('/register', methods=['GET', 'POST'])
 def register():
     if current_user.is_authenticated:
         return redirect(url_for('dashboard'))
@@ -202,7 +354,7 @@ def register():
     return render_template('auth/register.html')
 
 # Logout route added here
-@app.route('/logout')
+@route('/logout')
 @login_required
 def logout():
     logout_user()
@@ -210,7 +362,7 @@ def logout():
     return redirect(url_for('login'))
 
 # Add these new routes for user management
-@app.route('/admin/users')
+@route('/admin/users')
 @login_required
 def manage_users():
     if not current_user.is_admin:
@@ -224,7 +376,7 @@ def manage_users():
                          pending_users=pending_users,
                          all_users=all_users)
 
-@app.route('/admin/users/<int:user_id>/approve', methods=['POST'])
+@route('/admin/users/<int:user_id>/approve', methods=['POST'])
 @login_required
 def approve_user(user_id):
     if not current_user.is_admin:
@@ -234,10 +386,11 @@ def approve_user(user_id):
     user = User.query.get_or_404(user_id)
     user.is_approved = True
     db.session.commit()
+    user_cache.invalidate(user.id)
     flash(f'User {user.username} has been approved.', 'success')
     return redirect(url_for('manage_users'))
 
-@app.route('/admin/users/<int:user_id>/reject', methods=['POST'])
+@route('/admin/users/<int:user_id>/reject', methods=['POST'])
 @login_required
 def reject_user(user_id):
     if not current_user.is_admin:
@@ -248,11 +401,12 @@ def reject_user(user_id):
     # Instead of deleting, we could also add a rejected status
     db.session.delete(user)
     db.session.commit()
+    user_cache.invalidate(user.id)
     flash(f'User {user.username} has been rejected.', 'success')
     return redirect(url_for('manage_users'))
 
 # Add these new routes after the existing user management routes
-@app.route('/admin/users/<int:user_id>/deactivate', methods=['POST'])
+@route('/admin/users/<int:user_id>/deactivate', methods=['POST'])
 @login_required
 def deactivate_user(user_id):
     if not current_user.is_admin:
@@ -265,10 +419,11 @@ def deactivate_user(user_id):
     else:
         user.is_active = False
         db.session.commit()
+        user_cache.invalidate(user.id)
         flash(f'User {user.username} has been deactivated.', 'success')
     return redirect(url_for('manage_users'))
 
-@app.route('/admin/users/<int:user_id>/activate', methods=['POST'])
+@route('/admin/users/<int:user_id>/activate', methods=['POST'])
 @login_required
 def activate_user(user_id):
     if not current_user.is_admin:
@@ -278,10 +433,11 @@ def activate_user(user_id):
     user = User.query.get_or_404(user_id)
     user.is_active = True
     db.session.commit()
+    user_cache.invalidate(user.id)
     flash(f'User {user.username} has been activated.', 'success')
     return redirect(url_for('manage_users'))
 
-@app.route('/admin/users/<int:user_id>/delete', methods=['POST'])
+@route('/admin/users/<int:user_id>/delete', methods=['POST'])
 @login_required
 def delete_user(user_id):
     if not current_user.is_admin:
@@ -292,13 +448,25 @@ def delete_user(user_id):
     if user.is_admin:
         flash('Cannot delete admin users.', 'error')
     else:
+        HourlyStat.query.filter_by(user_id=user.id).delete(synchronize_session=False)
+        GateOperation.query.filter_by(user_id=user.id).delete(synchronize_session=False)
+        VehicleArchive.query.filter_by(user_id=user.id).delete(synchronize_session=False)
+        VehicleArchive.query.filter_by(handler_id=user.id).update({'handler_id': None},
+                                                                  synchronize_session=False)
         db.session.delete(user)
         db.session.commit()
+        user_cache.invalidate(user.id)
+        plate_search.invalidate()
+        # The user's active vehicles went with them; give their spaces back
+        try:
+            reconcile.reconcile(repair=True)
+        except Exception as e:
+            logger.error(f"Error reconciling occupancy after deleting user: {str(e)}")
         flash(f'User {user.username} has been deleted.', 'success')
     return redirect(url_for('manage_users'))
 
 # Add these new routes after the existing user management routes
-@app.route('/admin/spaces')
+@route('/admin/spaces')
 @login_required
 def admin_spaces():
     if not current_user.is_admin:
@@ -308,7 +476,7 @@ def admin_spaces():
     spaces = ParkingSpace.query.all()
     return render_template('admin/spaces.html', spaces=spaces)
 
-@app.route('/admin/spaces/update', methods=['POST'])
+@route('/admin/spaces/update', methods=['POST'])
 @login_required
 def update_spaces():
     if not current_user.is_admin:
@@ -320,11 +488,20 @@ def update_spaces():
         total_spaces = request.form.get('total_spaces')
 
         space = ParkingSpace.query.get_or_404(space_id)
-        if int(total_spaces) < space.occupied_spaces:
+        # Compare against occupied_spaces inside the UPDATE itself so a
+        # concurrent check-in cannot slip in between the check and the write
+        result = db.session.execute(
+            db.update(ParkingSpace)
+            .where(ParkingSpace.id == space.id,
+                   ParkingSpace.occupied_spaces <= int(total_spaces))
+            .values(total_spaces=int(total_spaces))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        occupancy.invalidate()
+        if result.rowcount != 1:
             flash('New total spaces cannot be less than currently occupied spaces.', 'error')
         else:
-            space.total_spaces = int(total_spaces)
-            db.session.commit()
             flash('Parking spaces updated successfully.', 'success')
     except Exception as e:
         flash('Error updating parking spaces.', 'error')
@@ -333,7 +510,7 @@ def update_spaces():
     return redirect(url_for('admin_spaces'))
 
 # Add these new routes after the existing admin routes
-@app.route('/admin/reports')
+@route('/admin/reports')
 @login_required
 def admin_reports():
     if not current_user.is_admin:
@@ -341,93 +518,25 @@ def admin_reports():
         return redirect(url_for('dashboard'))
 
     try:
-        # Get filter parameters
-        date_range = request.args.get('date_range', 'today')
-        vehicle_type = request.args.get('vehicle_type', 'all')
-        status = request.args.get('status', 'all')
-        handover_status = request.args.get('handover_status', 'all')
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-
-        # Calculate date range
-        today = datetime.utcnow().date()
-        if date_range == 'today':
-            start_date = today
-            end_date = today + timedelta(days=1)
-        elif date_range == 'yesterday':
-            start_date = today - timedelta(days=1)
-            end_date = today
-        elif date_range == 'this_week':
-            start_date = today - timedelta(days=today.weekday())
-            end_date = start_date + timedelta(days=7)
-        elif date_range == 'last_week':
-            start_date = today - timedelta(days=today.weekday() + 7)
-            end_date = start_date + timedelta(days=7)
-        elif date_range == 'this_month':
-            start_date = today.replace(day=1)
-            end_date = (today.replace(day=1) + timedelta(days=32)).replace(day=1)
-        elif date_range == 'custom':
-            if not start_date or not end_date:
-                flash('Please select both start and end dates for custom range', 'warning')
-                return redirect(url_for('admin_reports'))
-            start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
-            end_date = datetime.strptime(end_date, '%Y-%m-%d').date() + timedelta(days=1)
-
-        # Build query filters
-        filters = [
-            Vehicle.check_in_time >= start_date,
-            Vehicle.check_in_time < end_date
-        ]
-
-        if vehicle_type != 'all':
-            filters.append(Vehicle.vehicle_type == vehicle_type)
-        if status != 'all':
-            filters.append(Vehicle.status == status)
-        if handover_status != 'all':
-            if handover_status == 'handed_over':
-                filters.append(Vehicle.handler_id.isnot(None))
-            elif handover_status == 'not_handed_over':
-                filters.append(Vehicle.handler_id.is_(None))
-
-        # Create aliases for User joins
-        RecordedByUser = aliased(User)
-        HandlerUser = aliased(User)
-
-        # Query vehicles with proper aliasing
-        vehicles = (Vehicle.query
-                   .join(RecordedByUser, Vehicle.user_id == RecordedByUser.id)
-                   .outerjoin(HandlerUser, Vehicle.handler_id == HandlerUser.id)
-                   .filter(and_(*filters))
-                   .order_by(Vehicle.check_in_time.desc())
-                   .all())
-
-        # Calculate metrics
-        metrics = calculate_metrics(vehicles, start_date, end_date)
-
-        # Add handover metrics
-        total_handovers = sum(1 for v in vehicles if v.handler_id is not None)
-        active_handovers = sum(1 for v in vehicles if v.handler_id is not None and v.status == 'active')
-        metrics.update({
-            'total_handovers': total_handovers,
-            'active_handovers': active_handovers
-        })
-
-        vehicle_distribution = calculate_vehicle_distribution(vehicles)
-        checkins_trend = calculate_checkins_trend(start_date, end_date)
+        try:
+            report_filter = ReportFilter.from_args(request.args)
+        except ReportFilterError as e:
+            flash(str(e), 'warning')
+            return redirect(url_for('admin_reports'))
+
+        vehicles, next_cursor = paginate(report_rows(report_filter))
+        metrics, vehicle_distribution = report_summary(report_filter)
+        checkins_trend = calculate_checkins_trend(report_filter)
 
         return render_template(
             'admin/reports.html',
             vehicles=vehicles,
+            next_cursor=next_cursor,
             metrics=metrics,
             vehicle_distribution=vehicle_distribution,
             checkins_trend=checkins_trend,
-            date_range=date_range,
-            vehicle_type=vehicle_type,
-            status=status,
-            handover_status=handover_status,
-            start_date=start_date.strftime('%Y-%m-%d') if isinstance(start_date, datetime) else start_date,
-            end_date=(end_date - timedelta(days=1)).strftime('%Y-%m-%d') if isinstance(end_date, datetime) else end_date,
-            now=datetime.utcnow()
+            now=datetime.utcnow(),
+            **report_filter.template_args()
         )
 
     except Exception as e:
@@ -435,7 +544,7 @@ def admin_reports():
         flash('Error generating report', 'error')
         return redirect(url_for('admin_dashboard'))
 
-@app.route('/admin/reports/export')
+@route('/admin/reports/export')
 @login_required
 def export_report():
     if not current_user.is_admin:
@@ -443,116 +552,20 @@ def export_report():
         return redirect(url_for('dashboard'))
 
     try:
-        # Get filter parameters
-        date_range = request.args.get('date_range', 'today')
-        vehicle_type = request.args.get('vehicle_type', 'all')
-        status = request.args.get('status', 'all')
-        handover_status = request.args.get('handover_status', 'all')
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-
-        # Calculate date range
-        today = datetime.utcnow().date()
-        if date_range == 'today':
-            start_date = today
-            end_date = today + timedelta(days=1)
-        elif date_range == 'yesterday':
-            start_date = today - timedelta(days=1)
-            end_date = today
-        elif date_range == 'this_week':
-            start_date = today - timedelta(days=today.weekday())
-            end_date = start_date + timedelta(days=7)
-        elif date_range == 'last_week':
-            start_date = today - timedelta(days=today.weekday() + 7)
-            end_date = start_date + timedelta(days=7)
-        elif date_range == 'this_month':
-            start_date = today.replace(day=1)
-            end_date = (today.replace(day=1) + timedelta(days=32)).replace(day=1)
-        elif date_range == 'custom':
-            if not start_date or not end_date:
-                flash('Please select both start and end dates for custom range', 'warning')
-                return redirect(url_for('admin_reports'))
-            start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
-            end_date = datetime.strptime(end_date, '%Y-%m-%d').date() + timedelta(days=1)
-
-        # Build query filters
-        filters = [
-            Vehicle.check_in_time >= start_date,
-            Vehicle.check_in_time < end_date
-        ]
-
-        if vehicle_type != 'all':
-            filters.append(Vehicle.vehicle_type == vehicle_type)
-        if status != 'all':
-            filters.append(Vehicle.status == status)
-        if handover_status != 'all':
-            if handover_status == 'handed_over':
-                filters.append(Vehicle.handler_id.isnot(None))
-            elif handover_status == 'not_handed_over':
-                filters.append(Vehicle.handler_id.is_(None))
-
-        # Create aliases for User joins
-        RecordedByUser = aliased(User)
-        HandlerUser = aliased(User)
-
-        # Query vehicles with proper aliasing
-        vehicles = (Vehicle.query
-                   .join(RecordedByUser, Vehicle.user_id == RecordedByUser.id)
-                   .outerjoin(HandlerUser, Vehicle.handler_id == HandlerUser.id)
-                   .filter(and_(*filters))
-                   .order_by(Vehicle.check_in_time.desc())
-                   .all())
-
-        # Create CSV file
-        output = io.StringIO()
-        writer = csv.writer(output)
-
-        # Write headers
-        writer.writerow([
-            'Recorded By', 'Email', 'Vehicle Type', 'Plate Number',
-            'Vehicle Model', 'Vehicle Color', 'Driver Name', 'Driver ID Type',
-            'Driver ID Number', 'Driver Phone', 'Driver Residence',
-            'Check-in Time (EAT)', 'Check-out Time (EAT)', 'Duration (Hours)',
-            'Status', 'Handover Status', 'Handler', 'Handover Time', 'Handover Notes'
-        ])
-
-        # Write data
-        for vehicle in vehicles:
-            if vehicle.status == 'completed':
-                duration = (vehicle.check_out_time - vehicle.check_in_time).total_seconds() / 3600
-            else:
-                duration = (datetime.utcnow() - vehicle.check_in_time).total_seconds() / 3600
-
-            writer.writerow([
-                vehicle.recorded_by.username,
-                vehicle.recorded_by.email,
-                vehicle.vehicle_type,
-                vehicle.plate_number,
-                vehicle.vehicle_model,
-                vehicle.vehicle_color,
-                vehicle.driver_name,
-                vehicle.driver_id_type.replace('_', ' ').title(),
-                vehicle.driver_id_number,
-                vehicle.driver_phone,
-                vehicle.driver_residence,
-                vehicle.formatted_check_in_time(),
-                vehicle.formatted_check_out_time() or 'N/A',
-                f"{duration:.1f}",
-                vehicle.status.title(),
-                'Handed Over' if vehicle.handler_id else 'Not Handed Over',
-                vehicle.handler.username if vehicle.handler else 'N/A',
-                vehicle.formatted_handover_time() or 'N/A',
-                vehicle.handover_notes or 'N/A'
-            ])
-
-        # Prepare the response
-        output.seek(0)
-        filename = f'parking_report_{start_date.strftime("%Y%m%d")}_{end_date.strftime("%Y%m%d")}.csv'
-        return send_file(
-            io.BytesIO(output.getvalue().encode('utf-8')),
+        try:
+            report_filter = ReportFilter.from_args(request.args)
+        except ReportFilterError as e:
+            flash(str(e), 'warning')
+            return redirect(url_for('admin_reports'))
+
+        # Stream the CSV as it is read from the database instead of
+        # building the whole file in memory first
+        filename = (f'parking_report_{report_filter.start_date.strftime("%Y%m%d")}_'
+                    f'{report_filter.end_date.strftime("%Y%m%d")}.csv')
+        return Response(
+            stream_with_context(export_csv(report_filter)),
             mimetype='text/csv',
-            as_attachment=True,
-            download_name=filename
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
         )
 
     except Exception as e:
@@ -561,71 +574,34 @@ def export_report():
         return redirect(url_for('admin_reports'))
 
 # Add these new routes after the existing admin routes
-@app.route('/admin/reports/api')
+def report_etag_key():
+    """What selects a reports API response, for its ETag; None skips it"""
+    if not current_user.is_admin:
+        return None
+    try:
+        report_filter = ReportFilter.from_args(request.args)
+    except ReportFilterError:
+        return None
+    # The resolved dates, so 'today' moves on at midnight
+    return (sorted(report_filter.template_args().items()), request.args.get('cursor') or '',
+            page_size(request.args.get('limit')))
+
+@route('/admin/reports/api')
 @login_required
+@etags.conditional(etags.REPORT_VERSIONS, report_etag_key)
 def admin_reports_api():
     if not current_user.is_admin:
         return jsonify({'error': 'Access denied'}), 403
 
     try:
-        # Get filter parameters
-        date_range = request.args.get('date_range', 'today')
-        vehicle_type = request.args.get('vehicle_type', 'all')
-        status = request.args.get('status', 'all')
-        handover_status = request.args.get('handover_status', 'all')
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-
-        # Calculate date range
-        today = datetime.utcnow().date()
-        if date_range == 'today':
-            start_date = today
-            end_date = today + timedelta(days=1)
-        elif date_range == 'yesterday':
-            start_date = today - timedelta(days=1)
-            end_date = today
-        elif date_range == 'this_week':
-            start_date = today - timedelta(days=today.weekday())
-            end_date = start_date + timedelta(days=7)
-        elif date_range == 'last_week':
-            start_date = today - timedelta(days=today.weekday() + 7)
-            end_date = start_date + timedelta(days=7)
-        elif date_range == 'this_month':
-            start_date = today.replace(day=1)
-            end_date = (today.replace(day=1) + timedelta(days=32)).replace(day=1)
-        elif date_range == 'custom':
-            if not start_date or not end_date:
-                return jsonify({'error': 'Invalid date range'}), 400
-            start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
-            end_date = datetime.strptime(end_date, '%Y-%m-%d').date() + timedelta(days=1)
-
-        # Build query filters
-        filters = [
-            Vehicle.check_in_time >= start_date,
-            Vehicle.check_in_time < end_date
-        ]
-
-        if vehicle_type != 'all':
-            filters.append(Vehicle.vehicle_type == vehicle_type)
-        if status != 'all':
-            filters.append(Vehicle.status == status)
-        if handover_status != 'all':
-            if handover_status == 'handed_over':
-                filters.append(Vehicle.handler_id.isnot(None))
-            elif handover_status == 'not_handed_over':
-                filters.append(Vehicle.handler_id.is_(None))
-
-        # Create aliases for User joins
-        RecordedByUser = aliased(User, name='recorded_by')
-        HandlerUser = aliased(User, name='handler')
-
-        # Query vehicles with proper aliasing
-        vehicles = (Vehicle.query
-                   .join(RecordedByUser, Vehicle.user_id == RecordedByUser.id)
-                   .outerjoin(HandlerUser, Vehicle.handler_id == HandlerUser.id)
-                   .filter(and_(*filters))
-                   .order_by(Vehicle.check_in_time.desc())
-                   .all())
+        try:
+            report_filter = ReportFilter.from_args(request.args)
+            # Keyset pagination: later pages pass back the previous next_cursor
+            cursor = request.args.get('cursor')
+            vehicles, next_cursor = paginate(report_rows(report_filter), cursor,
+                                             page_size(request.args.get('limit')))
+        except ReportFilterError as e:
+            return jsonify({'error': str(e)}), 400
 
         # Format vehicle data
         vehicle_data = []
@@ -670,124 +646,66 @@ def admin_reports_api():
                 'handover': handover_info
             })
 
-        # Calculate metrics
-        metrics = calculate_metrics(vehicles, start_date, end_date)
-
-        # Calculate vehicle distribution
-        distribution = defaultdict(int)
-        for vehicle in vehicles:
-            distribution[vehicle.vehicle_type.title()] += 1
-
-        vehicle_distribution = {
-            'labels': list(distribution.keys()),
-            'data': list(distribution.values())
+        payload = {
+            'vehicles': vehicle_data,
+            'next_cursor': next_cursor
         }
 
-        # Calculate check-ins trend
-        checkins_by_date = defaultdict(int)
-        date_range = [(start_date + timedelta(days=x)).strftime('%Y-%m-%d') 
-                     for x in range((end_date - start_date).days)]
-
-        for vehicle in vehicles:
-            checkins_by_date[vehicle.check_in_time.strftime('%Y-%m-%d')] += 1
-
-        checkins_trend = {
-            'labels': date_range,
-            'data': [checkins_by_date.get(date, 0) for date in date_range]
-        }
+        # Summary and charts only change with the filters, so they are sent
+        # with the first page only
+        if not cursor:
+            metrics, vehicle_distribution = report_summary(report_filter)
+            payload.update({
+                'metrics': metrics,
+                'vehicle_distribution': vehicle_distribution,
+                'checkins_trend': calculate_checkins_trend(report_filter)
+            })
 
-        return jsonify({
-            'vehicles': vehicle_data,
-            'metrics': metrics,
-            'vehicle_distribution': vehicle_distribution,
-            'checkins_trend': checkins_trend
-        })
+        return jsonify(payload)
 
     except Exception as e:
         logger.error(f"Error generating API report: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@route('/admin/metrics')
+@login_required
+def admin_metrics():
+    if not current_user.is_admin:
+        return jsonify({'error': 'Access denied'}), 403
+
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 # Add these new routes after the existing admin routes
-@app.route('/admin')
+@route('/admin')
 @login_required
 def admin_dashboard():
     if not current_user.is_admin:
         flash('Access denied. Admin privileges required.', 'error')
         return redirect(url_for('dashboard'))
 
-    total_vehicles = Vehicle.query.count()
     active_vehicles = Vehicle.query.filter_by(status='active').count()
-    spaces = ParkingSpace.query.all()
+    spaces = occupancy.get_spaces()
 
-    # Get today's statistics
-    today = datetime.utcnow().date()
-    today_check_ins = Vehicle.query.filter(
-        Vehicle.check_in_time >= today
-    ).count()
-    today_check_outs = Vehicle.query.filter(
-        Vehicle.check_out_time >= today,
-        Vehicle.status == 'completed'
-    ).count()
+    # All-time and today's statistics from the hourly rollup
+    today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    totals = stats.dashboard_totals(today)
 
     return render_template('admin/dashboard.html',
-                       total_vehicles=total_vehicles,
+                       total_vehicles=totals['total_check_ins'],
                        active_vehicles=active_vehicles,
                        spaces=spaces,
-                       today_check_ins=today_check_ins,
-                       today_check_outs=today_check_outs)
+                       today_check_ins=totals['today_check_ins'],
+                       today_check_outs=totals['today_check_outs'])
 
 # Protected routes for regular users
-@app.route('/check-in', methods=['POST'])
+@route('/check-in', methods=['POST'])
 @login_required
 def check_in():
     try:
-        vehicle_type = request.form.get('vehicle_type')
-        plate_number = request.form.get('plate_number')
-        vehicle_model = request.form.get('vehicle_model')
-        vehicle_color = request.form.get('vehicle_color')
-        driver_name = request.form.get('driver_name')
-        driver_id_type = request.form.get('driver_id_type')
-        driver_id_number = request.form.get('driver_id_number')
-        driver_phone = request.form.get('driver_phone')
-        driver_residence = request.form.get('driver_residence')
-
-        # Check for available space
-        space = ParkingSpace.query.filter_by(vehicle_type=vehicle_type).first()
-        if not space or space.occupied_spaces >= space.total_spaces:
-            flash('No available spaces for this vehicle type!', 'error')
-            return redirect(url_for('dashboard'))
-
-        # Check if vehicle already exists and is active
-        existing_vehicle = Vehicle.query.filter_by(
-            plate_number=plate_number, 
-            status='active'
-        ).first()
-
-        if existing_vehicle:
-            flash('Vehicle is already parked!', 'error')
-            return redirect(url_for('dashboard'))
-
-        # Create new vehicle record
-        vehicle = Vehicle(
-            plate_number=plate_number,
-            vehicle_type=vehicle_type,
-            vehicle_model=vehicle_model,
-            vehicle_color=vehicle_color,
-            driver_name=driver_name,
-            driver_id_type=driver_id_type,
-            driver_id_number=driver_id_number,
-            driver_phone=driver_phone,
-            driver_residence=driver_residence,
-            check_in_time=datetime.utcnow(),
-            status='active',
-            user_id=current_user.id
-        )
-
-        space.occupied_spaces += 1
-        db.session.add(vehicle)
-        db.session.commit()
+        gate.check_in(request.form, current_user)
         flash('Vehicle checked in successfully!', 'success')
-
+    except gate.GateError as e:
+        flash(str(e), 'error')
     except Exception as e:
         logger.error(f"Error during check-in: {str(e)}")
         flash('An error occurred during check-in!', 'error')
@@ -795,33 +713,14 @@ def check_in():
 
     return redirect(url_for('dashboard'))
 
-@app.route('/check-out', methods=['POST'])
+@route('/check-out', methods=['POST'])
 @login_required
 def check_out():
     try:
-        plate_number = request.form.get('plate_number')
-                        # Modified query to check both user_id and handler_id
-        vehicle = Vehicle.query.filter(
-            Vehicle.plate_number == plate_number,
-            Vehicle.status == 'active'
-        ).filter(
-            (Vehicle.user_id == current_user.id) | 
-            (Vehicle.handler_id == current_user.id)
-        ).first()
-
-        if not vehicle:
-            flash('Vehicle not found or already checked out!', 'error')
-            return redirect(url_for('dashboard'))
-
-        space = ParkingSpace.query.filter_by(vehicle_type=vehicle.vehicle_type).first()
-        if space:
-            space.occupied_spaces = max(0, space.occupied_spaces - 1)
-
-        vehicle.status = 'completed'
-        vehicle.check_out_time = datetime.utcnow()
-        vehicle.handler_id = None  # Clear handler when checking out
-        db.session.commit()
+        gate.check_out(request.form.get('plate_number'), current_user)
         flash('Vehicle checked out successfully!', 'success')
+    except gate.GateError as e:
+        flash(str(e), 'error')
     except Exception as e:
         logger.error(f"Error during check-out: {str(e)}")
         flash('An error occurred during check-out!', 'error')
@@ -829,30 +728,154 @@ def check_out():
 
     return redirect(url_for('dashboard'))
 
+# JSON gate API: one round trip per gate action, returning the result
+# together with the updated occupancy
+GATE_ERROR_STATUS = {'invalid': 400, 'not_found': 404, 'no_space': 409, 'already_parked': 409,
+                     'conflict': 409}
+
+def api_login_required(view):
+    """login_required for JSON endpoints: 401 instead of a login redirect"""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if not current_user.is_authenticated:
+            return jsonify({'error': 'Authentication required'}), 401
+        return view(*args, **kwargs)
+    return wrapped
+
+def gate_error_response(e):
+    return jsonify({'error': str(e), 'code': e.code,
+                    'occupancy': gate.occupancy_payload()}), GATE_ERROR_STATUS[e.code]
+
+def idempotency_key(data):
+    # Retried requests, e.g. replayed by the service worker, repeat the key
+    # and get the first attempt's outcome instead of a second gate action
+    return request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+
+@route('/api/v1/check-in', methods=['POST'])
+@api_login_required
+def api_check_in():
+    try:
+        data = request.get_json(silent=True) or request.form
+        vehicle = gate.check_in(data, current_user, idempotency_key(data))
+        return jsonify({'vehicle': gate.vehicle_payload(vehicle),
+                        'occupancy': gate.occupancy_payload()}), 201
+    except gate.GateError as e:
+        return gate_error_response(e)
+    except Exception as e:
+        logger.error(f"Error during API check-in: {str(e)}")
+        db.session.rollback()
+        return jsonify({'error': 'An error occurred during check-in!'}), 500
+
+@route('/api/v1/check-out', methods=['POST'])
+@api_login_required
+def api_check_out():
+    try:
+        data = request.get_json(silent=True) or request.form
+        vehicle = gate.check_out(data.get('plate_number'), current_user, idempotency_key(data))
+        return jsonify({'vehicle': gate.vehicle_payload(vehicle),
+                        'occupancy': gate.occupancy_payload()})
+    except gate.GateError as e:
+        return gate_error_response(e)
+    except Exception as e:
+        logger.error(f"Error during API check-out: {str(e)}")
+        db.session.rollback()
+        return jsonify({'error': 'An error occurred during check-out!'}), 500
+
+@route('/api/v1/batch', methods=['POST'])
+@api_login_required
+def api_batch():
+    # Several gate operations from a kiosk or a reconnecting offline device,
+    # applied in one transaction with a result per item
+    try:
+        data = request.get_json(silent=True) or {}
+        results = gate.apply_batch(data.get('operations'), current_user)
+        return jsonify({'results': results, 'occupancy': gate.occupancy_payload()})
+    except gate.GateError as e:
+        return gate_error_response(e)
+    except Exception as e:
+        logger.error(f"Error applying gate batch: {str(e)}")
+        db.session.rollback()
+        return jsonify({'error': 'An error occurred while applying the batch!'}), 500
+
+@route('/api/v1/vehicles/<plate_number>')
+@api_login_required
+def api_vehicle(plate_number):
+    try:
+        vehicle = gate.find_active(gate.clean_plate(plate_number), current_user)
+        if not vehicle:
+            raise gate.GateError('Vehicle not found or already checked out!', 'not_found')
+        return jsonify({'vehicle': gate.vehicle_payload(vehicle),
+                        'occupancy': gate.occupancy_payload()})
+    except gate.GateError as e:
+        return gate_error_response(e)
+
+@route('/events/occupancy')
+@api_login_required
+def occupancy_events():
+    # Server-Sent Events: occupancy now, then occupancy and the user's own
+    # check-ins and check-outs as they happen. The body is generated after
+    # the request context is gone, so the stream holds no DB connection.
+    try:
+        subscriber = events.subscribe(current_user.id)
+    except events.TooManySubscribers:
+        return jsonify({'error': 'Too many live connections, try again later'}), 503, {'Retry-After': '30'}
+    return Response(events.stream(subscriber, gate.occupancy_payload()),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@route('/api/v1/plates/search')
+@api_login_required
+def api_plate_search():
+    try:
+        limit = min(int(request.args.get('limit', plate_search.SEARCH_LIMIT)), plate_search.SEARCH_MAX_LIMIT)
+    except ValueError:
+        return jsonify({'error': 'limit must be a number', 'code': 'invalid'}), 400
+    query = request.args.get('q', '')
+    matches = plate_search.search(query, current_user, max(limit, 1))
+    return jsonify({
+        'query': plate_search.normalize(query),
+        'matches': [{
+            'id': entry.id,
+            'plate_number': entry.plate_number,
+            'vehicle_type': entry.vehicle_type,
+            'status': entry.status,
+            'match': kind,
+            'distance': distance,
+        } for entry, kind, distance in matches],
+    })
+
+@route('/api/v1/occupancy')
+@api_login_required
+@etags.conditional(('occupancy',))
+def api_occupancy():
+    return jsonify({'occupancy': gate.occupancy_payload()})
+
 # Fix the typo in the report route
-@app.route('/report')
+@route('/report')
 @login_required
 def report():
     try:
         # Get vehicles based on user role
-        if current_user.is_admin:
-            # Admin sees all vehicles with user information
-            vehicles = (Vehicle.query
-                       .join(User, Vehicle.user_id == User.id)
-                       .options(db.joinedload(Vehicle.recorded_by))
-                       .order_by(Vehicle.check_in_time.desc())
-                       .all())
-            logger.info(f"Admin report: Found {len(vehicles)} vehicles")
-        else:
-            # Regular users only see their vehicles
-            vehicles = (Vehicle.query
-                       .filter_by(user_id=current_user.id)  # Fixed userid to user_id
-                       .order_by(Vehicle.check_in_time.desc())
-                       .all())
-            logger.info(f"User report: Found {len(vehicles)} vehicles for user {current_user.username}")
+        # Live sessions plus the archive, merged page by page
+        queries = []
+        for model in (Vehicle, VehicleArchive):
+            if current_user.is_admin:
+                # Admin sees all vehicles with user information
+                query = model.query.options(db.joinedload(model.recorded_by, innerjoin=True))
+            else:
+                # Regular users only see their vehicles
+                query = model.query.filter_by(user_id=current_user.id)  # Fixed userid to user_id
+            queries.append(query.order_by(model.check_in_time.desc(), model.id.desc()))
+
+        # One page at a time, continuing from the cursor of the previous page
+        cursor = request.args.get('cursor')
+        vehicles, next_cursor = paginate(queries, cursor)
+        logger.info(f"Report: showing {len(vehicles)} vehicles for user {current_user.username}")
 
         return render_template('report.html',
                            vehicles=vehicles,
+                           cursor=cursor,
+                           next_cursor=next_cursor,
                            now=datetime.utcnow(),
                            is_admin=current_user.is_admin)
 
@@ -861,95 +884,12 @@ def report():
         flash('Error loading report data', 'error')
         return redirect(url_for('dashboard'))
 
-# Add helper functions for metrics calculation
-def calculate_metrics(vehicles, start_date, end_date):
-    """Calculate various metrics for the report"""
-    try:
-        total_vehicles = len(vehicles)
-        total_handovers = sum(1 for v in vehicles if v.handler_id is not None)
-        active_handovers = sum(1 for v in vehicles if v.handler_id is not None and v.status == 'active')
-
-        # Calculate average duration
-        durations = []
-        for vehicle in vehicles:
-            if vehicle.status == 'completed':
-                duration = (vehicle.check_out_time - vehicle.check_in_time).total_seconds() / 3600
-            else:
-                duration = (datetime.utcnow() - vehicle.check_in_time).total_seconds() / 3600
-            durations.append(duration)
-
-        avg_duration = sum(durations) / len(durations) if durations else 0
-
-        # Calculate space utilization
-        total_spaces = sum(space.total_spaces for space in ParkingSpace.query.all())
-        current_occupied = sum(space.occupied_spaces for space in ParkingSpace.query.all())
-        utilization = (current_occupied / total_spaces * 100) if total_spaces > 0 else 0
-
-        return {
-            'total_vehicles': total_vehicles,
-            'total_handovers': total_handovers,
-            'active_handovers': active_handovers,
-            'avg_duration': round(avg_duration, 1),
-            'utilization': round(utilization, 1)
-        }
-
-    except Exception as e:
-        logger.error(f"Error calculating metrics: {str(e)}")
-        return {
-            'total_vehicles': 0,
-            'total_handovers': 0,
-            'active_handovers': 0,
-            'avg_duration': 0,
-            'utilization': 0
-        }
-
-def calculate_vehicle_distribution(vehicles):
-    """Calculate vehicle type distribution for pie chart"""
-    try:
-        distribution = defaultdict(int)
-        for vehicle in vehicles:
-            distribution[vehicle.vehicle_type.title()] += 1
-
-        return {
-            'labels': list(distribution.keys()),
-            'data': list(distribution.values())
-        }
-    except Exception as e:
-        logger.error(f"Error calculating vehicle distribution: {str(e)}")
-        return {'labels': [], 'data': []}
-
-def calculate_checkins_trend(start_date, end_date):
-    """Calculate daily check-ins trend"""
-    try:
-        dates = []
-        counts = []
-        current_date = start_date
-
-        while current_date < end_date:
-            next_date = current_date + timedelta(days=1)
-            count = Vehicle.query.filter(
-                Vehicle.check_in_time >= current_date,
-                Vehicle.check_in_time < next_date
-            ).count()
-
-            dates.append(current_date.strftime('%Y-%m-%d'))
-            counts.append(count)
-            current_date = next_date
-
-        return {
-            'labels': dates,
-            'data': counts
-        }
-    except Exception as e:
-        logger.error(f"Error calculating check-ins trend: {str(e)}")
-        return {'labels': [], 'data': []}
-
-@app.route('/analytics')
+@route('/analytics')
 @login_required
 def analytics():
     try:
         # Get space utilization data
-        spaces = ParkingSpace.query.all()
+        spaces = occupancy.get_spaces()
         space_labels = [space.vehicle_type.title() for space in spaces]
         space_occupied = [space.occupied_spaces for space in spaces]
         space_total = [space.total_spaces for space in spaces]
@@ -969,87 +909,48 @@ def analytics():
             distribution_labels.append(v_type.title())
             distribution_data.append(count)
 
-        # Get recent activities (check-ins and check-outs)
-        today = datetime.utcnow().date()
-        recent_activities = []
-
-        # Recent check-ins
-        recent_check_ins = Vehicle.query.filter(
-            Vehicle.check_in_time >= today,
-            Vehicle.user_id == current_user.id
-        ).order_by(desc(Vehicle.check_in_time)).limit(10).all()
-
-        for vehicle in recent_check_ins:
-            recent_activities.append({
-                'timestamp': vehicle.formatted_check_in_time(),
-                'type': 'check_in',
-                'vehicle_type': vehicle.vehicle_type,
-                'plate_number': vehicle.plate_number
-            })
-
-        # Recent check-outs
-        recent_check_outs = Vehicle.query.filter(
-            Vehicle.check_out_time >= today,
-            Vehicle.status == 'completed',
-            Vehicle.user_id == current_user.id
-        ).order_by(desc(Vehicle.check_out_time)).limit(10).all()
-
-        for vehicle in recent_check_outs:
-            recent_activities.append({
-                'timestamp': vehicle.formatted_check_out_time(),
-                'type': 'check_out',
-                'vehicle_type': vehicle.vehicle_type,
-                'plate_number': vehicle.plate_number
-            })
-
-        # Sort activities by timestamp
-        recent_activities.sort(key=lambda x: datetime.strptime(x['timestamp'], '%Y-%m-%d %H:%M'), reverse=True)
-        recent_activities = recent_activities[:10]  # Keep only the 10 most recent
-
-        # Calculate daily statistics
+        # Get the 10 most recent check-ins and check-outs in one query,
+        # merged and ordered by the database
+        today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+        recent_check_ins = (db.select(
+                Vehicle.check_in_time.label('timestamp'),
+                db.literal('check_in').label('type'),
+                Vehicle.vehicle_type, Vehicle.plate_number)
+            .where(Vehicle.check_in_time >= today, Vehicle.user_id == current_user.id)
+            .order_by(Vehicle.check_in_time.desc()).limit(10).subquery())
+        recent_check_outs = (db.select(
+                Vehicle.check_out_time.label('timestamp'),
+                db.literal('check_out').label('type'),
+                Vehicle.vehicle_type, Vehicle.plate_number)
+            .where(Vehicle.check_out_time >= today, Vehicle.status == 'completed',
+                   Vehicle.user_id == current_user.id)
+            .order_by(Vehicle.check_out_time.desc()).limit(10).subquery())
+        recent = db.union_all(db.select(recent_check_ins), db.select(recent_check_outs)).subquery()
+
+        recent_activities = [{
+            'timestamp': (row.timestamp + timedelta(hours=3)).strftime('%Y-%m-%d %H:%M'),  # EAT
+            'type': row.type,
+            'vehicle_type': row.vehicle_type,
+            'plate_number': row.plate_number
+        } for row in db.session.execute(
+            db.select(recent).order_by(recent.c.timestamp.desc()).limit(10))]
+
+        # Daily statistics and the peak hour from the hourly rollup
+        today_totals, peak_hour = stats.activity_since(today, user_id=current_user.id)
         daily_stats = {
-            'check_ins': Vehicle.query.filter(
-                Vehicle.check_in_time >= today,
-                Vehicle.user_id == current_user.id
-            ).count(),
-            'check_outs': Vehicle.query.filter(
-                Vehicle.check_out_time >= today,
-                Vehicle.user_id == current_user.id
-            ).count(),
+            'check_ins': today_totals['check_ins'],
+            'check_outs': today_totals['check_outs'],
             'avg_stay_time': '-- hours',  # Placeholder
             'peak_hour': '-- : --'  # Placeholder
         }
 
-        # Calculate average stay time for completed parkings today
-        completed_today = Vehicle.query.filter(
-            Vehicle.status == 'completed',
-            Vehicle.check_out_time >= today,
-            Vehicle.user_id == current_user.id
-        ).all()
-
-        if completed_today:
-            total_duration = sum(
-                (v.check_out_time - v.check_in_time).total_seconds() / 3600
-                for v in completed_today
-            )
-            avg_hours = round(total_duration / len(completed_today), 1)
+        # Average stay time for completed parkings today
+        if today_totals['check_outs']:
+            avg_hours = round(today_totals['dwell_seconds'] / 3600 / today_totals['check_outs'], 1)
             daily_stats['avg_stay_time'] = f"{avg_hours} hours"
 
-        # Find peak hour
-        peak_hour_data = db.session.query(
-            func.date_trunc('hour', Vehicle.check_in_time).label('hour'),
-            func.count(Vehicle.id).label('count')
-        ).filter(
-            Vehicle.check_in_time >= today,
-            Vehicle.user_id == current_user.id
-        ).group_by(
-            'hour'
-        ).order_by(
-            desc('count')
-        ).first()
-
-        if peak_hour_data and peak_hour_data[0]:
-            peak_hour = peak_hour_data[0] + timedelta(hours=3)  # Convert to EAT
+        if peak_hour:
+            peak_hour = peak_hour + timedelta(hours=3)  # Convert to EAT
             daily_stats['peak_hour'] = peak_hour.strftime('%H:00')
 
         return render_template(
@@ -1069,7 +970,7 @@ def analytics():
         return redirect(url_for('dashboard'))
 
 # Add these new routes after the existing vehicle management routes
-@app.route('/handover/<int:vehicle_id>', methods=['GET', 'POST'])
+@route('/handover/<int:vehicle_id>', methods=['GET', 'POST'])
 @login_required
 def handover_vehicle(vehicle_id):
     vehicle = Vehicle.query.get_or_404(vehicle_id)
@@ -1096,10 +997,18 @@ def handover_vehicle(vehicle_id):
             flash('Selected user cannot receive vehicle handovers.', 'error')
             return redirect(url_for('handover_vehicle', vehicle_id=vehicle_id))
 
+        # The rollup counts each vehicle's current handover, as stats.rebuild()
+        # does, so one being replaced comes off the hour it was counted at
+        changes = [(datetime.utcnow(), vehicle.vehicle_type, vehicle.user_id, {'handovers': 1})]
+        if vehicle.handover_time:
+            changes.append((vehicle.handover_time, vehicle.vehicle_type, vehicle.user_id, {'handovers': -1}))
         vehicle.handler_id = handler.id
-        vehicle.handover_time = datetime.utcnow()
+        vehicle.handover_time = changes[0][0]
         vehicle.handover_notes = handover_notes
+        HourlyStat.increment(changes)
         db.session.commit()
+        # The handler can now find the plate in their search results
+        plate_search.invalidate()
 
         flash(f'Vehicle handed over to {handler.username} successfully.', 'success')
         return redirect(url_for('dashboard'))
@@ -1112,17 +1021,21 @@ def handover_vehicle(vehicle_id):
 
     return render_template('handover.html', vehicle=vehicle, users=users)
 
-@app.route('/my-handovers')
+@route('/my-handovers')
 @login_required
 def my_handovers():
     # Get vehicles handed over to current user
-    received_handovers = Vehicle.query.filter(
+    received_handovers = Vehicle.query.options(
+        db.joinedload(Vehicle.recorded_by, innerjoin=True)
+    ).filter(
         Vehicle.handler_id == current_user.id,
         Vehicle.status == 'active'
     ).all()
 
     # Get vehicles user has handed over to others
-    sent_handovers = Vehicle.query.filter(
+    sent_handovers = Vehicle.query.options(
+        db.joinedload(Vehicle.handler, innerjoin=True)
+    ).filter(
         Vehicle.user_id == current_user.id,
         Vehicle.handler_id.isnot(None),
         Vehicle.status == 'active'
@@ -1132,7 +1045,7 @@ def my_handovers():
                        received_handovers=received_handovers,
                        sent_handovers=sent_handovers)
 
-@app.route('/cancel-handover/<int:vehicle_id>', methods=['POST'])
+@route('/cancel-handover/<int:vehicle_id>', methods=['POST'])
 @login_required
 def cancel_handover(vehicle_id):
     vehicle = Vehicle.query.get_or_404(vehicle_id)
@@ -1146,16 +1059,20 @@ def cancel_handover(vehicle_id):
         flash('Only active handovers can be cancelled.', 'error')
         return redirect(url_for('my_handovers'))
 
+    if vehicle.handover_time:
+        HourlyStat.increment([(vehicle.handover_time, vehicle.vehicle_type, vehicle.user_id,
+                               {'handovers': -1})])
     vehicle.handler_id = None
     vehicle.handover_time = None
     vehicle.handover_notes = None
     db.session.commit()
+    plate_search.invalidate()
 
     flash('Handover cancelled successfully.', 'success')
     return redirect(url_for('my_handovers'))
 
 
-@app.route('/admin/users/<int:user_id>/edit', methods=['GET', 'POST'])
+@route('/admin/users/<int:user_id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_user(user_id):
     if not current_user.is_admin:
@@ -1208,6 +1125,9 @@ def edit_user(user_id):
                     user.set_password(new_password)
 
                 db.session.commit()
+                user_cache.invalidate(user.id)
+                # Reports show usernames and emails
+                versions.bump('users')
                 flash('User details updated successfully.', 'success')
                 return redirect(url_for('manage_users'))
 
@@ -1225,4 +1145,4 @@ def edit_user(user_id):
         return redirect(url_for('manage_users'))
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
+    create_app().run(host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,84 @@
+import logging
+from datetime import datetime, timedelta
+from flask import current_app
+import versions
+from models import db, Vehicle, VehicleArchive
+
+logger = logging.getLogger(__name__)
+
+# Defaults for the archive-sessions command
+ARCHIVE_AFTER_DAYS = 90
+ARCHIVE_BATCH_SIZE = 1000
+
+# Longest a worker keeps the archive horizon without reloading; see
+# versions.VersionedCache
+HORIZON_MAX_AGE = 300.0
+
+# Columns copied from vehicle to vehicle_archive, id included
+ARCHIVE_COLUMNS = [column.name for column in VehicleArchive.__table__.columns]
+
+
+def archive_sessions(older_than_days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE):
+    """Move completed sessions checked out before the cutoff to the archive.
+
+    Works in batches of batch_size rows, each copied with one INSERT ...
+    SELECT and removed with one DELETE in its own short transaction, so
+    gate writes are never blocked for long. Returns the number of rows moved.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    source = Vehicle.__table__
+    moved = 0
+    while True:
+        try:
+            ids = db.session.scalars(
+                db.select(Vehicle.id)
+                .where(Vehicle.status == 'completed', Vehicle.check_out_time < cutoff)
+                .order_by(Vehicle.check_out_time, Vehicle.id)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            ).all()
+            if not ids:
+                break
+            db.session.execute(
+                db.insert(VehicleArchive.__table__).from_select(
+                    ARCHIVE_COLUMNS,
+                    db.select(*[source.c[name] for name in ARCHIVE_COLUMNS]).where(source.c.id.in_(ids))
+                )
+            )
+            db.session.execute(db.delete(source).where(source.c.id.in_(ids)))
+            db.session.commit()
+            moved += len(ids)
+            logger.info(f"Archived {moved} sessions so far")
+        except Exception as e:
+            logger.error(f"Error archiving sessions: {str(e)}")
+            db.session.rollback()
+            raise
+
+    if moved:
+        versions.bump('archive')
+    return moved
+
+
+def load_horizon():
+    return db.session.query(db.func.max(VehicleArchive.check_in_time)).scalar()
+
+
+def horizon():
+    """Newest check-in time found in the archive, cached per worker.
+
+    Reports only need the archive when their range starts at or before
+    this time. The archive only changes when archive_sessions() runs, which
+    bumps the shared 'archive' version.
+    """
+    return current_app.extensions['archive'].get('archive', load_horizon)
+
+
+def covers(start_time):
+    """Whether sessions checked in at or after start_time may be archived"""
+    newest = horizon()
+    return newest is not None and (start_time is None or start_time <= newest)
+
+
+def init_app(app):
+    """Give the app its own archive horizon cache"""
+    app.extensions['archive'] = versions.VersionedCache(HORIZON_MAX_AGE)
@@ -0,0 +1,142 @@
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import shutil
+from flask import current_app, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # optional; only gzip variants are built without it
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Fingerprinted copies live in this subdirectory of the static folder
+BUILD_DIR = 'build'
+MANIFEST_NAME = 'assets-manifest.json'
+
+# A year; fingerprinted URLs change whenever the content does
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Text formats worth precompressing; images like PNG are compressed already
+COMPRESSIBLE = {'.css', '.js', '.json', '.svg', '.html', '.txt', '.map', '.webmanifest'}
+
+# Files that reference other assets by /static/ URL; built after the rest
+# so those references can point at the fingerprinted copies
+REWRITTEN = {'.css', '.json', '.webmanifest'}
+
+# Preferred order of precompressed variants: (Accept-Encoding token, suffix)
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+STATIC_URL_PATTERN = re.compile(r'/static/([A-Za-z0-9_./-]+)')
+
+
+def fingerprinted(path, content):
+    root, ext = os.path.splitext(path)
+    return f'{root}.{hashlib.sha256(content).hexdigest()[:12]}{ext}'
+
+
+def build(static_folder):
+    """Write fingerprinted and precompressed copies of every static file.
+
+    css/style.css becomes build/css/style.<hash>.css plus .gz and, when the
+    brotli package is installed, .br variants. The mapping from original to
+    fingerprinted path goes to build/assets-manifest.json, which init_app
+    uses to rewrite url_for('static', ...). Returns the mapping.
+    """
+    build_folder = os.path.join(static_folder, BUILD_DIR)
+    shutil.rmtree(build_folder, ignore_errors=True)
+
+    sources = []
+    for directory, _, files in os.walk(static_folder):
+        if os.path.abspath(directory).startswith(os.path.abspath(build_folder)):
+            continue
+        for name in files:
+            sources.append(os.path.relpath(os.path.join(directory, name), static_folder).replace(os.sep, '/'))
+    sources.sort(key=lambda path: (os.path.splitext(path)[1] in REWRITTEN, path))
+
+    manifest = {}
+    for path in sources:
+        with open(os.path.join(static_folder, path), 'rb') as f:
+            content = f.read()
+        ext = os.path.splitext(path)[1]
+        if ext in REWRITTEN:
+            content = STATIC_URL_PATTERN.sub(
+                lambda match: f'/static/{manifest.get(match.group(1), match.group(1))}',
+                content.decode()).encode()
+
+        target = f'{BUILD_DIR}/{fingerprinted(path, content)}'
+        target_path = os.path.join(static_folder, target)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        with open(target_path, 'wb') as f:
+            f.write(content)
+        if ext in COMPRESSIBLE:
+            with open(target_path + '.gz', 'wb') as f:
+                f.write(gzip.compress(content, compresslevel=9, mtime=0))
+            if brotli:
+                with open(target_path + '.br', 'wb') as f:
+                    f.write(brotli.compress(content, quality=11))
+        manifest[path] = target
+
+    with open(os.path.join(build_folder, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(static_folder):
+    path = os.path.join(static_folder, BUILD_DIR, MANIFEST_NAME)
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.error(f"Error reading asset manifest: {str(e)}")
+        return {}
+
+
+def _static_url_defaults(endpoint, values):
+    # Point url_for('static', filename=...) at the fingerprinted copy
+    manifest = current_app.extensions['assets']
+    if endpoint == 'static' and values.get('filename') in manifest:
+        values['filename'] = manifest[values['filename']]
+
+
+def send_static(filename):
+    """Static view: fingerprinted files get a precompressed variant the
+    client accepts and are cached for a year; anything else is served as
+    before, revalidated on every use."""
+    if not filename.startswith(f'{BUILD_DIR}/'):
+        return current_app.send_static_file(filename)
+
+    static_folder = current_app.static_folder
+    mimetype = mimetypes.guess_type(filename)[0]
+    encoding, served = None, filename
+    for token, suffix in ENCODINGS:
+        if (request.accept_encodings.quality(token) > 0
+                and os.path.isfile(os.path.join(static_folder, filename + suffix))):
+            encoding, served = token, filename + suffix
+            break
+
+    response = send_from_directory(static_folder, served, mimetype=mimetype, etag=True,
+                                   max_age=IMMUTABLE_MAX_AGE, conditional=True)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+        # Would otherwise name the .gz/.br file the body was read from
+        response.headers.pop('Content-Disposition', None)
+    if os.path.splitext(filename)[1] in COMPRESSIBLE:
+        response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def init_app(app):
+    """Serve fingerprinted assets built by `flask build-assets`, if any"""
+    app.extensions['assets'] = load_manifest(app.static_folder)
+    app.url_defaults(_static_url_defaults)
+    app.view_functions['static'] = send_static
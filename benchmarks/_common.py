@@ -0,0 +1,89 @@
+"""Setup shared by the benchmark scripts.
+
+setup_app() points the app at --database-url, or at a throwaway SQLite
+file removed when the script exits, and returns it with the schema and
+default data in place. The remaining helpers create the bench accounts
+and vehicles the scripts drive the gate with.
+"""
+import atexit
+import logging
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+PASSWORD = 'bench'
+
+
+def setup_app(args, config=None, init=True):
+    """App for the run, on args.database_url or a temporary SQLite file.
+
+    Must run before anything imports the app, since the database URL is
+    read from the environment. With init=False the caller runs init_db()
+    itself, e.g. after hooking the engine.
+    """
+    database_url = getattr(args, 'database_url', None)
+    if database_url:
+        os.environ['DATABASE_URL'] = database_url
+    else:
+        fd, tmp_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        atexit.register(os.unlink, tmp_path)
+        os.environ['DATABASE_URL'] = f'sqlite:///{tmp_path}'
+    os.environ.setdefault('SESSION_SECRET', 'benchmark')
+    logging.disable(logging.CRITICAL)
+
+    from app import create_app, init_db
+
+    app = create_app(config)
+    if init:
+        with app.app_context():
+            init_db()
+    return app
+
+
+def bench_user(username='bench_attendant', is_admin=False):
+    """Approved account with PASSWORD, created unless it exists; commits"""
+    from models import db, User
+
+    user = User.query.filter_by(username=username).first()
+    if not user:
+        user = User(username=username, email=f'{username}@chinopark.com',
+                    phone_number='N/A', residence='N/A', guarantor_name='N/A',
+                    guarantor_phone='N/A', guarantor_residence='N/A',
+                    is_admin=is_admin, is_approved=True, is_active=True)
+        user.set_password(PASSWORD)
+        db.session.add(user)
+        db.session.commit()
+    return user
+
+
+def vehicle_fields(plate_number, vehicle_type='car', **fields):
+    """Check-in fields for a bench vehicle; fields override or add columns"""
+    return dict({
+        'vehicle_type': vehicle_type,
+        'plate_number': plate_number,
+        'vehicle_model': 'Toyota',
+        'vehicle_color': 'White',
+        'driver_name': 'Bench Driver',
+        'driver_id_type': 'national_id',
+        'driver_id_number': plate_number,
+        'driver_phone': '+255700000000',
+        'driver_residence': 'Kimara',
+    }, **fields)
+
+
+def seed_vehicles(count, row, batch_size=5000):
+    """Bulk insert count vehicles and commit.
+
+    row(i) returns the vehicle_fields() arguments of the i-th vehicle: its
+    plate_number plus whatever columns differ from the defaults, such as
+    status, check_in_time and user_id.
+    """
+    from models import db, Vehicle
+
+    for start in range(0, count, batch_size):
+        db.session.execute(db.insert(Vehicle), [vehicle_fields(**row(i))
+                                                for i in range(start, min(count, start + batch_size))])
+    db.session.commit()
@@ -0,0 +1,127 @@
+"""Report equivalence and hot table size around the session archive.
+
+Seeds --history completed sessions spread over the last year, captures the
+admin report for the whole year (every API page, the summary, trends for
+every filter shape and the CSV export), runs the archival job and captures
+it again. Fails unless both captures are identical. Also prints the size of
+the vehicle table before and after and times a this-month report, which
+must not touch the archive at all.
+
+Usage:
+    python benchmarks/archive_sessions.py [--database-url URL] [--history 20000]
+        [--days 90]
+
+Without --database-url a throwaway SQLite file is used. The run creates AR*
+plates and archives old sessions, so never point it at production data.
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from _common import bench_user, seed_vehicles, setup_app
+
+FILTERS = [
+    {},
+    {'status': 'completed', 'granularity': 'week'},
+    {'vehicle_type': 'car', 'handover_status': 'handed_over'},
+    {'handover_status': 'not_handed_over', 'granularity': 'hour'},
+]
+
+
+def capture(client, start_date, end_date):
+    """Everything the admin report shows for the range, for every filter"""
+    captured = []
+    for extra in FILTERS:
+        params = dict(extra, date_range='custom', start_date=start_date, end_date=end_date)
+        pages, cursor = [], None
+        while True:
+            response = client.get('/admin/reports/api', query_string=dict(params, cursor=cursor or ''))
+            payload = response.get_json()
+            pages.append(payload)
+            cursor = payload.get('next_cursor')
+            if not cursor:
+                break
+        export = client.get('/admin/reports/export', query_string=params).get_data(as_text=True)
+        captured.append((pages, export))
+    return captured
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='database to run against (default: temporary SQLite file)')
+    parser.add_argument('--history', type=int, default=20000, help='completed sessions to seed')
+    parser.add_argument('--days', type=int, default=90, help='archive sessions checked out before this many days ago')
+    args = parser.parse_args()
+
+    app = setup_app(args)
+
+    from sqlalchemy import event
+    import archive
+    from models import db, Vehicle, VehicleArchive
+
+    random.seed(16)
+    failed = False
+    with app.app_context():
+        user_ids = [bench_user(name).id for name in ('bench_attendant', 'bench_handler')]
+        now = datetime.utcnow()
+
+        def row(i):
+            check_in_time = now - timedelta(minutes=random.randint(60, 60 * 24 * 360))
+            check_out_time = check_in_time + timedelta(minutes=random.randint(5, 600))
+            handed_over = i % 7 == 0
+            return {
+                'plate_number': f'AR{i:06d}', 'vehicle_type': random.choice(['motorcycle', 'bajaj', 'car']),
+                'check_in_time': check_in_time, 'check_out_time': min(check_out_time, now),
+                'status': 'completed', 'user_id': user_ids[0],
+                'handler_id': user_ids[1] if handed_over else None,
+                'handover_time': check_in_time + timedelta(minutes=1) if handed_over else None,
+            }
+
+        seed_vehicles(args.history, row)
+
+    client = app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    today = (now + timedelta(hours=3)).date()
+    start_date = (today - timedelta(days=365)).strftime('%Y-%m-%d')
+    end_date = today.strftime('%Y-%m-%d')
+
+    before = capture(client, start_date, end_date)
+    with app.app_context():
+        hot_before = db.session.query(db.func.count(Vehicle.id)).scalar()
+        started = time.perf_counter()
+        moved = archive.archive_sessions(args.days)
+        elapsed = time.perf_counter() - started
+        hot_after = db.session.query(db.func.count(Vehicle.id)).scalar()
+        archived = db.session.query(db.func.count(VehicleArchive.id)).scalar()
+    print(f'archived {moved} sessions in {elapsed:.2f}s: vehicle {hot_before} -> {hot_after} rows, '
+          f'vehicle_archive {archived} rows')
+    after = capture(client, start_date, end_date)
+
+    for extra, (pages_before, export_before), (pages_after, export_after) in zip(FILTERS, before, after):
+        ok = pages_before == pages_after and export_before == export_after
+        rows_seen = sum(len(page['vehicles']) for page in pages_after)
+        print(f'{"OK  " if ok else "FAIL"} {extra or "all sessions"}: {len(pages_after)} pages, '
+              f'{rows_seen} rows, {len(export_after.splitlines()) - 1} CSV lines')
+        failed = failed or not ok
+
+    # Recent ranges stay on the hot table
+    with app.app_context():
+        statements = []
+        listener = lambda *a: statements.append(a[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        started = time.perf_counter()
+        client.get('/admin/reports/api', query_string={'date_range': 'this_month'})
+        elapsed = time.perf_counter() - started
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    ok = not any('vehicle_archive' in statement for statement in statements)
+    print(f'{"OK  " if ok else "FAIL"} this_month report in {elapsed * 1000:.1f} ms '
+          f'without reading vehicle_archive')
+    failed = failed or not ok
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
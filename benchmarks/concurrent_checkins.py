@@ -0,0 +1,136 @@
+"""Concurrency benchmark for gate check-in/check-out.
+
+Fires many parallel check-ins (more than there is capacity for) followed by
+parallel check-outs through the real Flask routes, then verifies that
+ParkingSpace.occupied_spaces still equals the number of active vehicles and
+never exceeded total_spaces. Finally every vehicle still parked is checked
+out --duplicates times at once, as a double-tapped button or a retried
+request would; exactly one check-out per plate may succeed, and the hourly
+check-out counts must match the sessions actually closed.
+
+Usage:
+    python benchmarks/concurrent_checkins.py [--database-url URL]
+        [--requests 400] [--threads 32] [--capacity 150] [--duplicates 4]
+
+Without --database-url a throwaway SQLite file is used. The run resizes the
+car capacity and creates BN* plates, so never point it at production data.
+"""
+import argparse
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from _common import PASSWORD, bench_user, setup_app, vehicle_fields
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='database to run against (default: temporary SQLite file)')
+    parser.add_argument('--requests', type=int, default=400, help='number of check-ins to fire')
+    parser.add_argument('--threads', type=int, default=32, help='number of concurrent clients')
+    parser.add_argument('--capacity', type=int, default=150, help='car spaces available for the run')
+    parser.add_argument('--duplicates', type=int, default=4, help='concurrent check-outs of each plate')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    app = setup_app(args)
+
+    from models import db, Vehicle, ParkingSpace, HourlyStat
+
+    with app.app_context():
+        Vehicle.query.filter(Vehicle.plate_number.like('BN%')).delete(synchronize_session=False)
+        space = ParkingSpace.query.filter_by(vehicle_type='car').first()
+        space.total_spaces = args.capacity
+        space.occupied_spaces = Vehicle.query.filter_by(vehicle_type='car', status='active').count()
+        baseline = space.occupied_spaces
+        counted_before = db.session.query(db.func.coalesce(db.func.sum(HourlyStat.check_outs), 0)).scalar()
+        db.session.commit()
+        bench_user()
+
+    local = threading.local()
+
+    def client():
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+            local.client.post('/login', data={'username': 'bench_attendant', 'password': PASSWORD})
+        return local.client
+
+    def check_in(i):
+        started = time.perf_counter()
+        client().post('/check-in', data=vehicle_fields(f'BN{i:05d}'))
+        return time.perf_counter() - started
+
+    def check_out(i):
+        started = time.perf_counter()
+        client().post('/check-out', data={'plate_number': f'BN{i:05d}'})
+        return time.perf_counter() - started
+
+    statuses = []
+
+    def duplicate_check_out(i):
+        started = time.perf_counter()
+        response = client().post('/api/v1/check-out', json={'plate_number': f'BN{i:05d}'})
+        statuses.append((i, response.status_code))
+        return time.perf_counter() - started
+
+    def run(label, fn, items):
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            # Warm up one client per thread so logins are not timed
+            list(pool.map(lambda _: client(), range(args.threads)))
+            started = time.perf_counter()
+            latencies = list(pool.map(fn, items))
+            elapsed = time.perf_counter() - started
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(f'{label:<10} {len(items):>6} requests in {elapsed:7.2f}s  '
+              f'{len(items) / elapsed:8.1f} req/s  p99 {p99 * 1000:7.1f} ms')
+
+    def verify(label):
+        with app.app_context():
+            space = ParkingSpace.query.filter_by(vehicle_type='car').first()
+            active = Vehicle.query.filter_by(vehicle_type='car', status='active').count()
+            ok = space.occupied_spaces == active and space.occupied_spaces <= space.total_spaces
+            print(f'{label:<10} occupied_spaces={space.occupied_spaces} active_rows={active} '
+                  f'total={space.total_spaces} -> {"OK" if ok else "DRIFT"}')
+            return ok
+
+    run('check-in', check_in, range(args.requests))
+    ok = verify('after in')
+    with app.app_context():
+        parked = [int(v.plate_number[2:]) for v in
+                  Vehicle.query.filter(Vehicle.plate_number.like('BN%'),
+                                       Vehicle.status == 'active')]
+    run('check-out', check_out, parked[::2])
+    ok = verify('after out') and ok
+    expected = min(args.capacity - baseline, args.requests)
+    print(f'expected {expected} successful check-ins, got {len(parked)}')
+    ok = ok and len(parked) == expected
+
+    with app.app_context():
+        remaining = [int(v.plate_number[2:]) for v in
+                     Vehicle.query.filter(Vehicle.plate_number.like('BN%'),
+                                          Vehicle.status == 'active')]
+    run('dup-out', duplicate_check_out, [i for i in remaining for _ in range(args.duplicates)])
+    ok = verify('after dup') and ok
+    succeeded = [i for i, status in statuses if status == 200]
+    unexpected = [status for _, status in statuses if status not in (200, 404)]
+    once = sorted(succeeded) == sorted(remaining) and not unexpected
+    print(f'dup-out    {len(succeeded)} of {len(statuses)} check-outs succeeded for {len(remaining)} '
+          f'plates -> {"OK" if once else "DOUBLE CHECK-OUT"}')
+    with app.app_context():
+        counted = db.session.query(db.func.coalesce(db.func.sum(HourlyStat.check_outs), 0)).scalar()
+        closed = Vehicle.query.filter(Vehicle.plate_number.like('BN%'),
+                                      Vehicle.status == 'completed').count()
+    counts_ok = counted - counted_before == closed
+    print(f'stats      {counted - counted_before} check-outs counted for {closed} closed sessions '
+          f'-> {"OK" if counts_ok else "DRIFT"}')
+    ok = ok and once and counts_ok
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""Fan-out latency of the live occupancy stream with many idle viewers.
+
+Opens --streams connections to /events/occupancy, then checks vehicles in
+and out through the JSON API and measures how long each occupancy update
+takes to reach every stream. Also times a plain API request while all
+streams are open, to show they do not starve normal requests.
+
+By default the app is served in-process by a threaded WSGI server on a
+throwaway SQLite file, which holds a thread per connection like gunicorn's
+gthread workers. Pass --url (and credentials) to measure a running
+deployment instead, e.g. one started with `gunicorn main:app`.
+
+Usage:
+    python benchmarks/event_stream.py [--streams 300] [--events 20]
+    python benchmarks/event_stream.py --url http://localhost:5000
+        --username admin --password admin123
+
+The run checks GE* plates in and out, so never point it at production data.
+"""
+import argparse
+import http.client
+import json
+import sys
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+from _common import setup_app, vehicle_fields
+
+
+class Stream(threading.Thread):
+    """One EventSource-like client recording when occupancy events arrive"""
+
+    def __init__(self, host, port, cookie):
+        super().__init__(daemon=True)
+        self.connection = http.client.HTTPConnection(host, port, timeout=60)
+        self.connection.request('GET', '/events/occupancy', headers={'Cookie': cookie,
+                                                                      'Accept': 'text/event-stream'})
+        self.response = self.connection.getresponse()
+        self.arrivals = []
+        self.ready = threading.Event()
+
+    def run(self):
+        event = None
+        try:
+            for raw in self.response:
+                line = raw.decode().rstrip('\n')
+                if line.startswith('event: '):
+                    event = line[len('event: '):]
+                elif line.startswith('data: ') and event == 'occupancy':
+                    self.arrivals.append((time.perf_counter(), json.loads(line[len('data: '):])))
+                    self.ready.set()
+        except (OSError, ValueError):
+            pass
+
+
+def request(host, port, method, path, cookie=None, body=None, form=False):
+    connection = http.client.HTTPConnection(host, port, timeout=30)
+    headers = {'Cookie': cookie} if cookie else {}
+    if body is not None:
+        headers['Content-Type'] = 'application/x-www-form-urlencoded' if form else 'application/json'
+        body = urlencode(body) if form else json.dumps(body)
+    connection.request(method, path, body=body, headers=headers)
+    response = connection.getresponse()
+    data = response.read()
+    connection.close()
+    return response, data
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='running deployment to measure (default: serve the app in-process)')
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='admin123')
+    parser.add_argument('--streams', type=int, default=300, help='idle event streams to open')
+    parser.add_argument('--events', type=int, default=20, help='gate actions to fan out')
+    args = parser.parse_args()
+
+    server = None
+    try:
+        if args.url:
+            parts = urlsplit(args.url)
+            host, port = parts.hostname, parts.port or 80
+        else:
+            app = setup_app(args)
+
+            import events
+            from werkzeug.serving import make_server
+            from models import db, ParkingSpace
+
+            events.MAX_SUBSCRIBERS = max(events.MAX_SUBSCRIBERS, args.streams)
+            with app.app_context():
+                space = ParkingSpace.query.filter_by(vehicle_type='motorcycle').first()
+                space.total_spaces = max(space.total_spaces, args.events)
+                db.session.commit()
+            server = make_server('127.0.0.1', 0, app, threaded=True)
+            server.daemon_threads = True
+            host, port = '127.0.0.1', server.server_port
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        response, _ = request(host, port, 'POST', '/login', body={'username': args.username,
+                                                                  'password': args.password}, form=True)
+        cookie = response.getheader('Set-Cookie', '').split(';')[0]
+
+        started = time.perf_counter()
+        streams = [Stream(host, port, cookie) for _ in range(args.streams)]
+        for stream in streams:
+            stream.start()
+        for stream in streams:
+            stream.ready.wait(30)
+        print(f'opened {len(streams)} streams in {time.perf_counter() - started:.2f}s')
+
+        samples = []
+        for _ in range(20):
+            elapsed = time.perf_counter()
+            request(host, port, 'GET', '/api/v1/occupancy', cookie)
+            samples.append(time.perf_counter() - elapsed)
+        print(f'/api/v1/occupancy with streams open: p50 {percentile(samples, 50):.2f} ms, '
+              f'p99 {percentile(samples, 99):.2f} ms')
+
+        delays = []
+        failed = False
+        for i in range(args.events):
+            plate = f'GE{i:05d}'
+            if i % 2 == 0:
+                path, body = '/api/v1/check-in', vehicle_fields(plate, 'motorcycle', vehicle_model='Boxer',
+                                                                vehicle_color='Red')
+            else:
+                path, body = '/api/v1/check-out', {'plate_number': f'GE{i - 1:05d}'}
+            counts = [len(stream.arrivals) for stream in streams]
+            response, data = request(host, port, 'POST', path, cookie, body)
+            if response.status not in (200, 201):
+                print(f'FAIL {path} returned {response.status}: {data[:200]}')
+                failed = True
+                continue
+            expected = json.loads(data)['occupancy']
+            sent = time.perf_counter()
+            deadline = sent + 10
+            for stream, count in zip(streams, counts):
+                while time.perf_counter() < deadline:
+                    arrived = [(at, payload) for at, payload in stream.arrivals[count:] if payload == expected]
+                    if arrived:
+                        delays.append(max(0.0, arrived[0][0] - sent))
+                        break
+                    time.sleep(0.005)
+
+        received = len(delays)
+        wanted = args.events * len(streams)
+        ok = not failed and received == wanted
+        print(f'{"OK  " if ok else "FAIL"} {received}/{wanted} occupancy updates delivered, '
+              f'delay p50 {percentile(delays or [0], 50):.0f} ms, p99 {percentile(delays or [0], 99):.0f} ms')
+    finally:
+        if server:
+            server.shutdown()
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Latency of a gate action through the form routes versus the JSON API.
+
+A form check-in or check-out is a POST, a redirect and a dashboard render,
+which is what a browser does after submitting the form. The API does the
+same action in one request and returns the new occupancy with the result.
+The batch endpoint applies --batch-size actions per request and is timed
+per vehicle, i.e. request time divided by the batch size. Each mode checks
+the same number of vehicles in and out again, and the script prints
+p50/p99 per action and fails if occupancy drifted.
+
+Usage:
+    python benchmarks/gate_api.py [--database-url URL] [--cycles 300]
+        [--batch-size 20]
+
+Without --database-url a throwaway SQLite file is used. The run creates GA*
+plates, so never point it at production data.
+"""
+import argparse
+import sys
+import time
+
+from _common import PASSWORD, bench_user, setup_app, vehicle_fields
+
+
+def check_in_data(plate):
+    return vehicle_fields(plate, 'motorcycle', vehicle_model='Boxer', vehicle_color='Red')
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] * 1000
+
+
+def timed(action):
+    started = time.perf_counter()
+    response = action()
+    return time.perf_counter() - started, response
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='database to run against (default: temporary SQLite file)')
+    parser.add_argument('--cycles', type=int, default=300, help='vehicles checked in and out per mode')
+    parser.add_argument('--batch-size', type=int, default=20, help='operations per batch request')
+    args = parser.parse_args()
+
+    app = setup_app(args)
+
+    from models import db, Vehicle, ParkingSpace
+
+    failed = False
+    with app.app_context():
+        Vehicle.query.filter(Vehicle.plate_number.like('GA%')).delete(synchronize_session=False)
+        space = ParkingSpace.query.filter_by(vehicle_type='motorcycle').first()
+        space.occupied_spaces = Vehicle.query.filter_by(vehicle_type='motorcycle', status='active').count()
+        space.total_spaces = max(space.total_spaces, space.occupied_spaces + args.cycles)
+        baseline = space.occupied_spaces
+        db.session.commit()
+        bench_user()
+
+    client = app.test_client()
+    client.post('/login', data={'username': 'bench_attendant', 'password': PASSWORD})
+
+    modes = {
+        'form': (
+            lambda plate: client.post('/check-in', data=check_in_data(plate), follow_redirects=True),
+            lambda plate: client.post('/check-out', data={'plate_number': plate}, follow_redirects=True),
+            200, 200,
+        ),
+        'api': (
+            lambda plate: client.post('/api/v1/check-in', json=check_in_data(plate)),
+            lambda plate: client.post('/api/v1/check-out', json={'plate_number': plate}),
+            201, 200,
+        ),
+    }
+
+    print(f'{"mode":<6} {"action":<10} {"p50 ms":>8} {"p99 ms":>8}')
+    for index, (mode, (check_in, check_out, in_status, out_status)) in enumerate(modes.items()):
+        plates = [f'GA{index}{i:05d}' for i in range(args.cycles)]
+        for action, call, expected in (('check-in', check_in, in_status),
+                                       ('check-out', check_out, out_status)):
+            samples = []
+            for plate in plates:
+                elapsed, response = timed(lambda: call(plate))
+                if response.status_code != expected:
+                    print(f'FAIL {mode} {action} {plate} returned {response.status_code}')
+                    failed = True
+                samples.append(elapsed)
+            print(f'{mode:<6} {action:<10} {percentile(samples, 50):>8.2f} {percentile(samples, 99):>8.2f}')
+
+    plates = [f'GA{len(modes)}{i:05d}' for i in range(args.cycles)]
+    chunks = [plates[i:i + args.batch_size] for i in range(0, len(plates), args.batch_size)]
+    for action, operation in (('check-in', lambda plate: dict(check_in_data(plate), action='check_in')),
+                              ('check-out', lambda plate: {'action': 'check_out', 'plate_number': plate})):
+        samples = []
+        for chunk in chunks:
+            elapsed, response = timed(lambda: client.post(
+                '/api/v1/batch', json={'operations': [operation(plate) for plate in chunk]}))
+            results = response.get_json().get('results') or []
+            if response.status_code != 200 or any(r['result'] != 'ok' for r in results):
+                print(f'FAIL batch {action} returned {response.status_code}')
+                failed = True
+            samples += [elapsed / len(chunk)] * len(chunk)
+        print(f'{"batch":<6} {action:<10} {percentile(samples, 50):>8.2f} {percentile(samples, 99):>8.2f}')
+
+    with app.app_context():
+        db.session.expire_all()
+        space = ParkingSpace.query.filter_by(vehicle_type='motorcycle').first()
+        active = Vehicle.query.filter_by(vehicle_type='motorcycle', status='active').count()
+        ok = space.occupied_spaces == active == baseline
+        print(f'{"OK  " if ok else "FAIL"} occupied_spaces={space.occupied_spaces} active_rows={active}')
+        failed = failed or not ok
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
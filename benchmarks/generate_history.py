@@ -0,0 +1,251 @@
+"""Synthetic parking history for report and analytics benchmarks.
+
+Bulk-loads --sessions parking sessions spread over the last --days days,
+recorded by --attendants attendant accounts, in batched multi-row INSERTs:
+
+- arrivals follow a daily profile with morning and evening rush hours
+  (EAT), quieter weekends and steady growth over the period;
+- the vehicle type mix and the lognormal dwell time (median and spread)
+  are configurable;
+- a --handover-rate share of sessions is handed to another attendant
+  partway through the stay;
+- sessions whose stay runs past now are left active, the rest completed;
+- plates come from a pool of repeat customers.
+
+Afterwards the hourly statistics rollup is rebuilt, occupancy counters are
+reconciled with the active sessions, and with --archive completed sessions
+older than the archive cutoff move to vehicle_archive, as the nightly
+archive-sessions job would have done.
+
+Usage:
+    python benchmarks/generate_history.py --database-url URL [--sessions 1000000]
+        [--attendants 40] [--days 730] [--vehicle-mix motorcycle=50,bajaj=20,car=30]
+        [--dwell-median 90] [--dwell-sigma 0.9] [--handover-rate 0.05] [--archive]
+
+Adds to whatever the database holds; point it at an empty stand-in
+database, never at production data. Also importable: generate() is used
+by benchmarks/report_queries.py.
+"""
+import argparse
+import math
+import random
+import string
+import time
+from datetime import datetime, timedelta
+
+from _common import setup_app
+
+DEFAULT_VEHICLE_MIX = 'motorcycle=50,bajaj=20,car=30'
+
+# Relative arrivals per EAT hour of the day
+HOURLY_PROFILE = [1, 1, 1, 1, 2, 6, 14, 20, 18, 10, 8, 8,
+                  9, 8, 8, 9, 14, 19, 17, 11, 7, 4, 2, 1]
+WEEKEND_FACTOR = 0.7
+# Traffic at the start of the period relative to the end
+GROWTH_FROM = 0.6
+
+MIN_DWELL = timedelta(minutes=5)
+MAX_DWELL = timedelta(days=3)
+EAT_OFFSET = timedelta(hours=3)
+
+MODELS = {
+    'motorcycle': ['Boxer', 'TVS', 'Haojue', 'Sanlg', 'Kinglion'],
+    'bajaj': ['Bajaj RE', 'TVS King', 'Piaggio Ape'],
+    'car': ['Toyota IST', 'Toyota Corolla', 'Toyota Noah', 'Subaru Forester', 'Nissan X-Trail', 'Suzuki Swift'],
+}
+COLORS = ['White', 'Black', 'Silver', 'Red', 'Blue', 'Grey', 'Green']
+FIRST_NAMES = ['Juma', 'Asha', 'Baraka', 'Neema', 'Hamisi', 'Rehema', 'Musa', 'Zawadi', 'Salim', 'Upendo']
+LAST_NAMES = ['Mwakyusa', 'Kimaro', 'Hassan', 'Mushi', 'Said', 'Mollel', 'Komba', 'Shayo', 'Ally', 'Massawe']
+RESIDENCES = ['Kimara', 'Mbezi', 'Ubungo', 'Sinza', 'Manzese', 'Kinondoni', 'Temeke', 'Ilala', 'Tegeta', 'Goba']
+DRIVER_ID_TYPES = ['national_id', 'voters_id', 'passport', 'drivers_license']
+
+
+def parse_mix(value):
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def daily_counts(sessions, days, end, rng):
+    """Sessions per day, oldest first, shaped by weekends and growth"""
+    weights = []
+    for day in range(days):
+        date = (end + EAT_OFFSET - timedelta(days=days - 1 - day)).date()
+        growth = GROWTH_FROM + (1 - GROWTH_FROM) * day / max(days - 1, 1)
+        weights.append(growth * (WEEKEND_FACTOR if date.weekday() >= 5 else 1.0))
+    total = sum(weights)
+    counts = [int(sessions * weight / total) for weight in weights]
+    for day in rng.choices(range(days), weights, k=sessions - sum(counts)):
+        counts[day] += 1
+    return counts
+
+
+def make_plate(rng):
+    return ('T' + ''.join(rng.choice(string.digits) for _ in range(3))
+            + ''.join(rng.choice(string.ascii_uppercase) for _ in range(3)))
+
+
+def create_attendants(count, rng, prefix='hist'):
+    """Approved attendant accounts; returns (ids, weights) for drawing recorders"""
+    from models import db, User
+
+    users = []
+    password_hash = None
+    for i in range(count):
+        username = f'{prefix}_att_{i:04d}'
+        user = User.query.filter_by(username=username).first()
+        if not user:
+            user = User(username=username, email=f'{username}@history.chinopark.com',
+                        phone_number='+255700000000', residence=rng.choice(RESIDENCES),
+                        guarantor_name='N/A', guarantor_phone='N/A', guarantor_residence='N/A',
+                        is_admin=False, is_approved=True, is_active=True)
+            # Hashing is slow and every account gets the same password
+            if password_hash is None:
+                user.set_password('history')
+                password_hash = user.password_hash
+            user.password_hash = password_hash
+            db.session.add(user)
+        users.append(user)
+    db.session.commit()
+    # Some attendants work many more shifts than others
+    return [user.id for user in users], [rng.uniform(0.3, 1.7) for _ in users]
+
+
+def generate(sessions, attendants=40, days=730, vehicle_mix=None, dwell_median=90.0, dwell_sigma=0.9,
+             handover_rate=0.05, seed=1, batch_size=5000, archive_old=False, progress=None):
+    """Load synthetic history into the current app's database; returns a summary dict"""
+    import archive
+    import reconcile
+    import stats
+    from models import db, Vehicle, ParkingSpace
+
+    rng = random.Random(seed)
+    vehicle_mix = vehicle_mix or parse_mix(DEFAULT_VEHICLE_MIX)
+    vehicle_types, type_weights = zip(*vehicle_mix.items())
+    now = datetime.utcnow().replace(microsecond=0)
+    started = time.perf_counter()
+
+    user_ids, user_weights = create_attendants(attendants, rng)
+    plates = list({make_plate(rng) for _ in range(max(1000, sessions // 15))})
+    active_plates = {vehicle.plate_number for vehicle in Vehicle.query.filter_by(status='active')}
+    log_median = math.log(dwell_median)
+
+    inserted = active = handovers = 0
+    rows = []
+    for day, count in enumerate(daily_counts(sessions, days, now, rng)):
+        # Midnight EAT of the day, in UTC; the last day is today
+        midnight = ((now + EAT_OFFSET).replace(hour=0, minute=0, second=0)
+                    - timedelta(days=days - 1 - day) - EAT_OFFSET)
+        hours = rng.choices(range(24), HOURLY_PROFILE, k=count)
+        hours.sort()
+        for hour in hours:
+            check_in_time = midnight + timedelta(hours=hour, seconds=rng.randrange(3600))
+            if check_in_time > now:
+                # Today's share of arrivals lands in the hours so far
+                check_in_time = midnight + (now - midnight) * rng.random()
+            dwell = timedelta(minutes=rng.lognormvariate(log_median, dwell_sigma))
+            dwell = min(max(dwell, MIN_DWELL), MAX_DWELL)
+            check_out_time = check_in_time + dwell
+            vehicle_type = rng.choices(vehicle_types, type_weights)[0]
+            user_id = rng.choices(user_ids, user_weights)[0]
+            plate = rng.choice(plates)
+
+            still_parked = check_out_time > now
+            if still_parked:
+                # Only one active session per plate
+                while plate in active_plates:
+                    plate = make_plate(rng)
+                active_plates.add(plate)
+
+            handler_id = handover_time = handover_notes = None
+            if len(user_ids) > 1 and rng.random() < handover_rate:
+                handover_time = check_in_time + dwell * rng.uniform(0.2, 0.8)
+                if handover_time <= now:
+                    handler_id = rng.choice([other for other in user_ids if other != user_id])
+                    handover_notes = 'Shift change'
+                    handovers += 1
+                else:
+                    handover_time = None
+
+            rows.append({
+                'plate_number': plate,
+                'vehicle_type': vehicle_type,
+                'vehicle_model': rng.choice(MODELS.get(vehicle_type, MODELS['car'])),
+                'vehicle_color': rng.choice(COLORS),
+                'driver_name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                'driver_id_type': rng.choice(DRIVER_ID_TYPES),
+                'driver_id_number': str(rng.randrange(10 ** 9, 10 ** 10)),
+                'driver_phone': f'+2557{rng.randrange(10 ** 7, 10 ** 8)}',
+                'driver_residence': rng.choice(RESIDENCES),
+                'check_in_time': check_in_time,
+                'check_out_time': None if still_parked else check_out_time,
+                'status': 'active' if still_parked else 'completed',
+                'user_id': user_id,
+                # Check-out clears the handler, as gate.check_out does
+                'handler_id': handler_id if still_parked else None,
+                'handover_time': handover_time,
+                'handover_notes': handover_notes,
+            })
+            active += still_parked
+            if len(rows) >= batch_size:
+                db.session.execute(db.insert(Vehicle), rows)
+                db.session.commit()
+                inserted += len(rows)
+                rows = []
+                if progress:
+                    progress(inserted)
+    if rows:
+        db.session.execute(db.insert(Vehicle), rows)
+        db.session.commit()
+        inserted += len(rows)
+    loaded = time.perf_counter()
+
+    # Room for everything that is still parked, then counters to match
+    for space in ParkingSpace.query:
+        space.total_spaces = max(space.total_spaces, active * 2)
+    db.session.commit()
+    reconcile.reconcile(repair=True)
+    stat_rows = stats.rebuild()
+    archived = archive.archive_sessions(batch_size=max(batch_size, archive.ARCHIVE_BATCH_SIZE)) if archive_old else 0
+
+    return {
+        'sessions': inserted,
+        'active': active,
+        'handovers': handovers,
+        'archived': archived,
+        'hourly_stat_rows': stat_rows,
+        'load_seconds': loaded - started,
+        'total_seconds': time.perf_counter() - started,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', required=True, help='stand-in database to load')
+    parser.add_argument('--sessions', type=int, default=1000000, help='parking sessions to generate')
+    parser.add_argument('--attendants', type=int, default=40, help='attendant accounts recording them')
+    parser.add_argument('--days', type=int, default=730, help='days of history ending now')
+    parser.add_argument('--vehicle-mix', type=parse_mix, default=parse_mix(DEFAULT_VEHICLE_MIX),
+                        help=f'vehicle type weights (default: {DEFAULT_VEHICLE_MIX})')
+    parser.add_argument('--dwell-median', type=float, default=90.0, help='median stay in minutes')
+    parser.add_argument('--dwell-sigma', type=float, default=0.9, help='spread of the lognormal stay')
+    parser.add_argument('--handover-rate', type=float, default=0.05, help='share of sessions handed over')
+    parser.add_argument('--archive', action='store_true', help='archive old sessions after loading')
+    parser.add_argument('--batch-size', type=int, default=5000, help='rows per INSERT')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    app = setup_app(args)
+    with app.app_context():
+        summary = generate(args.sessions, args.attendants, args.days, args.vehicle_mix, args.dwell_median,
+                           args.dwell_sigma, args.handover_rate, args.seed, args.batch_size, args.archive,
+                           progress=lambda rows: print(f'\r{rows} sessions', end='', flush=True))
+    print(f'\rloaded {summary["sessions"]} sessions ({summary["active"]} active, {summary["handovers"]} '
+          f'handed over) in {summary["load_seconds"]:.1f}s; {summary["archived"]} archived, '
+          f'{summary["hourly_stat_rows"]} hourly stat rows; {summary["total_seconds"]:.1f}s in total')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""Consistency and speed check for the hourly statistics rollup.
+
+Drives check-ins, check-outs, batches, handovers, repeated handovers and
+cancelled handovers through the real routes, then verifies that the
+incrementally maintained hourly_stat rows match a full rebuild, that
+init_db() backfills an emptied rollup to the same rows, and that the rollup-backed check-ins trend matches
+the same trend counted from vehicle rows. Finally seeds --history
+completed sessions and times the monthly trend both ways.
+
+Usage:
+    python benchmarks/hourly_stats.py [--database-url URL] [--history 50000]
+
+Without --database-url a throwaway SQLite file is used. The run creates HS*
+plates and rebuilds hourly_stat, so never point it at production data.
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from _common import PASSWORD, bench_user, seed_vehicles, setup_app, vehicle_fields
+
+
+def snapshot(HourlyStat):
+    # Rows whose counters all went back to zero, e.g. after a cancelled
+    # handover, are equivalent to no row at all
+    rows = {(row.hour, row.vehicle_type, row.user_id): tuple(getattr(row, c) for c in HourlyStat.COUNTERS)
+            for row in HourlyStat.query.all()}
+    return {key: values for key, values in rows.items() if any(values)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='database to run against (default: temporary SQLite file)')
+    parser.add_argument('--history', type=int, default=50000, help='completed sessions to seed for timing')
+    args = parser.parse_args()
+
+    app = setup_app(args)
+
+    import stats
+    from app import init_db
+    from models import db, Vehicle, HourlyStat
+    from reports import ReportFilter, calculate_checkins_trend
+
+    class RowFilter(ReportFilter):
+        """Same filters, but always counted from vehicle rows"""
+        needs_rows = True
+
+    random.seed(14)
+    failed = False
+    with app.app_context():
+        user_ids = [bench_user(name).id for name in ('bench_attendant', 'bench_handler')]
+        stats.rebuild()
+
+    client = app.test_client()
+    client.post('/login', data={'username': 'bench_attendant', 'password': PASSWORD})
+
+    # Gate activity through every code path that maintains the rollup
+    plates = [f'HS{i:05d}' for i in range(60)]
+    types = ['motorcycle', 'bajaj', 'car']
+    for i, plate in enumerate(plates[:30]):
+        client.post('/check-in', data=vehicle_fields(plate, types[i % 3]))
+    client.post('/api/v1/batch', json={'operations': [
+        vehicle_fields(plate, types[i % 3], action='check_in') for i, plate in enumerate(plates[30:])
+    ] + [{'action': 'check_out', 'plate_number': plate} for plate in plates[25:35]]})
+    for plate in plates[:10]:
+        client.post('/api/v1/check-out', json={'plate_number': plate})
+    with app.app_context():
+        for vehicle in Vehicle.query.filter(Vehicle.plate_number.in_(plates[40:45]),
+                                            Vehicle.status == 'active'):
+            client.post(f'/handover/{vehicle.id}', data={'handler_username': 'bench_handler',
+                                                         'handover_notes': 'bench'})
+        handed = [vehicle.id for vehicle in Vehicle.query.filter(Vehicle.plate_number.in_(plates[40:45]),
+                                                                 Vehicle.handler_id.isnot(None))]
+    # A handover replaced by another, and cancelled ones
+    for vehicle_id in handed[:2]:
+        client.post(f'/handover/{vehicle_id}', data={'handler_username': 'bench_handler',
+                                                     'handover_notes': 'again'})
+    for vehicle_id in handed[3:]:
+        client.post(f'/cancel-handover/{vehicle_id}')
+
+    with app.app_context():
+        live = snapshot(HourlyStat)
+        stats.rebuild()
+        rebuilt = snapshot(HourlyStat)
+        ok = live == rebuilt
+        counts = [sum(values[i] for values in live.values()) for i in range(3)]
+        print(f'{"OK  " if ok else "FAIL"} incremental rollup matches rebuild '
+              f'({counts[0]} check-ins, {counts[1]} check-outs, {counts[2]} handovers)')
+        failed = failed or not ok
+
+        # An upgraded database has sessions but an empty rollup
+        HourlyStat.query.delete()
+        db.session.commit()
+        init_db()
+        ok = snapshot(HourlyStat) == rebuilt
+        print(f'{"OK  " if ok else "FAIL"} init_db backfills an empty rollup')
+        failed = failed or not ok
+
+        # Seed history straight into the table, as an upgrade would find it
+        now = datetime.utcnow()
+
+        def row(i):
+            check_in_time = now - timedelta(minutes=random.randint(60, 60 * 24 * 30))
+            return {'plate_number': f'HH{i:06d}', 'vehicle_type': random.choice(types),
+                    'check_in_time': check_in_time,
+                    'check_out_time': check_in_time + timedelta(minutes=random.randint(5, 600)),
+                    'status': 'completed', 'user_id': user_ids[i % 2]}
+
+        seed_vehicles(args.history, row)
+        started = time.perf_counter()
+        stats.rebuild()
+        print(f'rebuild of {args.history} sessions took {time.perf_counter() - started:.2f}s')
+
+        for granularity in ('hour', 'day', 'week'):
+            report_filter = ReportFilter.from_args({'date_range': 'custom', 'granularity': granularity,
+                                                    'start_date': (now - timedelta(days=31)).strftime('%Y-%m-%d'),
+                                                    'end_date': now.strftime('%Y-%m-%d')})
+            started = time.perf_counter()
+            rollup = calculate_checkins_trend(report_filter)
+            rollup_time = time.perf_counter() - started
+
+            row_filter = RowFilter(report_filter.date_range, report_filter.vehicle_type,
+                                   report_filter.status, report_filter.handover_status,
+                                   report_filter.start_date, report_filter.end_date, granularity)
+            started = time.perf_counter()
+            raw = calculate_checkins_trend(row_filter)
+            raw_time = time.perf_counter() - started
+
+            ok = rollup == raw
+            print(f'{"OK  " if ok else "FAIL"} {granularity:<5} trend: rollup {rollup_time * 1000:8.1f} ms, '
+                  f'vehicle rows {raw_time * 1000:8.1f} ms ({sum(raw["data"])} check-ins)')
+            failed = failed or not ok
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
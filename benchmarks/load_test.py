@@ -0,0 +1,384 @@
+"""HTTP load test simulating the gate rush hour.
+
+Each of --workers client threads logs in as one of --attendants attendant
+accounts, then loops over a weighted random mix of gate actions over
+keep-alive HTTP connections:
+
+    login       POST /login with a fresh session
+    check_in    POST /api/v1/check-in
+    check_out   POST /api/v1/check-out of a vehicle the attendant parked
+    dashboard   GET /dashboard
+    handover    POST /handover/<id> of a parked vehicle to another attendant
+    report      GET /admin/reports/api as an admin, revalidating with
+                If-None-Match like the reports page does
+
+The run lasts --duration seconds or --requests requests, whichever comes
+first. Every thread draws its actions from its own generator seeded with
+--seed, so runs with the same arguments replay the same workload and
+releases can be compared. Prints throughput and p50/p95/p99 latency per
+action, and with --json writes them to a file for later comparison.
+Finally checks that occupied_spaces still matches the active vehicles.
+
+By default the app is served in-process by a threaded WSGI server on a
+throwaway SQLite file, in WAL mode with a busy timeout so concurrent
+writers queue for SQLite's single write lock rather than fail. Client and server then share one interpreter, so
+the numbers are for comparing releases rather than capacity planning. To
+measure a real deployment, start it (e.g. `gunicorn main:app`) on a
+stand-in database and pass both --url and the same --database-url. The
+harness creates its accounts there directly.
+
+Usage:
+    python benchmarks/load_test.py [--workers 16] [--duration 30] [--seed 1]
+        [--mix check_in=35,check_out=30,dashboard=20,handover=5,report=5,login=5]
+    python benchmarks/load_test.py --url http://localhost:5000
+        --database-url postgresql://localhost/chinopark_load --json results.json
+
+The run creates lt* accounts and L* plates, so never point it at
+production data.
+"""
+import argparse
+import http.client
+import json
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlencode, urlsplit
+
+from _common import setup_app, vehicle_fields
+
+DEFAULT_MIX = 'check_in=35,check_out=30,dashboard=20,handover=5,report=5,login=5'
+VEHICLE_TYPES = (('motorcycle', 50), ('bajaj', 20), ('car', 30))
+PASSWORD = 'loadtest'
+# Seconds an in-process SQLite connection waits for the write lock before
+# giving up with "database is locked"
+SQLITE_BUSY_TIMEOUT = 30
+
+# Statuses that are a normal answer for each action; anything else is an
+# error. A check-in may be refused (409) when a vehicle type is full.
+EXPECTED = {
+    'login': {302},
+    'check_in': {201, 409},
+    'check_out': {200},
+    'dashboard': {200},
+    'handover': {302},
+    'report': {200, 304},
+}
+
+
+def parse_mix(value):
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        if name.strip() not in EXPECTED:
+            raise argparse.ArgumentTypeError(f'unknown action {name!r}; choose from {", ".join(EXPECTED)}')
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+class Session:
+    """A logged-in browser: one keep-alive connection and a session cookie"""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.connection = None
+        self.cookie = None
+
+    def request(self, method, path, body=None, form=False, headers=None):
+        headers = dict(headers or {})
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        if body is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded' if form else 'application/json'
+            body = urlencode(body) if form else json.dumps(body)
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            try:
+                self.connection.request(method, path, body=body, headers=headers)
+                response = self.connection.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                # The server closed an idle keep-alive connection; reconnect once
+                self.connection.close()
+                self.connection = None
+                if attempt:
+                    raise
+        cookie = response.getheader('Set-Cookie')
+        if cookie and cookie.startswith('session='):
+            self.cookie = cookie.split(';')[0]
+        return response, data
+
+    def login(self, username):
+        self.cookie = None
+        return self.request('POST', '/login', {'username': username, 'password': PASSWORD}, form=True)
+
+
+class Client(threading.Thread):
+    """One client thread working through its share of the mix"""
+
+    def __init__(self, index, args, host, port, attendants, admin, stop, budget):
+        super().__init__(daemon=True)
+        self.index = index
+        self.args = args
+        self.budget = budget
+        self.rng = random.Random(f'{args.seed}-{index}')
+        self.username = attendants[index % len(attendants)]
+        self.others = [name for name in attendants if name != self.username]
+        self.admin = admin
+        self.session = Session(host, port)
+        self.admin_session = Session(host, port)
+        self.stop = stop
+        self.parked = []       # (plate, vehicle id) checked in by this thread
+        self.handed = set()    # vehicle ids this thread handed over
+        self.report_etag = None
+        self.plates = 0
+        self.samples = {name: [] for name in EXPECTED}
+        self.errors = {name: 0 for name in EXPECTED}
+        self.refused = {name: 0 for name in EXPECTED}
+        self.actions, self.weights = zip(*args.mix.items())
+
+    def warm_up(self):
+        self.session.login(self.username)
+        if 'report' in self.args.mix:
+            self.admin_session.login(self.admin)
+
+    def run(self):
+        while not self.stop.is_set():
+            action = self.rng.choices(self.actions, self.weights)[0]
+            if action == 'check_out' and not self.parked:
+                action = 'check_in'
+            if action == 'handover' and (not self.others or not self.handable()):
+                action = 'dashboard'
+            started = time.perf_counter()
+            try:
+                status = getattr(self, action)()
+            except (http.client.HTTPException, OSError):
+                status = None
+            elapsed = time.perf_counter() - started
+            if self.stop.is_set() and status is None:
+                break
+            self.samples[action].append(elapsed)
+            if status not in EXPECTED[action]:
+                self.errors[action] += 1
+            elif status == 409:
+                self.refused[action] += 1
+            if not self.budget.take():
+                self.stop.set()
+
+    def handable(self):
+        return [vehicle for vehicle in self.parked if vehicle[1] not in self.handed]
+
+    def login(self):
+        response, _ = self.session.login(self.username)
+        return response.status
+
+    def check_in(self):
+        self.plates += 1
+        plate = f'L{self.index:03d}{self.plates:06d}'
+        vehicle_type = self.rng.choices(*zip(*VEHICLE_TYPES))[0]
+        response, data = self.session.request('POST', '/api/v1/check-in', vehicle_fields(plate, vehicle_type))
+        if response.status == 201:
+            self.parked.append((plate, json.loads(data)['vehicle']['id']))
+        return response.status
+
+    def check_out(self):
+        plate, vehicle_id = self.parked.pop(self.rng.randrange(len(self.parked)))
+        self.handed.discard(vehicle_id)
+        response, _ = self.session.request('POST', '/api/v1/check-out', {'plate_number': plate})
+        return response.status
+
+    def dashboard(self):
+        response, _ = self.session.request('GET', '/dashboard')
+        return response.status
+
+    def handover(self):
+        _, vehicle_id = self.rng.choice(self.handable())
+        response, _ = self.session.request('POST', f'/handover/{vehicle_id}', {
+            'handler_username': self.rng.choice(self.others), 'handover_notes': 'Shift change',
+        }, form=True)
+        self.handed.add(vehicle_id)
+        return response.status
+
+    def report(self):
+        headers = {'If-None-Match': self.report_etag} if self.report_etag else {}
+        response, _ = self.admin_session.request('GET', '/admin/reports/api?date_range=today&limit=50',
+                                                 headers=headers)
+        self.report_etag = response.getheader('ETag') or self.report_etag
+        return response.status
+
+
+class Budget:
+    """Requests left for the whole run; unlimited when total is None"""
+
+    def __init__(self, total):
+        self.remaining = total
+        self.lock = threading.Lock()
+
+    def take(self):
+        """Count one request; False once the budget is used up"""
+        if self.remaining is None:
+            return True
+        with self.lock:
+            self.remaining -= 1
+            return self.remaining > 0
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] * 1000
+
+
+def serialize_sqlite_writers(db):
+    """Make SQLite connections queue for the write lock instead of failing.
+
+    SQLite allows one writer at a time; without a busy timeout a check-in
+    that meets another worker's open write transaction fails at once with
+    "database is locked" and is counted as a 500. WAL mode also stops
+    readers and the writer blocking each other.
+    """
+    from sqlalchemy import event
+
+    def configure(connection, record):
+        cursor = connection.cursor()
+        cursor.execute(f'PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT * 1000}')
+        cursor.execute('PRAGMA journal_mode = WAL')
+        cursor.close()
+
+    event.listen(db.engine, 'connect', configure)
+    db.engine.dispose()  # connections opened before the listener miss it
+
+
+def setup(app, args):
+    """Create the accounts and capacity for the run; returns attendant usernames"""
+    from app import init_db
+    from models import db, User, ParkingSpace
+
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite' and not args.url:
+            serialize_sqlite_writers(db)
+        init_db()
+        usernames = [f'lt{args.seed}_{i:03d}' for i in range(args.attendants)]
+        existing = {user.username for user in User.query.filter(User.username.in_(usernames + ['lt_admin']))}
+        for username in usernames + ['lt_admin']:
+            if username in existing:
+                continue
+            user = User(username=username, email=f'{username}@load.chinopark.com',
+                        phone_number='N/A', residence='N/A', guarantor_name='N/A',
+                        guarantor_phone='N/A', guarantor_residence='N/A',
+                        is_admin=username == 'lt_admin', is_approved=True, is_active=True)
+            user.set_password(PASSWORD)
+            db.session.add(user)
+        for space in ParkingSpace.query:
+            space.total_spaces = max(space.total_spaces, (space.occupied_spaces or 0) + args.capacity)
+        db.session.commit()
+    return usernames
+
+
+def check_occupancy(app):
+    from models import ParkingSpace
+    from reconcile import active_counts
+
+    with app.app_context():
+        actual = active_counts()
+        recorded = {space.vehicle_type: space.occupied_spaces or 0 for space in ParkingSpace.query}
+    return all(recorded[vehicle_type] == actual.get(vehicle_type, 0) for vehicle_type in recorded), recorded, actual
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='running deployment to load (needs --database-url of its database)')
+    parser.add_argument('--database-url', help='database to run against (default: temporary SQLite file)')
+    parser.add_argument('--workers', type=int, default=16, help='concurrent client threads')
+    parser.add_argument('--attendants', type=int, default=8, help='attendant accounts shared by the workers')
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds to run')
+    parser.add_argument('--requests', type=int, help='stop after this many requests in total')
+    parser.add_argument('--capacity', type=int, default=5000, help='spaces added per vehicle type')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f'action weights (default: {DEFAULT_MIX})')
+    parser.add_argument('--seed', type=int, default=1, help='seed for the action sequence of every worker')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+    if args.url and not args.database_url:
+        parser.error('--url needs --database-url pointing at the database of that deployment')
+    args.attendants = max(args.attendants, 2 if 'handover' in args.mix else 1)
+
+    server = None
+    # setup() runs init_db() once SQLite is configured
+    app = setup_app(args, init=False)
+    failed = False
+    try:
+        attendants = setup(app, args)
+        if args.url:
+            parts = urlsplit(args.url)
+            host, port = parts.hostname, parts.port or 80
+        else:
+            from werkzeug.serving import make_server
+            server = make_server('127.0.0.1', 0, app, threaded=True)
+            server.daemon_threads = True
+            host, port = '127.0.0.1', server.server_port
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        stop = threading.Event()
+        budget = Budget(args.requests)
+        clients = [Client(i, args, host, port, attendants, 'lt_admin', stop, budget)
+                   for i in range(args.workers)]
+        for client in clients:
+            client.warm_up()
+
+        started = time.perf_counter()
+        for client in clients:
+            client.start()
+        stop.wait(args.duration)
+        stop.set()
+        for client in clients:
+            client.join(60)
+        elapsed = time.perf_counter() - started
+
+        results = {}
+        print(f'{"action":<10} {"requests":>9} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} '
+              f'{"p99 ms":>8} {"refused":>8} {"errors":>7}')
+        for action in EXPECTED:
+            samples = [sample for client in clients for sample in client.samples[action]]
+            if not samples:
+                continue
+            errors = sum(client.errors[action] for client in clients)
+            refused = sum(client.refused[action] for client in clients)
+            results[action] = {
+                'requests': len(samples), 'per_second': len(samples) / elapsed,
+                'p50_ms': percentile(samples, 50), 'p95_ms': percentile(samples, 95),
+                'p99_ms': percentile(samples, 99), 'refused': refused, 'errors': errors,
+            }
+            row = results[action]
+            print(f'{action:<10} {row["requests"]:>9} {row["per_second"]:>8.1f} {row["p50_ms"]:>8.2f} '
+                  f'{row["p95_ms"]:>8.2f} {row["p99_ms"]:>8.2f} {refused:>8} {errors:>7}')
+            failed = failed or errors > 0
+        total = sum(row['requests'] for row in results.values())
+        print(f'{"total":<10} {total:>9} {total / elapsed:>8.1f}  over {elapsed:.1f}s with {args.workers} workers')
+
+        consistent, recorded, actual = check_occupancy(app)
+        print(f'{"OK  " if consistent else "FAIL"} occupied_spaces {recorded} match active vehicles {actual}')
+        failed = failed or not consistent
+
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump({
+                    'recorded_at': datetime.utcnow().isoformat() + 'Z',
+                    'target': args.url or 'in-process',
+                    'workers': args.workers, 'attendants': args.attendants, 'seed': args.seed,
+                    'mix': args.mix, 'duration_s': elapsed, 'total_requests': total,
+                    'per_second': total / elapsed, 'actions': results,
+                    'occupancy_consistent': consistent,
+                }, f, indent=2)
+            print(f'results written to {args.json}')
+    finally:
+        if server:
+            server.shutdown()
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""Idempotent replay of offline gate queues.
+
+Builds a queue of --operations keyed check-ins and check-outs, as the
+service worker stores them while a gate is offline, then replays it through
+/api/v1/batch from --threads clients at once, --rounds times over, as
+devices do when retries overlap. Checks that every operation took effect
+exactly once: occupied_spaces, the number of vehicle rows and the vehicle
+ids reported by every replay must all match a single application. Also
+times fresh batches against fully replayed ones and single check-ins with
+and without an Idempotency-Key, to show the dedupe costs little.
+
+Usage:
+    python benchmarks/offline_replay.py [--database-url URL]
+        [--operations 150] [--threads 8] [--rounds 3]
+
+Without --database-url a throwaway SQLite file is used. The run resizes the
+car capacity and creates OQ* plates, so never point it at production data.
+"""
+import argparse
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from _common import PASSWORD, bench_user, setup_app, vehicle_fields
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='database to run against (default: temporary SQLite file)')
+    parser.add_argument('--operations', type=int, default=150, help='queued operations to replay')
+    parser.add_argument('--threads', type=int, default=8, help='clients replaying the queue at once')
+    parser.add_argument('--rounds', type=int, default=3, help='times each client replays the queue')
+    args = parser.parse_args()
+
+    app = setup_app(args)
+
+    import gate
+    from models import db, Vehicle, ParkingSpace
+
+    with app.app_context():
+        space = ParkingSpace.query.filter_by(vehicle_type='car').first()
+        space.total_spaces = max(space.total_spaces, space.occupied_spaces + args.operations + 1000)
+        db.session.commit()
+        bench_user()
+
+    def counts():
+        with app.app_context():
+            occupied = ParkingSpace.query.filter_by(vehicle_type='car').first().occupied_spaces
+            return occupied, Vehicle.query.count()
+
+    local = threading.local()
+
+    def client():
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+            local.client.post('/login', data={'username': 'bench_attendant', 'password': PASSWORD})
+        return local.client
+
+    # Every third vehicle leaves again before the gate is back online
+    run = uuid.uuid4().hex[:4].upper()
+    queue = []
+    for i in range(args.operations):
+        plate = f'OQ{run}{i:04d}'
+        queue.append(dict(vehicle_fields(plate), action='check_in', idempotency_key=uuid.uuid4().hex))
+        if i % 3 == 0:
+            queue.append({'action': 'check_out', 'plate_number': plate, 'idempotency_key': uuid.uuid4().hex})
+    queue = queue[:args.operations]
+    batches = [queue[start:start + gate.BATCH_MAX_ITEMS] for start in range(0, len(queue), gate.BATCH_MAX_ITEMS)]
+    expected_in = sum(op['action'] == 'check_in' for op in queue)
+    expected_out = sum(op['action'] == 'check_out' for op in queue)
+
+    def replay(_):
+        outcomes = []
+        for _ in range(args.rounds):
+            for batch in batches:
+                response = client().post('/api/v1/batch', json={'operations': batch})
+                if response.status_code != 200:
+                    outcomes.append(('error', response.status_code))
+                    continue
+                outcomes += [(result['result'], result.get('vehicle_id')) for result in response.get_json()['results']]
+        return outcomes
+
+    failed = False
+    occupied_before, rows_before = counts()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        replays = list(pool.map(replay, range(args.threads)))
+    elapsed = time.perf_counter() - started
+    occupied, rows = counts()
+
+    first = replays[0][:len(queue)]
+    consistent = all(outcome == first for outcomes in replays
+                     for outcome in (outcomes[i:i + len(queue)] for i in range(0, len(outcomes), len(queue))))
+    all_ok = all(result == 'ok' for result, _ in first)
+    ok = (occupied - occupied_before == expected_in - expected_out
+          and rows - rows_before == expected_in and consistent and all_ok)
+    print(f'{args.threads} clients x {args.rounds} replays of {len(queue)} operations in {elapsed:.2f}s')
+    print(f'{"OK  " if ok else "FAIL"} occupied +{occupied - occupied_before} '
+          f'(expected +{expected_in - expected_out}), vehicle rows +{rows - rows_before} '
+          f'(expected +{expected_in}), replays {"agree" if consistent else "DISAGREE"}')
+    failed = not ok
+
+    # Cost of the dedupe: fresh batches against fully replayed ones
+    samples = {'fresh batch': [], 'replayed batch': []}
+    for i in range(20):
+        fresh = [dict(vehicle_fields(f'OF{run}{i:02d}{j:02d}'), action='check_in',
+                      idempotency_key=uuid.uuid4().hex) for j in range(20)]
+        for label in ('fresh batch', 'replayed batch'):
+            started = time.perf_counter()
+            client().post('/api/v1/batch', json={'operations': fresh})
+            samples[label].append(time.perf_counter() - started)
+    samples['check-in'], samples['check-in with key'] = [], []
+    for i in range(100):
+        for label, headers in (('check-in', {}), ('check-in with key', {'Idempotency-Key': uuid.uuid4().hex})):
+            plate = f'OS{run}{i:03d}{len(headers)}'
+            started = time.perf_counter()
+            client().post('/api/v1/check-in', json=vehicle_fields(plate), headers=headers)
+            samples[label].append(time.perf_counter() - started)
+    print(f'{"request":<18} {"p50 ms":>8} {"p99 ms":>8}')
+    for label, values in samples.items():
+        print(f'{label:<18} {percentile(values, 50):>8.2f} {percentile(values, 99):>8.2f}')
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""Latency and ranking of the plate search endpoint.
+
+Seeds --active parked vehicles and --recent sessions completed within the
+search window, then times exact, prefix and mistyped queries through
+/api/v1/plates/search and checks that the intended plate ranks first, or
+in the top three for mistyped queries. Finally checks that a check-in
+and check-out through the API show up in the next search without a full
+reload, and that an overlong query is answered at once.
+
+Usage:
+    python benchmarks/plate_search.py [--database-url URL] [--active 2000]
+        [--recent 20000] [--queries 500]
+
+Without --database-url a throwaway SQLite file is used. The run creates
+T*/PS* plates, so never point it at production data.
+"""
+import argparse
+import random
+import string
+import sys
+import time
+from datetime import datetime, timedelta
+
+from _common import PASSWORD, bench_user, seed_vehicles, setup_app, vehicle_fields
+
+
+def make_plates(count, rng):
+    """Unique Tanzanian-style plates: T, three digits, three letters"""
+    plates = set()
+    while len(plates) < count:
+        plates.add('T' + ''.join(rng.choice(string.digits) for _ in range(3))
+                   + ''.join(rng.choice(string.ascii_uppercase) for _ in range(3)))
+    return sorted(plates)
+
+
+def mistype(plate, rng):
+    """plate with one character substituted, dropped or swapped"""
+    position = rng.randrange(1, len(plate) - 1)
+    kind = rng.choice(('substitute', 'drop', 'swap'))
+    if kind == 'substitute':
+        return plate[:position] + rng.choice(string.ascii_uppercase) + plate[position + 1:]
+    if kind == 'drop':
+        return plate[:position] + plate[position + 1:]
+    return plate[:position] + plate[position + 1] + plate[position] + plate[position + 2:]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='database to run against (default: temporary SQLite file)')
+    parser.add_argument('--active', type=int, default=2000, help='parked vehicles to seed')
+    parser.add_argument('--recent', type=int, default=20000, help='recently completed sessions to seed')
+    parser.add_argument('--queries', type=int, default=500, help='timed queries per kind')
+    args = parser.parse_args()
+
+    app = setup_app(args)
+
+    from models import db, ParkingSpace
+
+    rng = random.Random(18)
+    failed = False
+    with app.app_context():
+        attendant = bench_user()
+
+        now = datetime.utcnow()
+        plates = make_plates(args.active + args.recent, rng)
+        rng.shuffle(plates)
+
+        def row(i):
+            active = i < args.active
+            check_in_time = now - timedelta(minutes=rng.randint(10, 60 * 40))
+            return {
+                'plate_number': plates[i], 'check_in_time': check_in_time,
+                'check_out_time': None if active else min(check_in_time + timedelta(minutes=30), now),
+                'status': 'active' if active else 'completed', 'user_id': attendant.id,
+            }
+
+        seed_vehicles(len(plates), row)
+        space = ParkingSpace.query.filter_by(vehicle_type='car').first()
+        space.total_spaces = args.active + 10
+        space.occupied_spaces = args.active
+        db.session.commit()
+
+    client = app.test_client()
+    client.post('/login', data={'username': 'bench_attendant', 'password': PASSWORD})
+
+    def search(query):
+        started = time.perf_counter()
+        response = client.get('/api/v1/plates/search', query_string={'q': query})
+        return time.perf_counter() - started, response.get_json()['matches']
+
+    search('T')  # first search loads the index
+    active_plates = plates[:args.active]
+    kinds = {
+        'exact': lambda plate: plate.lower(),
+        'prefix': lambda plate: plate[:5],
+        'mistyped': lambda plate: mistype(plate, rng),
+    }
+    print(f'{"query":<9} {"p50 ms":>8} {"p99 ms":>8} {"found":>7}')
+    for kind, make_query in kinds.items():
+        samples, hits = [], 0
+        for _ in range(args.queries):
+            plate = rng.choice(active_plates)
+            elapsed, matches = search(make_query(plate))
+            samples.append(elapsed)
+            if kind == 'prefix':
+                hits += any(match['plate_number'] == plate for match in matches) or len(matches) == 10
+            elif kind == 'mistyped':
+                hits += any(match['plate_number'] == plate for match in matches[:3])
+            else:
+                hits += bool(matches) and matches[0]['plate_number'] == plate
+        rate = hits / args.queries
+        print(f'{kind:<9} {percentile(samples, 50):>8.2f} {percentile(samples, 99):>8.2f} {rate:>7.1%}')
+        # A mistake can land next to other real plates, so mistyped
+        # queries only need the intended plate in the top three
+        if rate < (0.95 if kind == 'mistyped' else 1.0):
+            print(f'FAIL {kind} queries found the intended plate only {rate:.1%} of the time')
+            failed = True
+
+    # Incremental updates from gate writes
+    loads = app.extensions['metrics'].counters['plate_index_loads_total']
+    plate = 'PS00001'
+    client.post('/api/v1/check-in', json=vehicle_fields(plate))
+    _, matches = search('PS0O001')
+    ok = bool(matches) and matches[0]['plate_number'] == plate and matches[0]['status'] == 'active'
+    client.post('/api/v1/check-out', json={'plate_number': plate})
+    _, matches = search(plate)
+    ok = ok and bool(matches) and matches[0]['status'] == 'completed'
+    ok = ok and app.extensions['metrics'].counters['plate_index_loads_total'] == loads
+    print(f'{"OK  " if ok else "FAIL"} check-in and check-out are visible to the next search')
+    failed = failed or not ok
+
+    # Queries longer than any plate are refused before any fuzzy work
+    elapsed, matches = search('T123ABC' * 60)
+    ok = not matches and elapsed < 0.05
+    print(f'{"OK  " if ok else "FAIL"} a 420 character query returns nothing in {elapsed * 1000:.1f} ms')
+    failed = failed or not ok
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Per-endpoint SQL query budget check.
+
+Seeds enough vehicles, handovers and users that an N+1 relationship load
+would show up as dozens of extra statements, requests each listing
+endpoint, and fails if any of them issues more queries than its budget.
+Conditional requests carrying a current ETag must be answered with 304
+without any SQL.
+
+Usage:
+    python benchmarks/query_counts.py [--database-url URL] [--vehicles 60]
+
+Without --database-url a throwaway SQLite file is used.
+"""
+import argparse
+import sys
+from datetime import datetime, timedelta
+
+from _common import PASSWORD, bench_user, seed_vehicles, setup_app
+
+# (login, path, maximum number of SQL statements for the request)
+BUDGETS = [
+    ('attendant', '/dashboard', 3),
+    ('attendant', '/analytics', 4),
+    ('attendant', '/report', 2),
+    ('attendant', '/my-handovers', 3),
+    ('handler', '/my-handovers', 4),
+    ('admin', '/admin', 4),
+    ('admin', '/report', 2),
+    ('admin', '/admin/reports?date_range=this_month', 5),
+    ('admin', '/admin/reports/api?date_range=this_month', 5),
+    ('admin', '/admin/reports/export?date_range=this_month', 2),
+]
+
+# (login, path) answered with 304 and no SQL at all when the client sends
+# back the ETag of the previous response
+CONDITIONAL = [
+    ('admin', '/admin/reports/api?date_range=this_month'),
+    ('admin', '/admin/reports/api?date_range=today&limit=20'),
+    ('attendant', '/api/v1/occupancy'),
+]
+
+PASSWORDS = {'admin': 'admin123', 'attendant': PASSWORD, 'handler': PASSWORD}
+
+
+def seed(count):
+    usernames = ['bench_attendant', 'bench_handler'] + [f'bench_user{i:02d}' for i in range(20)]
+    users = {username: bench_user(username).id for username in usernames}
+
+    # Spread recorders and handlers over many users so that lazy loading
+    # would cost a query per distinct user instead of hitting the identity map
+    recorders = [users['bench_attendant']] + [users[name] for name in usernames[2:]]
+    handlers = [users['bench_handler']] + [users[name] for name in reversed(usernames[2:])]
+
+    now = datetime.utcnow()
+
+    def row(i):
+        active = i % 2 == 0
+        handed_over = active and i % 4 == 0
+        return {
+            'plate_number': f'QC{i:05d}', 'vehicle_type': ('car', 'bajaj', 'motorcycle')[i % 3],
+            'check_in_time': now - timedelta(minutes=i + 5),
+            'check_out_time': None if active else now - timedelta(minutes=1),
+            'status': 'active' if active else 'completed',
+            'user_id': recorders[0] if i % 3 == 0 else recorders[i % len(recorders)],
+            'handler_id': handlers[i % len(handlers)] if handed_over else None,
+            'handover_time': now if handed_over else None,
+        }
+
+    seed_vehicles(count, row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='database to run against (default: temporary SQLite file)')
+    parser.add_argument('--vehicles', type=int, default=60, help='vehicles to seed')
+    args = parser.parse_args()
+
+    app = setup_app(args)
+
+    from sqlalchemy import event
+    from models import db
+
+    statements = []
+    failures = 0
+    with app.app_context():
+        seed(args.vehicles)
+        event.listen(db.engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, *rest: statements.append(statement))
+
+    clients = {}
+    for login, password in PASSWORDS.items():
+        username = login if login == 'admin' else f'bench_{login}'
+        clients[login] = app.test_client()
+        clients[login].post('/login', data={'username': username, 'password': password})
+
+    for login, path, budget in BUDGETS:
+        statements.clear()
+        response = clients[login].get(path)
+        response.get_data()  # drain streamed responses
+        ok = response.status_code == 200 and len(statements) <= budget
+        print(f'{"OK  " if ok else "FAIL"} {login:<10} {path:<48} '
+              f'{len(statements):>3} queries (budget {budget}, status {response.status_code})')
+        failures += not ok
+
+    for login, path in CONDITIONAL:
+        etag = clients[login].get(path).headers.get('ETag')
+        statements.clear()
+        response = clients[login].get(path, headers={'If-None-Match': etag or ''})
+        ok = response.status_code == 304 and not statements
+        print(f'{"OK  " if ok else "FAIL"} {login:<10} {path:<48} '
+              f'{len(statements):>3} queries (If-None-Match, status {response.status_code})')
+        failures += not ok
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
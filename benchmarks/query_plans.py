@@ -0,0 +1,141 @@
+"""Query-plan check for the hot query shapes in app.py.
+
+Runs EXPLAIN for each query the gate, dashboards and reports issue and fails
+if any of them falls back to a full scan of a table: the vehicle table, the
+archive for the report pages that may read it, or gate_operation for the
+idempotency key lookup. The archive batch query must also come back in
+index order, with no sort step and no index on status alone. On Postgres,
+sequential scans are disabled for the session so the check reflects whether
+an index *can* serve the query, independent of table size.
+
+Usage:
+    python benchmarks/query_plans.py [--database-url URL]
+
+Without --database-url a throwaway SQLite file is used.
+"""
+import argparse
+import re
+import sys
+from datetime import datetime
+
+from _common import setup_app
+
+
+def recent_activity(Vehicle, db, today):
+    check_ins = (db.select(Vehicle.check_in_time.label('timestamp'), Vehicle.plate_number)
+                 .where(Vehicle.check_in_time >= today, Vehicle.user_id == 1)
+                 .order_by(Vehicle.check_in_time.desc()).limit(10).subquery())
+    check_outs = (db.select(Vehicle.check_out_time.label('timestamp'), Vehicle.plate_number)
+                  .where(Vehicle.check_out_time >= today, Vehicle.status == 'completed', Vehicle.user_id == 1)
+                  .order_by(Vehicle.check_out_time.desc()).limit(10).subquery())
+    recent = db.union_all(db.select(check_ins), db.select(check_outs)).subquery()
+    return db.select(recent).order_by(recent.c.timestamp.desc()).limit(10)
+
+
+def hot_queries(Vehicle, VehicleArchive, GateOperation, db):
+    """(name, query) pairs mirroring the filters used in app.py"""
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    return [
+        ('check_out lookup', Vehicle.query.filter(
+            Vehicle.plate_number == 'T123ABC',
+            Vehicle.status == 'active'
+        ).filter((Vehicle.user_id == 1) | (Vehicle.handler_id == 1))),
+        ('active plate conflict', Vehicle.query.filter_by(plate_number='T123ABC', status='active')),
+        ('admin active count', db.session.query(db.func.count(Vehicle.id)).filter(Vehicle.status == 'active')),
+        ('analytics recent activity', recent_activity(Vehicle, db, today)),
+        ('reconcile active counts', db.session.query(
+            Vehicle.vehicle_type, db.func.count(Vehicle.id)
+        ).filter(Vehicle.status == 'active').group_by(Vehicle.vehicle_type)),
+        ('analytics active distribution', db.session.query(
+            Vehicle.vehicle_type, db.func.count(Vehicle.id)
+        ).filter(Vehicle.status == 'active', Vehicle.user_id == 1).group_by(Vehicle.vehicle_type)),
+        ('received handovers', Vehicle.query.filter(Vehicle.handler_id == 1, Vehicle.status == 'active')),
+        ('sent handovers', Vehicle.query.filter(
+            Vehicle.user_id == 1, Vehicle.handler_id.isnot(None), Vehicle.status == 'active')),
+        ('plate index load', db.session.query(Vehicle.id, Vehicle.plate_number).filter(
+            (Vehicle.status == 'active') | (Vehicle.check_out_time >= today))),
+        ('plate index sync', db.session.query(Vehicle.id, Vehicle.plate_number).filter(
+            (Vehicle.check_in_time >= today) | (Vehicle.check_out_time >= today))),
+        ('idempotency key lookup', GateOperation.query.filter_by(user_id=1, idempotency_key='k')),
+        ('idempotency batch lookup', GateOperation.query.filter(
+            GateOperation.user_id == 1, GateOperation.idempotency_key.in_(['k1', 'k2']))),
+        ('archive candidates', db.session.query(Vehicle.id).filter(
+            Vehicle.status == 'completed', Vehicle.check_out_time < today
+        ).order_by(Vehicle.check_out_time, Vehicle.id).limit(1000)),
+    ] + [entry for model in (Vehicle, VehicleArchive) for entry in report_pages(model, db, today)]
+
+
+def report_pages(model, db, today):
+    """Report page queries, run against the vehicle and archive tables alike"""
+    prefix = 'archive ' if model.__tablename__ == 'vehicle_archive' else ''
+    return [
+        (f'{prefix}user report page', model.query.filter(
+            model.user_id == 1,
+            db.tuple_(model.check_in_time, model.id) < db.tuple_(datetime(2100, 1, 1), 1000)
+        ).order_by(model.check_in_time.desc(), model.id.desc()).limit(51)),
+        (f'{prefix}admin report range page', model.query.filter(
+            model.check_in_time >= today, model.check_in_time < datetime(2100, 1, 1),
+            db.tuple_(model.check_in_time, model.id) < db.tuple_(datetime(2100, 1, 1), 1000)
+        ).order_by(model.check_in_time.desc(), model.id.desc()).limit(51)),
+    ]
+
+
+# Queries with a LIMIT that must be read in index order: a sort step, or an
+# index that only narrows on status, means every candidate row is read and
+# sorted before the first batch comes back
+ORDERED_QUERIES = {'archive candidates'}
+
+
+def explain(db, query, ordered=False):
+    dialect = db.engine.dialect
+    tables = set(db.metadata.tables)
+    statement = getattr(query, 'statement', query)
+    sql = str(statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+    if dialect.name == 'postgresql':
+        rows = db.session.execute(db.text(f'EXPLAIN {sql}')).all()
+        plan = '\n'.join(row[0] for row in rows)
+        scanned = re.findall(r'Seq Scan on (\w+)', plan)
+        unordered = re.search(r'^\s*(->\s*)?(Incremental )?Sort\b', plan, re.MULTILINE)
+        status_only = re.search(r"Index Cond: \(+status = '\w+'(::\w+)?\)+$", plan, re.MULTILINE)
+    else:
+        rows = db.session.execute(db.text(f'EXPLAIN QUERY PLAN {sql}')).all()
+        plan = '\n'.join(row[-1] for row in rows)
+        # "SCAN vehicle" (with or without USING INDEX) walks every row; only
+        # SEARCH means the index narrowed the lookup
+        scanned = re.findall(r'^\s*SCAN (\w+)', plan, re.MULTILINE)
+        unordered = 'USE TEMP B-TREE' in plan
+        status_only = re.search(r'\(status=\?\)', plan)
+    # Scans of subqueries are fine; only whole tables count
+    ok = not tables.intersection(scanned)
+    if ordered:
+        ok = ok and not unordered and not status_only
+    return ok, plan
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='database to check (default: temporary SQLite file)')
+    parser.add_argument('--verbose', action='store_true', help='print every plan, not just failures')
+    args = parser.parse_args()
+
+    app = setup_app(args)
+
+    from models import db, Vehicle, VehicleArchive, GateOperation
+
+    failures = 0
+    with app.app_context():
+        if db.engine.dialect.name == 'postgresql':
+            db.session.execute(db.text('SET enable_seqscan = off'))
+        for name, query in hot_queries(Vehicle, VehicleArchive, GateOperation, db):
+            uses_index, plan = explain(db, query, ordered=name in ORDERED_QUERIES)
+            print(f'{"OK  " if uses_index else "SCAN"} {name}')
+            if args.verbose or not uses_index:
+                print('     ' + plan.replace('\n', '\n     '))
+            failures += not uses_index
+        db.session.rollback()
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
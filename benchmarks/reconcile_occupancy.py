@@ -0,0 +1,99 @@
+"""Cost and correctness of the occupancy reconciliation pass.
+
+Seeds --history completed sessions plus a car park's worth of active ones,
+times reconcile() over --runs passes, then checks that it reports and
+repairs a hand-made drift and the drift left by deleting an attendant with
+parked vehicles through the admin route.
+
+Usage:
+    python benchmarks/reconcile_occupancy.py [--database-url URL]
+        [--history 200000] [--runs 50]
+
+Without --database-url a throwaway SQLite file is used. The run creates RC*
+plates and rewrites occupied_spaces, so never point it at production data.
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from _common import bench_user, seed_vehicles, setup_app
+
+TYPES = ('motorcycle', 'bajaj', 'car')
+
+
+def vehicle_row(i, user_id, now, active):
+    check_in_time = now - timedelta(minutes=random.randint(10, 60 * 24 * 30))
+    return {
+        'plate_number': f'RC{i:07d}', 'vehicle_type': TYPES[i % 3], 'check_in_time': check_in_time,
+        'check_out_time': None if active else check_in_time + timedelta(minutes=5),
+        'status': 'active' if active else 'completed', 'user_id': user_id,
+    }
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='database to run against (default: temporary SQLite file)')
+    parser.add_argument('--history', type=int, default=200000, help='completed sessions to seed')
+    parser.add_argument('--runs', type=int, default=50, help='timed reconciliation passes')
+    args = parser.parse_args()
+
+    app = setup_app(args)
+
+    import reconcile
+    from models import db, User, ParkingSpace
+
+    random.seed(17)
+    failed = False
+
+    def check(ok, message):
+        nonlocal failed
+        print(f'{"OK  " if ok else "FAIL"} {message}')
+        failed = failed or not ok
+
+    with app.app_context():
+        user_id = bench_user('bench_leaver').id
+        now = datetime.utcnow()
+        # 30 sessions still parked after the completed history
+        sessions = args.history + 30
+        seed_vehicles(sessions, lambda i: vehicle_row(i, user_id, now, active=i >= args.history))
+        for vehicle_type, count in reconcile.active_counts().items():
+            space = ParkingSpace.query.filter_by(vehicle_type=vehicle_type).first()
+            space.occupied_spaces = count
+            space.total_spaces = max(space.total_spaces, count)
+        db.session.commit()
+
+        check(reconcile.reconcile() == [], 'no drift after seeding')
+        samples = []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            reconcile.reconcile()
+            samples.append(time.perf_counter() - started)
+        print(f'reconcile over {sessions} sessions: p50 {percentile(samples, 50):.2f} ms, '
+              f'p99 {percentile(samples, 99):.2f} ms')
+
+        ParkingSpace.query.filter_by(vehicle_type='car').update({'occupied_spaces': 0})
+        db.session.commit()
+        drifts = reconcile.reconcile(repair=True)
+        check([(d.vehicle_type, d.recorded, d.actual) for d in drifts] == [('car', 0, 10)],
+              f'hand-made drift reported and repaired: {drifts}')
+        check(reconcile.reconcile() == [], 'no drift after repair')
+
+    client = app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    client.post(f'/admin/users/{user_id}/delete')
+    with app.app_context():
+        gone = db.session.get(User, user_id) is None
+        check(gone and reconcile.reconcile() == [], 'no drift after deleting an attendant with parked vehicles')
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""Report and analytics response times against large synthetic histories.
+
+Grows one database through each of --scales parking sessions in turn with
+benchmarks/generate_history.py, and at every scale times the pages that
+read the whole history:
+
+- admin_reports and admin_reports_api for today, this month and a custom
+  90 day range;
+- export_report for this month, reading the full streamed CSV;
+- analytics for the busiest attendant;
+- admin_dashboard.
+
+Each request is made --repeat times. The first (cold) time, the median
+and the slowest are reported with the SQL statements issued and the
+response size; any status other than 200 fails the run. With --json the
+results are written to a file for comparison between revisions.
+
+Usage:
+    python benchmarks/report_queries.py [--database-url URL] [--scales 100000,1000000,10000000]
+        [--repeat 5] [--archive] [--json results.json]
+
+Without --database-url a throwaway SQLite file is used. A given database
+is added to, never cleared; use an empty stand-in, never production data.
+Loading takes a few minutes per million sessions on SQLite.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+from _common import setup_app
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# (endpoint, login, path)
+REQUESTS = [
+    ('admin_reports', 'admin', '/admin/reports?date_range=today'),
+    ('admin_reports', 'admin', '/admin/reports?date_range=this_month'),
+    ('admin_reports', 'admin', '/admin/reports?date_range=custom&start_date={start_90}&end_date={today}'),
+    ('admin_reports_api', 'admin', '/admin/reports/api?date_range=today'),
+    ('admin_reports_api', 'admin', '/admin/reports/api?date_range=this_month'),
+    ('admin_reports_api', 'admin',
+     '/admin/reports/api?date_range=custom&start_date={start_90}&end_date={today}'),
+    ('export_report', 'admin', '/admin/reports/export?date_range=this_month'),
+    ('analytics', 'attendant', '/analytics'),
+    ('admin_dashboard', 'admin', '/admin'),
+]
+
+EAT_OFFSET = timedelta(hours=3)
+
+
+def parse_scales(value):
+    return [int(scale) for scale in value.split(',')]
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def busiest_attendant(db, User, Vehicle):
+    return (db.session.query(User.username)
+            .join(Vehicle, Vehicle.user_id == User.id)
+            .filter(User.is_admin.is_(False))
+            .group_by(User.username)
+            .order_by(db.func.count(Vehicle.id).desc())
+            .limit(1).scalar())
+
+
+def time_requests(clients, statements, repeat):
+    today = (datetime.utcnow() + EAT_OFFSET).date()
+    dates = {'today': today.isoformat(), 'start_90': (today - timedelta(days=89)).isoformat()}
+    results = []
+    for endpoint, login, path in REQUESTS:
+        path = path.format(**dates)
+        samples = []
+        queries = size = status = None
+        for _ in range(repeat):
+            statements.clear()
+            started = time.perf_counter()
+            response = clients[login].get(path)
+            size = len(response.get_data())  # drains streamed responses
+            samples.append((time.perf_counter() - started) * 1000)
+            queries = len(statements)
+            status = response.status_code
+            if status != 200:
+                break
+        warm = sorted(samples[1:] or samples)
+        results.append({
+            'endpoint': endpoint, 'path': path, 'status': status,
+            'cold_ms': samples[0], 'p50_ms': warm[len(warm) // 2], 'max_ms': max(samples),
+            'queries': queries, 'bytes': size,
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='database to run against (default: temporary SQLite file)')
+    parser.add_argument('--scales', type=parse_scales, default=parse_scales('100000,1000000'),
+                        help='comma separated session counts to reach, smallest first')
+    parser.add_argument('--repeat', type=int, default=5, help='times to request each page per scale')
+    parser.add_argument('--attendants', type=int, default=40, help='attendant accounts in the history')
+    parser.add_argument('--days', type=int, default=730, help='days of history ending now')
+    parser.add_argument('--archive', action='store_true', help='archive old sessions after each load')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    app = setup_app(args)
+
+    from sqlalchemy import event
+    from generate_history import generate
+    from models import db, User, Vehicle
+
+    with app.app_context():
+        dialect = db.engine.dialect.name
+
+    statements = []
+    scales = []
+    failed = False
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, *rest: statements.append(statement))
+
+    loaded = 0
+    for index, scale in enumerate(sorted(args.scales)):
+        if scale <= loaded:
+            continue
+        with app.app_context():
+            # Each step adds the sessions that take the history to the next scale
+            summary = generate(scale - loaded, args.attendants, args.days, seed=args.seed + index,
+                               archive_old=args.archive)
+            attendant = busiest_attendant(db, User, Vehicle)
+        loaded = scale
+        print(f'{scale} sessions: loaded {summary["sessions"]} more in {summary["total_seconds"]:.1f}s '
+              f'({summary["archived"]} archived)')
+
+        clients = {'admin': app.test_client(), 'attendant': app.test_client()}
+        clients['admin'].post('/login', data={'username': 'admin', 'password': 'admin123'})
+        clients['attendant'].post('/login', data={'username': attendant, 'password': 'history'})
+
+        results = time_requests(clients, statements, args.repeat)
+        print(f'  {"endpoint":<18} {"cold ms":>9} {"p50 ms":>9} {"max ms":>9} {"queries":>8} '
+              f'{"bytes":>10}  path')
+        for row in results:
+            ok = row['status'] == 200
+            failed = failed or not ok
+            print(f'{"  " if ok else "! "}{row["endpoint"]:<18} {row["cold_ms"]:>9.1f} {row["p50_ms"]:>9.1f} '
+                  f'{row["max_ms"]:>9.1f} {row["queries"]:>8} {row["bytes"]:>10}  {row["path"]}'
+                  + ('' if ok else f' (status {row["status"]})'))
+        scales.append({'sessions': scale, 'generation': summary, 'requests': results})
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'recorded_at': datetime.utcnow().isoformat() + 'Z',
+                'revision': git_revision(), 'dialect': dialect,
+                'attendants': args.attendants, 'days': args.days, 'archive': args.archive,
+                'seed': args.seed, 'repeat': args.repeat, 'scales': scales,
+            }, f, indent=2)
+        print(f'results written to {args.json}')
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
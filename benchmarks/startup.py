@@ -0,0 +1,89 @@
+"""Worker startup cost: time and database work done before the first request.
+
+Starts --runs fresh interpreters that each import the app, as a gunicorn
+worker does, and serve one request. Each run counts the database
+connections and SQL statements issued during import. For comparison, the
+same is measured with init_db() run at import, which is what every worker
+used to do before schema creation and seeding moved to `flask init-db`.
+Fails if importing the app touches the database at all.
+
+Usage:
+    python benchmarks/startup.py [--database-url URL] [--runs 10]
+
+Without --database-url a throwaway SQLite file is used. The database is
+initialised once with init_db() before the runs.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from _common import setup_app
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Run in each child interpreter; prints one JSON line of measurements
+WORKER = '''
+import json, logging, sys, time
+started = time.perf_counter()
+logging.disable(logging.CRITICAL)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+counts = {'connections': 0, 'statements': 0}
+event.listen(Pool, 'connect', lambda *args: counts.__setitem__('connections', counts['connections'] + 1))
+event.listen(Engine, 'before_cursor_execute',
+             lambda *args: counts.__setitem__('statements', counts['statements'] + 1))
+from app import init_db
+from main import app
+if sys.argv[1] == 'init-at-import':
+    with app.app_context():
+        init_db()
+booted = time.perf_counter()
+boot_counts = dict(counts)
+status = app.test_client().get('/login').status_code
+print(json.dumps({'boot': booted - started, 'first_request': time.perf_counter() - booted,
+                  'status': status, **boot_counts}))
+'''
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='database to run against (default: temporary SQLite file)')
+    parser.add_argument('--runs', type=int, default=10, help='worker starts to time per mode')
+    args = parser.parse_args()
+
+    # The child interpreters inherit the database URL from the environment
+    setup_app(args)
+
+    failed = False
+    print(f'{"mode":<16} {"boot p50 ms":>12} {"boot p90 ms":>12} {"1st req ms":>11} '
+          f'{"connections":>12} {"statements":>11}')
+    for mode in ('init-at-import', 'factory'):
+        runs = []
+        for _ in range(args.runs):
+            output = subprocess.run([sys.executable, '-c', WORKER, mode], cwd=ROOT, check=True,
+                                    capture_output=True, text=True).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+        boots = [run['boot'] for run in runs]
+        first = [run['first_request'] for run in runs]
+        connections = max(run['connections'] for run in runs)
+        statements = max(run['statements'] for run in runs)
+        print(f'{mode:<16} {percentile(boots, 50):>12.1f} {percentile(boots, 90):>12.1f} '
+              f'{percentile(first, 50):>11.1f} {connections:>12} {statements:>11}')
+        if mode == 'factory':
+            ok = connections == 0 and statements == 0 and all(run['status'] == 200 for run in runs)
+            print(f'{"OK  " if ok else "FAIL"} importing the app does no database I/O')
+            failed = not ok
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
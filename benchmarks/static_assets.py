@@ -0,0 +1,77 @@
+"""Transfer sizes and cache headers of static assets and large responses.
+
+Runs the asset build, then fetches every static URL the login page links to,
+with and without Accept-Encoding, and checks that each one is fingerprinted,
+cached as immutable and served precompressed. Also seeds --sessions active
+vehicles and compares the size of /admin/reports/api and the reports page
+with and without gzip, checking that a 304 still answers the gzipped ETag.
+
+Usage:
+    python benchmarks/static_assets.py [--database-url URL] [--sessions 200]
+
+Without --database-url a throwaway SQLite file is used. The build writes to
+static/build, as `flask build-assets` does.
+"""
+import argparse
+import re
+import sys
+from datetime import datetime
+
+from _common import seed_vehicles, setup_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='database to run against (default: temporary SQLite file)')
+    parser.add_argument('--sessions', type=int, default=200, help='active vehicles to seed')
+    args = parser.parse_args()
+
+    app = setup_app(args)
+
+    import assets
+    import versions
+
+    failed = False
+    assets.build(app.static_folder)
+    assets.init_app(app)
+    client = app.test_client()
+
+    html = client.get('/login').get_data(as_text=True)
+    urls = sorted(set(re.findall(r'"(/static/[^"]+)"', html)))
+    print(f'{"asset":<56} {"bytes":>8} {"gzip":>8}  cache')
+    for url in urls:
+        plain = client.get(url)
+        if plain.status_code == 404:
+            print(f'{url:<56} {"missing":>8}')
+            continue
+        compressed = client.get(url, headers={'Accept-Encoding': 'gzip, br'})
+        cache_control = compressed.headers.get('Cache-Control', '')
+        ok = (url.startswith(f'/static/{assets.BUILD_DIR}/') and 'immutable' in cache_control
+              and compressed.headers.get('Content-Encoding') in ('gzip', 'br'))
+        print(f'{"OK  " if ok else "FAIL"}{url:<52} {len(plain.data):>8} {len(compressed.data):>8}  {cache_control}')
+        failed = failed or not ok
+
+    with app.app_context():
+        seed_vehicles(args.sessions, lambda i: {'plate_number': f'SA{i:05d}', 'status': 'active',
+                                                'check_in_time': datetime.utcnow(), 'user_id': 1})
+        versions.bump('occupancy')
+
+    client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    for path in ('/admin/reports/api', '/admin/reports'):
+        plain = client.get(path)
+        compressed = client.get(path, headers={'Accept-Encoding': 'gzip'})
+        ok = compressed.headers.get('Content-Encoding') == 'gzip'
+        print(f'{"OK  " if ok else "FAIL"}{path:<52} {len(plain.data):>8} {len(compressed.data):>8}')
+        failed = failed or not ok
+
+    etag = client.get('/admin/reports/api', headers={'Accept-Encoding': 'gzip'}).headers.get('ETag')
+    response = client.get('/admin/reports/api', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    ok = response.status_code == 304
+    print(f'{"OK  " if ok else "FAIL"} gzipped report ETag revalidates with {response.status_code}')
+    failed = failed or not ok
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
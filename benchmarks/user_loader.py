@@ -0,0 +1,98 @@
+"""Per-request query count with and without the logged-in user cache.
+
+Requests a few lightweight pages repeatedly as an attendant, first with the
+user cache disabled (every request loads the User row, as load_user used
+to) and then enabled, and prints the average number of SQL statements and
+latency per request. It then deactivates the attendant through the admin
+route and fails unless the very next request sees the change.
+
+Usage:
+    python benchmarks/user_loader.py [--database-url URL] [--rounds 200]
+
+Without --database-url a throwaway SQLite file is used.
+"""
+import argparse
+import sys
+import time
+
+from _common import PASSWORD, bench_user, setup_app
+
+PATHS = ['/dashboard', '/report', '/my-handovers']
+
+
+def run(client, statements, rounds):
+    """Average (queries, milliseconds) per request over all PATHS"""
+    total_queries = 0
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for path in PATHS:
+            statements.clear()
+            response = client.get(path)
+            if response.status_code != 200:
+                raise SystemExit(f'{path} returned {response.status_code}')
+            total_queries += len(statements)
+    elapsed = time.perf_counter() - started
+    count = rounds * len(PATHS)
+    return total_queries / count, elapsed / count * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='database to run against (default: temporary SQLite file)')
+    parser.add_argument('--rounds', type=int, default=200, help='requests per page and mode')
+    args = parser.parse_args()
+
+    app = setup_app(args)
+
+    from sqlalchemy import event
+    import user_cache
+    from models import db, User
+
+    statements = []
+    failed = False
+    with app.app_context():
+        attendant = bench_user()
+        attendant.is_active = True
+        db.session.commit()
+        attendant_id = attendant.id
+        user_cache.invalidate(attendant_id)
+        event.listen(db.engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, *rest: statements.append(statement))
+
+    client = app.test_client()
+    client.post('/login', data={'username': 'bench_attendant', 'password': PASSWORD})
+
+    cache = app.extensions['user_cache']
+    max_age = cache.max_age
+    cache.max_age = 0
+    uncached = run(client, statements, args.rounds)
+    cache.max_age = max_age
+    cached = run(client, statements, args.rounds)
+
+    print(f'{"mode":<10} {"queries/request":>16} {"ms/request":>11}')
+    print(f'{"uncached":<10} {uncached[0]:>16.2f} {uncached[1]:>11.2f}')
+    print(f'{"cached":<10} {cached[0]:>16.2f} {cached[1]:>11.2f}')
+    if cached[0] >= uncached[0]:
+        print('FAIL cache did not reduce the number of queries')
+        failed = True
+
+    admin = app.test_client()
+    admin.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    admin.post(f'/admin/users/{attendant_id}/deactivate')
+    client.get('/dashboard')
+    with app.app_context():
+        seen = user_cache.get_user(attendant_id)
+        if seen is None or seen.is_active:
+            print('FAIL deactivation was not picked up by the next request')
+            failed = True
+        else:
+            print('OK   deactivation visible on the next request')
+        db.session.get(User, attendant_id).is_active = True
+        db.session.commit()
+        user_cache.invalidate(attendant_id)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
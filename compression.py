@@ -0,0 +1,42 @@
+import gzip
+from flask import request
+
+# Smaller bodies fit in a packet or two already; compressing them costs more
+# CPU than it saves on the wire
+MIN_SIZE = 1024
+
+# Level 6 is gzip's default: most of level 9's savings for a fraction of the CPU
+COMPRESS_LEVEL = 6
+
+COMPRESSIBLE_MIMETYPES = {'text/html', 'application/json'}
+
+# Strong ETags of compressed bodies get this suffix, since their bytes
+# differ from the uncompressed representation (RFC 9110, 8.8.3)
+ETAG_SUFFIX = '-gzip'
+
+
+def compress_response(response):
+    """Gzip large HTML and JSON responses for clients that accept it"""
+    if (response.status_code != 200
+            or response.direct_passthrough
+            or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    if request.accept_encodings.quality('gzip') <= 0:
+        return response
+
+    data = response.get_data()
+    if len(data) < MIN_SIZE:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=COMPRESS_LEVEL))
+    response.headers['Content-Encoding'] = 'gzip'
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag + ETAG_SUFFIX)
+    return response
+
+
+def init_app(app):
+    app.after_request(compress_response)
@@ -0,0 +1,62 @@
+import hashlib
+import time
+from functools import wraps
+from flask import Response, request
+import compression
+import versions
+
+# ETags also change every this many seconds, the same bound on staleness
+# as versions.VersionedCache's max_age, which also refreshes values derived
+# from the clock, such as active session durations
+ETAG_MAX_AGE = 30
+
+# Shared versions bumped by every write that can change reports or
+# dashboard data: gate writes and capacity changes ('occupancy'),
+# handovers and deleted users ('plates'), renamed users ('users')
+REPORT_VERSIONS = ('occupancy', 'plates', 'users')
+
+
+def make_etag(names, *parts):
+    """Strong ETag for the current versions of names plus request parts.
+
+    Returns None when versions are not tracked because SHARED_STATE_DIR is
+    not configured; the caller then serves the full response every time.
+    """
+    if not versions.enabled():
+        return None
+    watermark = [versions.current(name) for name in names]
+    key = repr((watermark, int(time.time() // ETAG_MAX_AGE), parts))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def conditional(names, key=None):
+    """Answer GETs with 304 Not Modified while the data is unchanged.
+
+    key() returns the request parts that select the data, or None to skip
+    the ETag (e.g. for invalid parameters); it must not query the database,
+    since it runs before the view and the point is to skip the view.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            parts = key() if key else (request.path,)
+            etag = make_etag(names, request.path, parts) if parts is not None else None
+            # Gzipped responses carry the ETag with a suffix; echo back
+            # whichever form the client holds
+            held = etag and next((tag for tag in (etag, etag + compression.ETAG_SUFFIX)
+                                  if request.if_none_match.contains(tag)), None)
+            if held:
+                response = Response(status=304)
+                response.set_etag(held)
+                response.vary.add('Accept-Encoding')
+            else:
+                response = view(*args, **kwargs)
+                if not isinstance(response, Response):
+                    return response
+                if not etag or response.status_code != 200:
+                    return response
+                response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapped
+    return decorator
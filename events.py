@@ -0,0 +1,177 @@
+import json
+import logging
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+import gate
+import metrics
+import occupancy
+import versions
+from models import db, Vehicle
+
+logger = logging.getLogger(__name__)
+
+# How often the publisher stat()s the occupancy version file
+POLL_INTERVAL = 0.1
+
+# Comment line sent to idle streams so proxies keep them open and closed
+# connections are noticed
+KEEPALIVE_INTERVAL = 15.0
+
+# Reconnect delay suggested to EventSource clients, in milliseconds
+RETRY_MS = 3000
+
+# Streams per worker; each holds a gunicorn thread, so keep this below the
+# thread count in gunicorn.conf.py to leave room for normal requests
+MAX_SUBSCRIBERS = 200
+
+# Messages buffered per stream before a slow client is dropped
+SUBSCRIBER_QUEUE_SIZE = 100
+
+# Gate events are found by their check-in and check-out times, which are
+# set before the commit; look back this far and skip ones already sent
+EVENT_OVERLAP = timedelta(seconds=60)
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+def format_event(name, data):
+    return f'event: {name}\ndata: {json.dumps(data)}\n\n'
+
+
+class Subscriber:
+    def __init__(self, broker, user_id):
+        self.broker = broker
+        self.user_id = user_id
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.closed = False
+
+
+class Broker:
+    """Fans gate activity out to the event streams of one app in a worker.
+
+    A single publisher thread per worker watches the shared 'occupancy'
+    version, which every gate write bumps. When it changes, the publisher
+    runs one query for the sessions checked in or out since its last look
+    and reads the cached occupancy. It then queues the results for every
+    subscriber. Open streams never touch the database themselves, so the
+    cost is the same for one viewer or hundreds.
+    """
+
+    def __init__(self, app):
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.app = app
+        self.thread = None
+        self.version = None
+        self.synced_at = None
+        self.polled_at = 0.0
+        self.sent = {}
+
+    def subscribe(self, user_id):
+        with self.lock:
+            if len(self.subscribers) >= MAX_SUBSCRIBERS:
+                raise TooManySubscribers()
+            subscriber = Subscriber(self, user_id)
+            self.subscribers.add(subscriber)
+            if self.thread is None:
+                self.version = versions.current('occupancy')
+                self.synced_at = datetime.utcnow()
+                self.thread = threading.Thread(target=self.run, name='event-publisher', daemon=True)
+                self.thread.start()
+        metrics.increment('event_streams_opened_total')
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def publish(self, name, data, user_ids=None):
+        """Queue an event for every subscriber, or only those in user_ids"""
+        message = format_event(name, data)
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            if user_ids is not None and subscriber.user_id not in user_ids:
+                continue
+            try:
+                subscriber.queue.put_nowait(message)
+            except queue.Full:
+                # Too far behind; its stream ends and the browser reconnects
+                subscriber.closed = True
+                self.unsubscribe(subscriber)
+                metrics.increment('event_streams_dropped_total')
+
+    def run(self):
+        # The thread lives in one app context; its session is removed after
+        # every poll so no connection is held between them
+        with self.app.app_context():
+            while True:
+                time.sleep(POLL_INTERVAL)
+                version = versions.current('occupancy')
+                if versions.fresh(version, self.version, self.polled_at, occupancy.SNAPSHOT_MAX_AGE):
+                    continue
+                self.version = version
+                self.polled_at = time.monotonic()
+                if not self.subscribers:
+                    self.synced_at = datetime.utcnow()
+                    continue
+                try:
+                    self.poll()
+                except Exception as e:
+                    logger.error(f"Error publishing occupancy events: {str(e)}")
+                finally:
+                    db.session.remove()
+
+    def poll(self):
+        now = datetime.utcnow()
+        since = self.synced_at - EVENT_OVERLAP
+        changes = []
+        for vehicle in Vehicle.query.filter((Vehicle.check_in_time >= since) | (Vehicle.check_out_time >= since)):
+            if vehicle.check_in_time >= since:
+                changes.append((vehicle.check_in_time, 'check_in', vehicle))
+            if vehicle.status == 'completed' and vehicle.check_out_time and vehicle.check_out_time >= since:
+                changes.append((vehicle.check_out_time, 'check_out', vehicle))
+
+        for timestamp, kind, vehicle in sorted(changes, key=lambda change: change[0]):
+            if (vehicle.id, kind) in self.sent:
+                continue
+            self.sent[vehicle.id, kind] = timestamp
+            self.publish('gate', {
+                'type': kind,
+                'plate_number': vehicle.plate_number,
+                'vehicle_type': vehicle.vehicle_type,
+                'user_id': vehicle.user_id,
+                'timestamp': (timestamp + timedelta(hours=3)).strftime('%Y-%m-%d %H:%M'),  # EAT
+            }, user_ids={vehicle.user_id, vehicle.handler_id})
+        self.sent = {key: timestamp for key, timestamp in self.sent.items() if timestamp >= since}
+
+        self.publish('occupancy', gate.occupancy_payload())
+        self.synced_at = now
+
+
+def stream(subscriber, snapshot):
+    """Body of an event stream: the current occupancy, then live events"""
+    try:
+        yield f'retry: {RETRY_MS}\n\n'
+        yield format_event('occupancy', snapshot)
+        while not subscriber.closed:
+            try:
+                yield subscriber.queue.get(timeout=KEEPALIVE_INTERVAL)
+            except queue.Empty:
+                yield ': keepalive\n\n'
+    finally:
+        subscriber.broker.unsubscribe(subscriber)
+
+
+def subscribe(user_id):
+    return current_app.extensions['events'].subscribe(user_id)
+
+
+def init_app(app):
+    """Give the app its own broker; its publisher starts with the first stream"""
+    app.extensions['events'] = Broker(app)
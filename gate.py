@@ -0,0 +1,413 @@
+import re
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+import occupancy
+from models import db, Vehicle, VehicleArchive, ParkingSpace, HourlyStat, GateOperation
+
+VEHICLE_TYPES = ('motorcycle', 'bajaj', 'car')
+DRIVER_ID_TYPES = ('national_id', 'voters_id', 'passport', 'drivers_license')
+CHECK_IN_FIELDS = ('vehicle_type', 'plate_number', 'vehicle_model', 'vehicle_color',
+                   'driver_name', 'driver_id_type', 'driver_id_number', 'driver_phone',
+                   'driver_residence')
+
+# Largest batch a kiosk may send in one request
+BATCH_MAX_ITEMS = 200
+
+# Same patterns as the dashboard form inputs
+PLATE_PATTERN = re.compile(r'^[A-Za-z0-9]{3,10}$')
+PHONE_PATTERN = re.compile(r'^[0-9+]{10,15}$')
+
+# Client-chosen idempotency keys, e.g. the UUIDs the service worker
+# assigns to queued operations
+KEY_PATTERN = re.compile(r'^[A-Za-z0-9_.:-]{1,64}$')
+
+# How long idempotency keys are remembered; a device offline for longer
+# replays its queue as new operations. Older keys are pruned by init_db(),
+# which runs on every start, and by the archive-sessions command
+OPERATION_RETENTION = timedelta(days=7)
+
+
+class GateError(ValueError):
+    """A gate action that was refused; code says why"""
+
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.code = code
+
+
+def clean_plate(plate_number):
+    """Validated plate number from user input"""
+    plate_number = (plate_number or '').strip()
+    if not PLATE_PATTERN.match(plate_number):
+        raise GateError('Please enter a valid plate number (3-10 alphanumeric characters)', 'invalid')
+    return plate_number
+
+
+def clean_key(key):
+    """Validated idempotency key, or None when the client sent none"""
+    if key is None or key == '':
+        return None
+    if not isinstance(key, str) or not KEY_PATTERN.match(key):
+        raise GateError('Invalid idempotency key (1-64 letters, digits, _ . : -)', 'invalid')
+    return key
+
+
+def find_operation(key, user):
+    """Operation the user already applied under key; one unique-index lookup"""
+    return GateOperation.query.filter_by(user_id=user.id, idempotency_key=key).first()
+
+
+def replay(operation, action):
+    """The vehicle an earlier operation under the same key produced"""
+    if operation.action != action:
+        raise GateError('Idempotency key was already used for a different action', 'invalid')
+    vehicle = (db.session.get(Vehicle, operation.vehicle_id)
+               or db.session.get(VehicleArchive, operation.vehicle_id))
+    if vehicle is None:
+        raise GateError('Vehicle not found or already checked out!', 'not_found')
+    return vehicle
+
+
+def validate_check_in(data):
+    """Check-in fields from a form or JSON body, stripped and validated"""
+    fields = {name: str(data.get(name) or '').strip() for name in CHECK_IN_FIELDS}
+    missing = [name for name, value in fields.items() if not value]
+    if missing:
+        raise GateError(f"Missing required fields: {', '.join(missing)}", 'invalid')
+    fields['plate_number'] = clean_plate(fields['plate_number'])
+    if fields['vehicle_type'] not in VEHICLE_TYPES:
+        raise GateError('Invalid vehicle type', 'invalid')
+    if fields['driver_id_type'] not in DRIVER_ID_TYPES:
+        raise GateError('Invalid ID type', 'invalid')
+    if not PHONE_PATTERN.match(fields['driver_phone']):
+        raise GateError('Please enter a valid phone number', 'invalid')
+    return fields
+
+
+def check_in(data, user, idempotency_key=None):
+    """Record a vehicle entering, reserving a space for it.
+
+    Commits on success and returns the new Vehicle; raises GateError when
+    the input is invalid, the lot is full or the plate is already parked.
+    With an idempotency key, a repeat of a check-in that already went
+    through returns its vehicle instead of failing or parking it twice.
+    """
+    fields = validate_check_in(data)
+    key = clean_key(idempotency_key)
+    vehicle = Vehicle(check_in_time=datetime.utcnow(), status='active', user_id=user.id, **fields)
+
+    try:
+        HourlyStat.increment([(vehicle.check_in_time, vehicle.vehicle_type, user.id, {'check_ins': 1})])
+        db.session.add(vehicle)
+        if key:
+            db.session.flush()
+            db.session.add(GateOperation(user_id=user.id, idempotency_key=key,
+                                         action='check_in', vehicle_id=vehicle.id))
+        db.session.flush()
+        # Reserve a space with a single conditional UPDATE so concurrent
+        # workers can never push occupied_spaces past total_spaces. It runs
+        # last, so the capacity row is locked only until the commit below
+        if not ParkingSpace.reserve(vehicle.vehicle_type):
+            db.session.rollback()
+            # The key is only looked up when the check-in fails, keeping the
+            # normal path free of extra queries
+            operation = key and find_operation(key, user)
+            if operation:
+                return replay(operation, 'check_in')
+            raise GateError('No available spaces for this vehicle type!', 'no_space')
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        # A retry whose first attempt went through trips the key or the plate
+        operation = key and find_operation(key, user)
+        if operation:
+            return replay(operation, 'check_in')
+        # uq_vehicle_active_plate rejects a second active session for the
+        # same plate; confirm that is what failed before saying so
+        if Vehicle.query.filter_by(plate_number=vehicle.plate_number, status='active').first():
+            raise GateError('Vehicle is already parked!', 'already_parked')
+        raise
+
+    occupancy.invalidate()
+    return vehicle
+
+
+def find_active(plate_number, user):
+    """Active vehicle with the plate that the user recorded or was handed"""
+    return Vehicle.query.filter(
+        Vehicle.plate_number == plate_number,
+        Vehicle.status == 'active'
+    ).filter(
+        (Vehicle.user_id == user.id) |
+        (Vehicle.handler_id == user.id)
+    ).first()
+
+
+def check_out(plate_number, user, idempotency_key=None):
+    """Record a vehicle leaving and release its space; returns the Vehicle.
+
+    As with check_in, a repeat under the same idempotency key returns the
+    vehicle checked out the first time.
+    """
+    plate_number = clean_plate(plate_number)
+    key = clean_key(idempotency_key)
+    vehicle = find_active(plate_number, user)
+    if not vehicle:
+        operation = key and find_operation(key, user)
+        if operation:
+            return replay(operation, 'check_out')
+        raise GateError('Vehicle not found or already checked out!', 'not_found')
+
+    # Close the session with a conditional UPDATE: of two concurrent
+    # check-outs of the plate only the one that still finds it active gets
+    # a row, and only that one gives back the space and counts the check-out
+    closed = db.session.execute(
+        db.update(Vehicle)
+        .where(Vehicle.id == vehicle.id, Vehicle.status == 'active')
+        .values(status='completed', check_out_time=datetime.utcnow(),
+                handler_id=None)  # Clear handler when checking out
+        .execution_options(synchronize_session='evaluate')
+    )
+    if closed.rowcount != 1:
+        db.session.rollback()
+        operation = key and find_operation(key, user)
+        if operation:
+            return replay(operation, 'check_out')
+        raise GateError('Vehicle not found or already checked out!', 'not_found')
+
+    HourlyStat.increment([(vehicle.check_out_time, vehicle.vehicle_type, vehicle.user_id, {
+        'check_outs': 1,
+        'dwell_seconds': HourlyStat.dwell_seconds_between(vehicle.check_in_time, vehicle.check_out_time),
+    })])
+    if key:
+        db.session.add(GateOperation(user_id=user.id, idempotency_key=key,
+                                     action='check_out', vehicle_id=vehicle.id))
+    try:
+        db.session.flush()
+        # As in check_in, the capacity row is updated last and held only
+        # until the commit
+        ParkingSpace.release(vehicle.vehicle_type)
+        db.session.commit()
+    except IntegrityError:
+        # The same operation committed concurrently; this attempt's
+        # check-out is rolled back with it
+        db.session.rollback()
+        operation = key and find_operation(key, user)
+        if operation:
+            return replay(operation, 'check_out')
+        raise
+    occupancy.invalidate()
+    return vehicle
+
+
+def _apply_batch(operations, user, now):
+    """One attempt at apply_batch; flushes but leaves the commit to the caller"""
+    results = [None] * len(operations)
+    valid = []
+    for index, operation in enumerate(operations):
+        action = operation.get('action') if isinstance(operation, dict) else None
+        try:
+            if action == 'check_in':
+                fields = validate_check_in(operation)
+            elif action == 'check_out':
+                fields = {'plate_number': clean_plate(operation.get('plate_number'))}
+            else:
+                raise GateError("action must be 'check_in' or 'check_out'", 'invalid')
+            valid.append((index, action, fields, clean_key(operation.get('idempotency_key'))))
+        except GateError as e:
+            results[index] = {'index': index, 'action': action, 'result': e.code, 'error': str(e)}
+
+    # Lock the active sessions of every plate in the batch and read the
+    # capacity left, then work out the outcome of each item in memory.
+    # Rows are locked in the order check_in and check_out use: vehicle
+    # rows first, the capacity rows last, just before the commit
+    plates = {fields['plate_number'] for _, _, fields, _ in valid}
+    active = {vehicle.plate_number: vehicle for vehicle in Vehicle.query.filter(
+        Vehicle.plate_number.in_(plates),
+        Vehicle.status == 'active'
+    ).with_for_update()} if plates else {}
+    spaces = {space.vehicle_type: space for space in ParkingSpace.query.all()}
+    available = {vehicle_type: space.total_spaces - (space.occupied_spaces or 0)
+                 for vehicle_type, space in spaces.items()}
+    # Keys applied before, found in one uq_gate_operation_key lookup
+    keys = {key for _, _, _, key in valid if key}
+    applied = {operation.idempotency_key: operation for operation in GateOperation.query.filter(
+        GateOperation.user_id == user.id,
+        GateOperation.idempotency_key.in_(keys)
+    )} if keys else {}
+
+    deltas = dict.fromkeys(spaces, 0)
+    inserts = []      # new sessions, as parameter dicts for one bulk INSERT
+    pending = {}      # plate -> parameter dict of a session opened by this batch
+    updates = []      # existing sessions closed by this batch
+    stats = []        # HourlyStat changes
+    keyed = {}        # key -> result of the item applied under it in this batch
+    for index, action, fields, key in valid:
+        plate = fields['plate_number']
+        result = {'index': index, 'action': action, 'plate_number': plate, 'result': 'ok'}
+        earlier = applied.get(key) or keyed.get(key)
+        if earlier is not None:
+            # Already applied, by an earlier request or earlier in this batch
+            if (earlier.action if isinstance(earlier, GateOperation) else earlier['action']) != action:
+                result.update(result='invalid', error='Idempotency key was already used for a different action')
+            else:
+                result.update(replayed=True, earlier=earlier)
+            results[index] = result
+            continue
+        if action == 'check_in':
+            if plate in active or plate in pending:
+                result.update(result='duplicate', error='Vehicle is already parked!')
+            elif available.get(fields['vehicle_type'], 0) <= 0:
+                result.update(result='no_space', error='No available spaces for this vehicle type!')
+            else:
+                row = dict(fields, check_in_time=now, check_out_time=None, status='active',
+                           user_id=user.id, handler_id=None)
+                inserts.append(row)
+                pending[plate] = row
+                result['row'] = row
+                stats.append((now, fields['vehicle_type'], user.id, {'check_ins': 1}))
+                available[fields['vehicle_type']] -= 1
+                deltas[fields['vehicle_type']] += 1
+        else:
+            vehicle = active.get(plate)
+            if plate in pending:
+                row = pending.pop(plate)
+                row.update(status='completed', check_out_time=now)
+                result['row'] = row
+                vehicle_type = row['vehicle_type']
+                stats.append((now, vehicle_type, user.id, {'check_outs': 1}))
+            elif vehicle is not None and user.id in (vehicle.user_id, vehicle.handler_id):
+                del active[plate]
+                updates.append({'id': vehicle.id, 'status': 'completed',
+                                'check_out_time': now, 'handler_id': None})
+                result['vehicle_id'] = vehicle.id
+                vehicle_type = vehicle.vehicle_type
+                stats.append((now, vehicle_type, vehicle.user_id, {
+                    'check_outs': 1,
+                    'dwell_seconds': HourlyStat.dwell_seconds_between(vehicle.check_in_time, now),
+                }))
+            else:
+                result.update(result='not_found', error='Vehicle not found or already checked out!')
+                results[index] = result
+                continue
+            available[vehicle_type] += 1
+            deltas[vehicle_type] -= 1
+        results[index] = result
+        if key and result['result'] == 'ok':
+            keyed[key] = result
+
+    if inserts:
+        ids = db.session.scalars(
+            db.insert(Vehicle).returning(Vehicle.id, sort_by_parameter_order=True), inserts).all()
+        for row, vehicle_id in zip(inserts, ids):
+            row['id'] = vehicle_id
+    if updates:
+        db.session.execute(db.update(Vehicle), updates)
+    HourlyStat.increment(stats)
+
+    for result in results:
+        row = result.pop('row', None)
+        if row is not None:
+            result['vehicle_id'] = row['id']
+    for result in results:
+        earlier = result.pop('earlier', None)
+        if earlier is not None:
+            result['vehicle_id'] = (earlier.vehicle_id if isinstance(earlier, GateOperation)
+                                    else earlier['vehicle_id'])
+    if keyed:
+        db.session.execute(db.insert(GateOperation), [
+            {'user_id': user.id, 'idempotency_key': key, 'action': result['action'],
+             'vehicle_id': result['vehicle_id'], 'created_at': now}
+            for key, result in keyed.items()])
+
+    # One capacity UPDATE per vehicle type for the whole batch, last and
+    # still guarded so it can never leave occupied_spaces out of range
+    for vehicle_type, delta in deltas.items():
+        if not delta:
+            continue
+        result = db.session.execute(
+            db.update(ParkingSpace)
+            .where(ParkingSpace.vehicle_type == vehicle_type,
+                   ParkingSpace.occupied_spaces + delta <= ParkingSpace.total_spaces,
+                   ParkingSpace.occupied_spaces + delta >= 0)
+            .values(occupied_spaces=ParkingSpace.occupied_spaces + delta)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            raise GateError(f'Capacity changed while applying the batch for {vehicle_type}', 'conflict')
+    return results
+
+
+def apply_batch(operations, user):
+    """Apply a list of check-in/check-out operations in one transaction.
+
+    Items are applied in order, so a batch may check a vehicle in and out
+    again. Each item gets a result of ok, invalid, duplicate, no_space or
+    not_found; refused items do not affect the others. Returns the list
+    of per-item results after committing.
+
+    Items may carry an idempotency_key. One that was applied before, in an
+    earlier request or earlier in the batch, is not applied again; its
+    result is ok with replayed set and the original vehicle_id.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise GateError('operations must be a non-empty list', 'invalid')
+    if len(operations) > BATCH_MAX_ITEMS:
+        raise GateError(f'A batch can hold at most {BATCH_MAX_ITEMS} operations', 'invalid')
+
+    # A concurrent check-in of one of the plates can still trip
+    # uq_vehicle_active_plate, a concurrent replay of the same queue
+    # uq_gate_operation_key, and concurrent gate traffic can use up the
+    # capacity read at the start; the second attempt sees the committed
+    # rows and reports a duplicate, a replay or no_space for those items
+    for attempt in range(2):
+        try:
+            results = _apply_batch(operations, user, datetime.utcnow())
+            db.session.commit()
+            break
+        except IntegrityError:
+            db.session.rollback()
+            if attempt:
+                raise
+        except GateError as e:
+            db.session.rollback()
+            if attempt or e.code != 'conflict':
+                raise
+        except Exception:
+            db.session.rollback()
+            raise
+
+    if any(result['result'] == 'ok' and not result.get('replayed') for result in results):
+        occupancy.invalidate()
+    return results
+
+
+def prune_operations(now=None):
+    """Forget idempotency keys older than OPERATION_RETENTION; returns the count"""
+    cutoff = (now or datetime.utcnow()) - OPERATION_RETENTION
+    removed = GateOperation.query.filter(GateOperation.created_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return removed
+
+
+def occupancy_payload():
+    """Occupancy per vehicle type, as sent with every gate API response"""
+    return {space.vehicle_type: {'total': space.total_spaces,
+                                 'occupied': space.occupied_spaces,
+                                 'available': space.total_spaces - space.occupied_spaces}
+            for space in occupancy.get_spaces()}
+
+
+def vehicle_payload(vehicle):
+    return {
+        'id': vehicle.id,
+        'plate_number': vehicle.plate_number,
+        'vehicle_type': vehicle.vehicle_type,
+        'vehicle_model': vehicle.vehicle_model,
+        'vehicle_color': vehicle.vehicle_color,
+        'driver_name': vehicle.driver_name,
+        'status': vehicle.status,
+        'check_in': vehicle.formatted_check_in_time(),
+        'check_out': vehicle.formatted_check_out_time(),
+        'handed_over': vehicle.handler_id is not None,
+    }
@@ -0,0 +1,20 @@
+# Picked up automatically by `gunicorn main:app` from the project directory.
+import os
+
+# Threaded workers: every open /events/occupancy stream holds a thread
+# while it is idle, so sync workers would be used up by a few dashboards
+worker_class = 'gthread'
+workers = int(os.environ.get('GUNICORN_WORKERS', '2'))
+threads = int(os.environ.get('GUNICORN_THREADS', '250'))
+
+# Event streams send a keepalive every 15 seconds; keep idle HTTP
+# connections open a little longer than that between requests
+keepalive = 20
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '60'))
+
+
+def on_starting(server):
+    # Metrics snapshots are merged across workers and kept after a worker
+    # exits; start each deployment run from an empty directory
+    import metrics
+    metrics.clear(os.environ.get('METRICS_DIR', metrics.DEFAULT_DIRECTORY))
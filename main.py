@@ -1,11 +1,14 @@
 import os
 import logging
-from app import app
+from app import create_app
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# The app served by `gunicorn main:app` and `flask --app main`
+app = create_app()
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
     app.run(host="0.0.0.0", port=port)
\ No newline at end of file
@@ -0,0 +1,265 @@
+import atexit
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency and per-request SQL count histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# How often a worker writes its counters out for the other workers to read
+FLUSH_INTERVAL = 1.0
+
+# Default METRICS_DIR; gunicorn.conf.py clears the same directory
+DEFAULT_DIRECTORY = os.path.join(tempfile.gettempdir(), 'chinopark-metrics')
+
+
+class MetricsRegistry:
+    """Per-process request and SQL counters.
+
+    Every gunicorn worker keeps one registry per app and periodically writes a
+    snapshot to METRICS_DIR/<worker id>.json. The metrics endpoint merges
+    all snapshot files, so whichever worker serves the scrape reports totals
+    for the whole deployment. Snapshots of exited workers are kept, which
+    keeps the counters monotonic across worker restarts. The worker id is
+    the pid plus a random suffix, so a new worker that reuses a pid does
+    not overwrite a dead worker's totals. The gunicorn master clears the
+    directory when it starts, with clear().
+    """
+
+    def __init__(self, directory=None):
+        self.lock = threading.Lock()
+        self.directory = directory
+        self.pid = None
+        self.worker_id = None
+        self.last_flush = 0.0
+        self.requests = defaultdict(int)
+        self.latency = {}
+        self.query_counts = {}
+        self.sql_queries = defaultdict(int)
+        self.sql_seconds = defaultdict(float)
+        self.counters = defaultdict(int)
+
+    def observe_request(self, endpoint, method, status, duration, sql_queries, sql_seconds):
+        with self.lock:
+            self.requests[f'{endpoint}|{method}|{status}'] += 1
+            _observe(self.latency, endpoint, LATENCY_BUCKETS, duration)
+            _observe(self.query_counts, endpoint, QUERY_COUNT_BUCKETS, sql_queries)
+            self.sql_queries[endpoint] += sql_queries
+            self.sql_seconds[endpoint] += sql_seconds
+        if time.monotonic() - self.last_flush >= FLUSH_INTERVAL:
+            self.flush()
+
+    def increment(self, name, amount=1):
+        """Bump a free-form counter, exported as chinopark_<name>"""
+        with self.lock:
+            self.counters[name] += amount
+
+    def snapshot(self):
+        with self.lock:
+            return json.loads(json.dumps({
+                'requests': self.requests,
+                'latency': self.latency,
+                'query_counts': self.query_counts,
+                'sql_queries': self.sql_queries,
+                'sql_seconds': self.sql_seconds,
+                'counters': self.counters,
+            }))
+
+    def flush(self):
+        """Write this worker's snapshot where the other workers can read it"""
+        if not self.directory:
+            return
+        self.last_flush = time.monotonic()
+        try:
+            # Set again after a fork, e.g. when gunicorn preloads the app
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.worker_id = f'{self.pid}-{uuid.uuid4().hex[:12]}'
+            path = os.path.join(self.directory, f'{self.worker_id}.json')
+            tmp_path = f'{path}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"Error writing metrics snapshot: {str(e)}")
+
+    def collect(self):
+        """Merge the snapshots of every worker, including this one"""
+        self.flush()
+        snapshots = []
+        if self.directory:
+            for name in os.listdir(self.directory):
+                if not name.endswith('.json'):
+                    continue
+                try:
+                    with open(os.path.join(self.directory, name)) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue  # being replaced by its worker right now
+        else:
+            snapshots.append(self.snapshot())
+        return _merge(snapshots)
+
+
+def clear(directory):
+    """Remove every snapshot in directory, before any worker starts"""
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.endswith('.json') or name.endswith('.tmp'):
+            try:
+                os.unlink(os.path.join(directory, name))
+            except OSError as e:
+                logger.error(f"Error removing metrics snapshot {name}: {str(e)}")
+
+
+def _observe(histograms, key, buckets, value):
+    histogram = histograms.setdefault(key, {'buckets': [0] * (len(buckets) + 1), 'sum': 0, 'count': 0})
+    index = next((i for i, bound in enumerate(buckets) if value <= bound), len(buckets))
+    histogram['buckets'][index] += 1
+    histogram['sum'] += value
+    histogram['count'] += 1
+
+
+def _merge(snapshots):
+    merged = {
+        'requests': defaultdict(int),
+        'latency': {},
+        'query_counts': {},
+        'sql_queries': defaultdict(int),
+        'sql_seconds': defaultdict(float),
+        'counters': defaultdict(int),
+    }
+    for snapshot in snapshots:
+        for section in ('requests', 'sql_queries', 'sql_seconds', 'counters'):
+            for key, value in snapshot.get(section, {}).items():
+                merged[section][key] += value
+        for section in ('latency', 'query_counts'):
+            for key, histogram in snapshot.get(section, {}).items():
+                target = merged[section].setdefault(
+                    key, {'buckets': [0] * len(histogram['buckets']), 'sum': 0, 'count': 0})
+                target['buckets'] = [a + b for a, b in zip(target['buckets'], histogram['buckets'])]
+                target['sum'] += histogram['sum']
+                target['count'] += histogram['count']
+    return merged
+
+
+def _histogram_lines(name, label, histograms, buckets):
+    lines = [f'# TYPE {name} histogram']
+    for key, histogram in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip(list(buckets) + ['+Inf'], histogram['buckets']):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{label}="{key}",le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_sum{{{label}="{key}"}} {histogram["sum"]}')
+        lines.append(f'{name}_count{{{label}="{key}"}} {histogram["count"]}')
+    return lines
+
+
+def current_registry():
+    """The current app's MetricsRegistry"""
+    return current_app.extensions['metrics']
+
+
+def increment(name, amount=1):
+    """Bump a free-form counter of the current app, exported as chinopark_<name>"""
+    current_registry().increment(name, amount)
+
+
+def render_prometheus():
+    """All metrics, merged across workers, in Prometheus text format"""
+    data = current_registry().collect()
+
+    lines = ['# HELP chinopark_http_requests_total HTTP requests by endpoint, method and status.',
+             '# TYPE chinopark_http_requests_total counter']
+    for key, count in sorted(data['requests'].items()):
+        endpoint, method, status = key.split('|')
+        lines.append(f'chinopark_http_requests_total{{endpoint="{endpoint}",method="{method}",'
+                     f'status="{status}"}} {count}')
+
+    lines.append('# HELP chinopark_http_request_duration_seconds Request latency by endpoint.')
+    lines += _histogram_lines('chinopark_http_request_duration_seconds', 'endpoint',
+                              data['latency'], LATENCY_BUCKETS)
+
+    lines.append('# HELP chinopark_sql_queries_per_request SQL statements issued per request.')
+    lines += _histogram_lines('chinopark_sql_queries_per_request', 'endpoint',
+                              data['query_counts'], QUERY_COUNT_BUCKETS)
+
+    lines += ['# HELP chinopark_sql_queries_total SQL statements issued while serving each endpoint.',
+              '# TYPE chinopark_sql_queries_total counter']
+    for endpoint, count in sorted(data['sql_queries'].items()):
+        lines.append(f'chinopark_sql_queries_total{{endpoint="{endpoint}"}} {count}')
+
+    lines += ['# HELP chinopark_sql_duration_seconds_total Time spent in SQL while serving each endpoint.',
+              '# TYPE chinopark_sql_duration_seconds_total counter']
+    for endpoint, seconds in sorted(data['sql_seconds'].items()):
+        lines.append(f'chinopark_sql_duration_seconds_total{{endpoint="{endpoint}"}} {seconds:.6f}')
+
+    for name, value in sorted(data['counters'].items()):
+        lines += [f'# TYPE chinopark_{name} counter', f'chinopark_{name} {value}']
+
+    return '\n'.join(lines) + '\n'
+
+
+def _before_request():
+    g.metrics_started = time.perf_counter()
+    g.metrics_sql_queries = 0
+    g.metrics_sql_seconds = 0.0
+
+
+def _after_request(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+def _teardown_request(exc):
+    # Recorded at teardown rather than after_request so streamed responses
+    # (the CSV export) include the SQL run while the body is generated
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return
+    current_registry().observe_request(
+        request.endpoint or 'unknown',
+        request.method,
+        g.pop('metrics_status', 500),
+        time.perf_counter() - started,
+        g.pop('metrics_sql_queries', 0),
+        g.pop('metrics_sql_seconds', 0.0),
+    )
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['metrics_started'] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('metrics_started', None)
+    if started is not None and has_request_context() and 'metrics_started' in g:
+        g.metrics_sql_queries += 1
+        g.metrics_sql_seconds += time.perf_counter() - started
+
+
+def init_app(app):
+    """Collect request and SQL metrics for the given app"""
+    directory = app.config.get('METRICS_DIR')
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    registry = app.extensions['metrics'] = MetricsRegistry(directory)
+    # Keep whatever was observed since the last periodic flush
+    atexit.register(registry.flush)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
@@ -1,6 +1,8 @@
 from datetime import datetime, timedelta
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import declared_attr
 from werkzeug.security import generate_password_hash, check_password_hash
 
 # Initialize SQLAlchemy
@@ -48,8 +50,8 @@ class User(UserMixin, db.Model):
     def __repr__(self):
         return f'<User {self.username}>'
 
-class Vehicle(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
+class VehicleRecord:
+    """Columns and helpers shared by live parking sessions and the archive"""
     # Vehicle Information
     plate_number = db.Column(db.String(10), nullable=False)
     vehicle_type = db.Column(db.String(20), nullable=False)  # motorcycle, bajaj, car
@@ -67,16 +69,19 @@ class Vehicle(db.Model):
     check_in_time = db.Column(db.DateTime, default=datetime.utcnow)
     check_out_time = db.Column(db.DateTime, nullable=True)
     status = db.Column(db.String(20), default='active')  # active, completed
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+
+    @declared_attr
+    def user_id(cls):
+        return db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
 
     # Handover Information
-    handler_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    @declared_attr
+    def handler_id(cls):
+        return db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+
     handover_time = db.Column(db.DateTime, nullable=True)
     handover_notes = db.Column(db.Text, nullable=True)
 
-    def __repr__(self):
-        return f'<Vehicle {self.plate_number}>'
-
     def get_east_african_time(self, utc_time):
         """Convert UTC time to East African Time (UTC+3)"""
         if utc_time:
@@ -98,6 +103,59 @@ class Vehicle(db.Model):
         eat_time = self.get_east_african_time(self.handover_time)
         return eat_time.strftime('%Y-%m-%d %H:%M') if eat_time else ''
 
+class Vehicle(VehicleRecord, db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+
+    __table_args__ = (
+        # One active parking session per plate, enforced by the database so
+        # concurrent check-ins cannot park the same vehicle twice
+        db.Index('uq_vehicle_active_plate', 'plate_number', unique=True,
+                 postgresql_where=db.text("status = 'active'"),
+                 sqlite_where=db.text("status = 'active'")),
+        # Indexes for the hot query shapes in app.py: gate lookups by plate,
+        # per-attendant and per-handler listings, and the time ranges used by
+        # the dashboards and reports
+        db.Index('ix_vehicle_plate_status', 'plate_number', 'status'),
+        db.Index('ix_vehicle_status_type', 'status', 'vehicle_type'),
+        db.Index('ix_vehicle_user_status', 'user_id', 'status'),
+        # check_in_time indexes carry id as well so keyset pagination on
+        # (check_in_time, id) is a pure index range scan
+        db.Index('ix_vehicle_user_check_in_id', 'user_id', 'check_in_time', 'id'),
+        db.Index('ix_vehicle_handler_status', 'handler_id', 'status'),
+        db.Index('ix_vehicle_check_in_id', 'check_in_time', 'id'),
+        db.Index('ix_vehicle_check_out_time', 'check_out_time'),
+        # Archive batches walk completed sessions in (check_out_time, id)
+        # order straight off this index, without sorting every candidate
+        db.Index('ix_vehicle_status_check_out_id', 'status', 'check_out_time', 'id'),
+        db.Index('ix_vehicle_user_check_out_time', 'user_id', 'check_out_time'),
+        # Archived sessions keep their id, so ids must never be reused
+        {'sqlite_autoincrement': True},
+    )
+
+    def __repr__(self):
+        return f'<Vehicle {self.plate_number}>'
+
+class VehicleArchive(VehicleRecord, db.Model):
+    """Completed sessions moved out of the vehicle table by archive.py.
+
+    Rows keep the id they had in vehicle, so (check_in_time, id) stays
+    unique across both tables and report cursors work on either.
+    """
+    __tablename__ = 'vehicle_archive'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    recorded_by = db.relationship('User', foreign_keys='VehicleArchive.user_id')
+    handler = db.relationship('User', foreign_keys='VehicleArchive.handler_id')
+
+    __table_args__ = (
+        # Only the report shapes: time ranges and per-attendant listings
+        db.Index('ix_vehicle_archive_check_in_id', 'check_in_time', 'id'),
+        db.Index('ix_vehicle_archive_user_check_in_id', 'user_id', 'check_in_time', 'id'),
+    )
+
+    def __repr__(self):
+        return f'<VehicleArchive {self.plate_number}>'
+
 class ParkingSpace(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     vehicle_type = db.Column(db.String(20), nullable=False)
@@ -106,4 +164,128 @@ class ParkingSpace(db.Model):
     last_updated = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     def __repr__(self):
-        return f'<ParkingSpace {self.vehicle_type}>'
\ No newline at end of file
+        return f'<ParkingSpace {self.vehicle_type}>'
+
+    @classmethod
+    def reserve(cls, vehicle_type):
+        """Atomically take one space; returns False when the type is full or unknown"""
+        result = db.session.execute(
+            db.update(cls)
+            .where(cls.vehicle_type == vehicle_type,
+                   cls.occupied_spaces < cls.total_spaces)
+            .values(occupied_spaces=cls.occupied_spaces + 1)
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount == 1
+
+    @classmethod
+    def release(cls, vehicle_type):
+        """Atomically give back one space without going below zero"""
+        result = db.session.execute(
+            db.update(cls)
+            .where(cls.vehicle_type == vehicle_type,
+                   cls.occupied_spaces > 0)
+            .values(occupied_spaces=cls.occupied_spaces - 1)
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount == 1
+
+class GateOperation(db.Model):
+    """A gate action applied under a client-chosen idempotency key.
+
+    Written in the same transaction as the check-in or check-out, so a
+    device replaying its offline queue gets the original outcome back
+    instead of applying the action twice. Keys are scoped to the attendant
+    and the unique index doubles as the dedupe lookup.
+    """
+    __tablename__ = 'gate_operation'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    idempotency_key = db.Column(db.String(64), nullable=False)
+    action = db.Column(db.String(20), nullable=False)  # check_in or check_out
+    # No foreign key: the session may since have moved to vehicle_archive
+    vehicle_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'idempotency_key', name='uq_gate_operation_key'),
+        # For pruning keys older than any device would still replay
+        db.Index('ix_gate_operation_created_at', 'created_at'),
+    )
+
+    def __repr__(self):
+        return f'<GateOperation {self.action} {self.idempotency_key}>'
+
+class HourlyStat(db.Model):
+    """Gate activity rolled up per UTC hour, vehicle type and attendant.
+
+    Maintained by the gate writes in the same transaction as the Vehicle
+    change, so dashboards and trends can sum a few rows per hour instead of
+    scanning vehicles. Check-ins count at the check-in hour; check-outs and
+    their dwell time at the check-out hour; handovers at the hour of the
+    vehicle's current handover, so a cancelled or replaced one comes off again.
+    All of them are attributed to the attendant who recorded the vehicle.
+    """
+    __tablename__ = 'hourly_stat'
+
+    hour = db.Column(db.DateTime, primary_key=True)  # UTC, truncated to the hour
+    vehicle_type = db.Column(db.String(20), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    check_ins = db.Column(db.Integer, nullable=False, default=0)
+    check_outs = db.Column(db.Integer, nullable=False, default=0)
+    handovers = db.Column(db.Integer, nullable=False, default=0)
+    dwell_seconds = db.Column(db.BigInteger, nullable=False, default=0)
+
+    COUNTERS = ('check_ins', 'check_outs', 'handovers', 'dwell_seconds')
+
+    def __repr__(self):
+        return f'<HourlyStat {self.hour} {self.vehicle_type} {self.user_id}>'
+
+    @staticmethod
+    def hour_of(timestamp):
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+
+    @staticmethod
+    def dwell_seconds_between(check_in_time, check_out_time):
+        """Stay length in whole seconds, rounded the way the rebuild does in SQL"""
+        epoch = datetime(1970, 1, 1)
+        return (int((check_out_time - epoch).total_seconds())
+                - int((check_in_time - epoch).total_seconds()))
+
+    @classmethod
+    def increment(cls, changes):
+        """Add counter deltas to their rollup rows, creating rows as needed.
+
+        changes is a list of (timestamp, vehicle_type, user_id, counters)
+        tuples, counters being a dict such as {'check_ins': 1}. Everything
+        is applied by one INSERT ... ON CONFLICT DO UPDATE on Postgres and
+        SQLite, so concurrent writers add up instead of overwriting each other.
+        The rows are passed as executemany parameters rather than inlined as
+        VALUES, so the statement is compiled once and then served from the
+        compiled cache whatever the number of rows.
+        """
+        merged = {}
+        for timestamp, vehicle_type, user_id, counters in changes:
+            row = merged.setdefault((cls.hour_of(timestamp), vehicle_type, user_id),
+                                    dict.fromkeys(cls.COUNTERS, 0))
+            for counter, amount in counters.items():
+                row[counter] += amount
+        if not merged:
+            return
+        rows = [dict(counters, hour=hour, vehicle_type=vehicle_type, user_id=user_id)
+                for (hour, vehicle_type, user_id), counters in merged.items()]
+
+        dialect = db.session.get_bind().dialect.name
+        if dialect == 'postgresql':
+            statement = postgresql.insert(cls)
+        elif dialect == 'sqlite':
+            statement = sqlite.insert(cls)
+        else:
+            raise NotImplementedError(f'HourlyStat upsert is not supported on {dialect}')
+
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['hour', 'vehicle_type', 'user_id'],
+            set_={counter: getattr(cls, counter) + getattr(statement.excluded, counter)
+                  for counter in cls.COUNTERS}
+        ), rows)
@@ -0,0 +1,36 @@
+from collections import namedtuple
+from flask import current_app
+import versions
+from models import ParkingSpace
+
+# Longest a worker serves a snapshot without reloading; see
+# versions.VersionedCache
+SNAPSHOT_MAX_AGE = 5.0
+
+SpaceSnapshot = namedtuple('SpaceSnapshot', ['id', 'vehicle_type', 'total_spaces', 'occupied_spaces'])
+
+
+def load_spaces():
+    return [SpaceSnapshot(space.id, space.vehicle_type, space.total_spaces, space.occupied_spaces or 0)
+            for space in ParkingSpace.query.order_by(ParkingSpace.id)]
+
+
+def get_spaces():
+    """List of SpaceSnapshot, one per vehicle type.
+
+    Served from a process-local copy of the ParkingSpace rows. Writers call
+    invalidate() after committing a change to occupancy or capacity; that
+    bumps the shared 'occupancy' version so every worker reloads on its
+    next read. Reads only cost a stat() of the version file.
+    """
+    return current_app.extensions['occupancy'].get('occupancy', load_spaces)
+
+
+def invalidate():
+    """Drop the snapshot here and in every other worker"""
+    current_app.extensions['occupancy'].invalidate('occupancy')
+
+
+def init_app(app):
+    """Give the app its own occupancy snapshot"""
+    app.extensions['occupancy'] = versions.VersionedCache(SNAPSHOT_MAX_AGE, metric='occupancy_cache')
@@ -0,0 +1,235 @@
+import bisect
+import re
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from itertools import combinations
+from flask import current_app
+import metrics
+import versions
+from models import db, Vehicle
+
+# Completed sessions stay searchable for this long after check-out
+RECENT_WINDOW = timedelta(hours=48)
+
+# Rows changed this long before the last sync are fetched again, since
+# check-in and check-out times are set before the commit that makes them
+# visible
+SYNC_OVERLAP = timedelta(seconds=60)
+
+# Full reload interval; picks up deletions and expires old sessions even if
+# no version bump reaches this worker
+INDEX_MAX_AGE = 300.0
+
+# Largest edit distance tried for fuzzy matches; short queries get less
+MAX_DISTANCE = 2
+SHORT_QUERY_LENGTH = 4
+
+SEARCH_LIMIT = 10
+# Longest normalised query searched for, gate.PLATE_PATTERN's longest plate
+MAX_KEY_LENGTH = 10
+SEARCH_MAX_LIMIT = 50
+
+# Match kinds, in ranking order
+EXACT, PREFIX, FUZZY = 'exact', 'prefix', 'fuzzy'
+MATCH_RANK = {EXACT: 0, PREFIX: 1, FUZZY: 2}
+
+PlateEntry = namedtuple('PlateEntry', ['id', 'key', 'plate_number', 'vehicle_type', 'status',
+                                       'check_in_time', 'check_out_time', 'user_id', 'handler_id'])
+
+
+def normalize(plate_number):
+    """Search key for a plate: upper case, letters and digits only"""
+    return re.sub(r'[^A-Z0-9]', '', (plate_number or '').upper())
+
+
+def deletions(key, distance):
+    """Every string left after removing up to distance characters from key"""
+    variants = {key}
+    for removed in range(1, min(distance, len(key) - 1) + 1):
+        for positions in combinations(range(len(key)), removed):
+            variants.add(''.join(c for i, c in enumerate(key) if i not in positions))
+    return variants
+
+
+def edit_distance(a, b, limit):
+    """Levenshtein distance between a and b, or limit + 1 once it exceeds limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class PlateTable:
+    """Plate entries and the key structures searches run against.
+
+    Keys are normalised plates. A sorted key list answers prefix queries by
+    bisection, and a map from every key's deletion variants back to the
+    key answers edit-distance queries without comparing against every plate
+    (the symmetric delete method).
+    """
+
+    def __init__(self, entries=()):
+        self.entries = {}
+        self.ids_by_key = {}
+        self.keys = []
+        self.keys_by_variant = {}
+        for entry in entries:
+            self.add(entry)
+
+    def add(self, entry):
+        self.remove(entry.id)
+        self.entries[entry.id] = entry
+        ids = self.ids_by_key.setdefault(entry.key, set())
+        if not ids:
+            bisect.insort(self.keys, entry.key)
+            for variant in deletions(entry.key, MAX_DISTANCE):
+                self.keys_by_variant.setdefault(variant, set()).add(entry.key)
+        ids.add(entry.id)
+
+    def remove(self, vehicle_id):
+        entry = self.entries.pop(vehicle_id, None)
+        if not entry:
+            return
+        ids = self.ids_by_key[entry.key]
+        ids.discard(vehicle_id)
+        if ids:
+            return
+        del self.ids_by_key[entry.key]
+        del self.keys[bisect.bisect_left(self.keys, entry.key)]
+        for variant in deletions(entry.key, MAX_DISTANCE):
+            keys = self.keys_by_variant[variant]
+            keys.discard(entry.key)
+            if not keys:
+                del self.keys_by_variant[variant]
+
+    def candidates(self, key):
+        """Matching keys mapped to (match kind, edit distance)"""
+        found = {}
+        if key in self.ids_by_key:
+            found[key] = (EXACT, 0)
+        position = bisect.bisect_left(self.keys, key)
+        while position < len(self.keys) and self.keys[position].startswith(key):
+            found.setdefault(self.keys[position], (PREFIX, 0))
+            position += 1
+
+        limit = MAX_DISTANCE if len(key) > SHORT_QUERY_LENGTH else 1
+        for variant in deletions(key, limit):
+            for candidate in self.keys_by_variant.get(variant, ()):
+                if candidate in found:
+                    continue
+                distance = edit_distance(key, candidate, limit)
+                if distance <= limit:
+                    found[candidate] = (FUZZY, distance)
+        return found
+
+    def matches(self, key, user):
+        """(entry, kind, distance) for every entry the user may see"""
+        matches = []
+        for candidate, (kind, distance) in self.candidates(key).items():
+            for vehicle_id in self.ids_by_key[candidate]:
+                entry = self.entries[vehicle_id]
+                if user.id in (entry.user_id, entry.handler_id):
+                    matches.append((entry, kind, distance))
+        return matches
+
+
+def fetch(filters):
+    """PlateEntry for every vehicle row matching filters"""
+    query = db.session.query(Vehicle.id, Vehicle.plate_number, Vehicle.vehicle_type, Vehicle.status,
+                             Vehicle.check_in_time, Vehicle.check_out_time, Vehicle.user_id,
+                             Vehicle.handler_id).filter(filters)
+    return [PlateEntry(row.id, normalize(row.plate_number), *row[1:]) for row in query]
+
+
+class PlateIndex:
+    """Per-worker search index over active and recently completed plates.
+
+    Gate writes bump the shared 'occupancy' version; on the next search the
+    index fetches only the rows checked in or out since it last synced.
+    Handovers and deletions bump 'plates', which forces a full reload.
+    Rows are read, and a reloaded table built, without holding the lock:
+    it only guards the sync state and swapping in or patching the table,
+    so searches never wait on the database or on another thread's reload.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.table = PlateTable()
+        self.loaded_at = None
+        self.synced_at = None
+        self.versions = None
+
+    def sync(self):
+        """Bring the index up to date; cheap when nothing changed"""
+        # Read before the rows, so a bump racing with the query makes the
+        # next search sync again
+        current = (versions.current('occupancy'), versions.current('plates'))
+        now = datetime.utcnow()
+        cutoff = now - RECENT_WINDOW
+        with self.lock:
+            reload = not versions.fresh(current[1], self.versions and self.versions[1],
+                                        self.loaded_at, INDEX_MAX_AGE)
+            if not reload and current[0] == self.versions[0]:
+                return
+            synced_at = self.synced_at
+
+        if reload:
+            table = PlateTable(fetch((Vehicle.status == 'active') | (Vehicle.check_out_time >= cutoff)))
+            with self.lock:
+                self.table = table
+                self.loaded_at = time.monotonic()
+                self.synced_at, self.versions = now, current
+            metrics.increment('plate_index_loads_total')
+        else:
+            since = synced_at - SYNC_OVERLAP
+            entries = fetch((Vehicle.check_in_time >= since) | (Vehicle.check_out_time >= since))
+            with self.lock:
+                for entry in entries:
+                    self.table.add(entry)
+                for entry in [e for e in self.table.entries.values()
+                              if e.status != 'active' and e.check_out_time < cutoff]:
+                    self.table.remove(entry.id)
+                self.synced_at, self.versions = now, current
+            metrics.increment('plate_index_syncs_total')
+
+    def search(self, query, user, limit=SEARCH_LIMIT):
+        """Ranked matches the user recorded or was handed, best first.
+
+        Exact matches come first, then prefix matches, then near misses by
+        edit distance; within each, active sessions before completed ones
+        and newer check-ins before older ones. Queries longer than any
+        plate match nothing, which also bounds the deletion variants built
+        for them.
+        """
+        key = normalize(query)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return []
+        self.sync()
+        with self.lock:
+            matches = self.table.matches(key, user)
+        matches.sort(key=lambda match: (MATCH_RANK[match[1]], match[2], match[0].status != 'active',
+                                        -match[0].check_in_time.timestamp()))
+        return matches[:limit]
+
+
+def search(query, user, limit=SEARCH_LIMIT):
+    return current_app.extensions['plate_search'].search(query, user, limit)
+
+
+def invalidate():
+    """Force every worker to reload, e.g. after a handover or a deleted user"""
+    versions.bump('plates')
+
+
+def init_app(app):
+    """Give the app its own plate index, loaded on the first search"""
+    app.extensions['plate_search'] = PlateIndex()
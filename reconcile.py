@@ -0,0 +1,116 @@
+import fcntl
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from sqlalchemy import func
+import metrics
+import occupancy
+from models import db, Vehicle, ParkingSpace
+
+logger = logging.getLogger(__name__)
+
+Drift = namedtuple('Drift', ['vehicle_type', 'recorded', 'actual'])
+
+
+def active_counts():
+    """Active sessions per vehicle type, from one grouped query.
+
+    Served by ix_vehicle_status_type alone, so it only touches the index
+    entries of active vehicles however large the table grows.
+    """
+    return dict(db.session.query(Vehicle.vehicle_type, func.count(Vehicle.id))
+                .filter(Vehicle.status == 'active')
+                .group_by(Vehicle.vehicle_type)
+                .all())
+
+
+def reconcile(repair=False):
+    """Compare ParkingSpace.occupied_spaces with the active Vehicle rows.
+
+    Returns a Drift per vehicle type whose counter is off. With repair the
+    ParkingSpace rows are locked before counting, so gate writes wait for
+    the few milliseconds it takes and the corrected counters cannot miss a
+    concurrent check-in or check-out.
+    """
+    try:
+        query = ParkingSpace.query.order_by(ParkingSpace.id)
+        if repair:
+            query = query.with_for_update()
+        spaces = query.all()
+        counts = active_counts()
+
+        drifts = [Drift(space.vehicle_type, space.occupied_spaces or 0, counts.get(space.vehicle_type, 0))
+                  for space in spaces
+                  if (space.occupied_spaces or 0) != counts.get(space.vehicle_type, 0)]
+        for drift in drifts:
+            logger.warning(f"Occupancy drift for {drift.vehicle_type}: "
+                           f"recorded {drift.recorded}, active {drift.actual}")
+            metrics.increment('occupancy_drift_total', abs(drift.actual - drift.recorded))
+
+        if repair and drifts:
+            for drift in drifts:
+                db.session.execute(
+                    db.update(ParkingSpace)
+                    .where(ParkingSpace.vehicle_type == drift.vehicle_type)
+                    .values(occupied_spaces=drift.actual)
+                    .execution_options(synchronize_session=False)
+                )
+            db.session.commit()
+            occupancy.invalidate()
+            metrics.increment('occupancy_repairs_total', len(drifts))
+        else:
+            db.session.rollback()
+        return drifts
+    except Exception as e:
+        logger.error(f"Error reconciling occupancy: {str(e)}")
+        db.session.rollback()
+        raise
+
+
+class Reconciler:
+    """Background thread running reconcile() every RECONCILE_INTERVAL seconds.
+
+    Every worker starts one, but a pass only runs under an exclusive lock on
+    a file in SHARED_STATE_DIR and is skipped if another worker ran one
+    recently, so the deployment reconciles about once per interval rather
+    than once per worker.
+    """
+
+    def __init__(self, app, interval, repair):
+        self.app = app
+        self.interval = interval
+        self.repair = repair
+        self.lock_path = os.path.join(app.config['SHARED_STATE_DIR'], 'reconcile.lock')
+        self.thread = threading.Thread(target=self.run, name='occupancy-reconciler', daemon=True)
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                with open(self.lock_path, 'a+') as lock_file:
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        continue  # another worker is on it
+                    # The file is rewritten after every pass; skip if some
+                    # worker already ran within this interval
+                    stat = os.fstat(lock_file.fileno())
+                    if stat.st_size and time.time() - stat.st_mtime < self.interval / 2:
+                        continue
+                    with self.app.app_context():
+                        reconcile(repair=self.repair)
+                        db.session.remove()
+                    lock_file.truncate(0)
+                    lock_file.write(str(os.getpid()))
+            except Exception as e:
+                logger.error(f"Error in occupancy reconciler: {str(e)}")
+
+
+def init_app(app):
+    """Start the periodic reconciler when RECONCILE_INTERVAL is set"""
+    interval = app.config.get('RECONCILE_INTERVAL') or 0
+    if interval > 0 and app.config.get('SHARED_STATE_DIR'):
+        os.makedirs(app.config['SHARED_STATE_DIR'], exist_ok=True)
+        Reconciler(app, interval, app.config.get('RECONCILE_REPAIR', True)).thread.start()
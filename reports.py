@@ -0,0 +1,446 @@
+import base64
+import csv
+import heapq
+import logging
+from itertools import islice
+from datetime import datetime, timedelta, time
+from sqlalchemy import func, case, and_, tuple_, Integer
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import aliased, joinedload
+from sqlalchemy.sql.expression import FunctionElement
+import archive
+import occupancy
+from models import db, Vehicle, VehicleArchive, User, HourlyStat
+
+logger = logging.getLogger(__name__)
+
+# Reports are bucketed by East African Time (UTC+3) days, matching the
+# times shown everywhere else in the app
+EAT_OFFSET = timedelta(hours=3)
+EPOCH = datetime(1970, 1, 1)
+
+# Bucket size in seconds and the shift that aligns bucket boundaries; the
+# epoch fell on a Thursday, so weeks are shifted three days to start Monday
+TREND_GRANULARITIES = {
+    'hour': (3600, 0),
+    'day': (86400, 0),
+    'week': (7 * 86400, 3 * 86400),
+}
+# Default and maximum number of rows per page of report listings
+REPORT_PAGE_SIZE = 50
+REPORT_MAX_PAGE_SIZE = 200
+
+TREND_LABEL_FORMATS = {
+    'hour': '%Y-%m-%d %H:00',
+    'day': '%Y-%m-%d',
+    'week': '%Y-%m-%d',
+}
+
+
+class ReportFilterError(ValueError):
+    """Raised when the requested report filters are incomplete or unknown"""
+
+
+class epoch_seconds(FunctionElement):
+    """Whole seconds since the Unix epoch for a DateTime expression.
+
+    SQLite and Postgres have no common way to subtract timestamps, so
+    durations are computed as differences of epoch seconds instead.
+    """
+    type = Integer()
+    inherit_cache = True
+
+
+@compiles(epoch_seconds)
+def _epoch_seconds_default(element, compiler, **kw):
+    return "CAST(FLOOR(EXTRACT(EPOCH FROM %s)) AS BIGINT)" % compiler.process(element.clauses, **kw)
+
+
+@compiles(epoch_seconds, 'sqlite')
+def _epoch_seconds_sqlite(element, compiler, **kw):
+    return "CAST(strftime('%%s', %s) AS INTEGER)" % compiler.process(element.clauses, **kw)
+
+
+class ReportFilter:
+    """Parsed report filters shared by the admin reports page, export and API"""
+
+    def __init__(self, date_range, vehicle_type, status, handover_status, start_date, end_date,
+                 granularity='day'):
+        self.date_range = date_range
+        self.vehicle_type = vehicle_type
+        self.status = status
+        self.handover_status = handover_status
+        self.start_date = start_date  # EAT calendar date
+        self.end_date = end_date  # EAT calendar date, exclusive
+        self.granularity = granularity
+
+    @property
+    def start_time(self):
+        """UTC timestamp of EAT midnight at the start of the range"""
+        return datetime.combine(self.start_date, time()) - EAT_OFFSET
+
+    @property
+    def end_time(self):
+        """UTC timestamp of EAT midnight at the end of the range"""
+        return datetime.combine(self.end_date, time()) - EAT_OFFSET
+
+    @classmethod
+    def from_args(cls, args):
+        """Build filters from request arguments"""
+        date_range = args.get('date_range', 'today')
+        vehicle_type = args.get('vehicle_type', 'all')
+        status = args.get('status', 'all')
+        handover_status = args.get('handover_status', 'all')
+        start_date = args.get('start_date')
+        end_date = args.get('end_date')
+        granularity = args.get('granularity', 'day')
+        if granularity not in TREND_GRANULARITIES:
+            raise ReportFilterError('Invalid trend granularity')
+
+        # Calculate date range in EAT calendar days
+        today = (datetime.utcnow() + EAT_OFFSET).date()
+        if date_range == 'today':
+            start_date = today
+            end_date = today + timedelta(days=1)
+        elif date_range == 'yesterday':
+            start_date = today - timedelta(days=1)
+            end_date = today
+        elif date_range == 'this_week':
+            start_date = today - timedelta(days=today.weekday())
+            end_date = start_date + timedelta(days=7)
+        elif date_range == 'last_week':
+            start_date = today - timedelta(days=today.weekday() + 7)
+            end_date = start_date + timedelta(days=7)
+        elif date_range == 'this_month':
+            start_date = today.replace(day=1)
+            end_date = (today.replace(day=1) + timedelta(days=32)).replace(day=1)
+        elif date_range == 'custom':
+            if not start_date or not end_date:
+                raise ReportFilterError('Please select both start and end dates for custom range')
+            start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
+            end_date = datetime.strptime(end_date, '%Y-%m-%d').date() + timedelta(days=1)
+        else:
+            raise ReportFilterError('Invalid date range')
+
+        return cls(date_range, vehicle_type, status, handover_status, start_date, end_date, granularity)
+
+    def clauses(self, model=Vehicle):
+        """SQL filter clauses for the selected vehicles of Vehicle or VehicleArchive"""
+        filters = [
+            model.check_in_time >= self.start_time,
+            model.check_in_time < self.end_time
+        ]
+
+        if self.vehicle_type != 'all':
+            filters.append(model.vehicle_type == self.vehicle_type)
+        if self.status != 'all':
+            filters.append(model.status == self.status)
+        if self.handover_status == 'handed_over':
+            filters.append(model.handler_id.isnot(None))
+        elif self.handover_status == 'not_handed_over':
+            filters.append(model.handler_id.is_(None))
+
+        return filters
+
+    def models(self):
+        """Tables holding sessions in range: vehicle, plus the archive if needed"""
+        if self.status != 'active' and archive.covers(self.start_time):
+            return [Vehicle, VehicleArchive]
+        return [Vehicle]
+
+    @property
+    def needs_rows(self):
+        """Whether the filters depend on session state the hourly rollup lacks"""
+        return self.status != 'all' or self.handover_status != 'all'
+
+    def stat_clauses(self):
+        """HourlyStat filter clauses equivalent to clauses() for check-in counts.
+
+        EAT is a whole number of hours ahead of UTC, so the range boundaries
+        always fall on rollup hour boundaries.
+        """
+        filters = [
+            HourlyStat.hour >= self.start_time,
+            HourlyStat.hour < self.end_time
+        ]
+        if self.vehicle_type != 'all':
+            filters.append(HourlyStat.vehicle_type == self.vehicle_type)
+        return filters
+
+    def template_args(self):
+        """Filter values as echoed back into the reports page form"""
+        return {
+            'date_range': self.date_range,
+            'vehicle_type': self.vehicle_type,
+            'status': self.status,
+            'handover_status': self.handover_status,
+            'granularity': self.granularity,
+            'start_date': self.start_date.strftime('%Y-%m-%d'),
+            'end_date': (self.end_date - timedelta(days=1)).strftime('%Y-%m-%d'),
+        }
+
+
+def report_rows(report_filter):
+    """Queries for the matching vehicles, newest first, one per table in range.
+
+    Only callers that actually render or export rows should execute these,
+    through paginate(); totals come from report_summary() without loading
+    any Vehicle objects.
+    """
+    # Load recorded_by and handler in the same query; listing them lazily
+    # would cost up to two extra queries per row
+    return [(model.query
+             .options(joinedload(model.recorded_by, innerjoin=True),
+                      joinedload(model.handler))
+             .filter(and_(*report_filter.clauses(model)))
+             .order_by(model.check_in_time.desc(), model.id.desc()))
+            for model in report_filter.models()]
+
+
+def encode_cursor(vehicle):
+    """Opaque keyset cursor pointing just past the given vehicle"""
+    key = f'{vehicle.check_in_time.isoformat()}|{vehicle.id}'
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return the (check_in_time, id) key encoded by encode_cursor()"""
+    try:
+        check_in_time, vehicle_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(check_in_time), int(vehicle_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ReportFilterError('Invalid page cursor')
+
+
+def _sort_key(vehicle):
+    return vehicle.check_in_time, vehicle.id
+
+
+def paginate(queries, cursor=None, limit=REPORT_PAGE_SIZE):
+    """Fetch one page of queries ordered by check-in time and id, newest first.
+
+    Uses keyset pagination: the cursor carries the (check_in_time, id) of
+    the last row already shown, so every page is an index range scan of the
+    same cost no matter how far back the history goes. Takes a Vehicle
+    query or a list of them followed by VehicleArchive equivalents, whose
+    pages are merged; the archive is skipped when the page is already full
+    of rows newer than anything archived. Returns the rows and the cursor
+    for the next page, or None on the last page.
+    """
+    if not isinstance(queries, (list, tuple)):
+        queries = [queries]
+    key = decode_cursor(cursor) if cursor else None
+
+    pages = []
+    for query in queries:
+        model = query.column_descriptions[0]['entity']
+        if model is VehicleArchive and pages:
+            newest_archived = archive.horizon()
+            page = pages[0]
+            if newest_archived is None or (len(page) > limit and page[limit].check_in_time > newest_archived):
+                continue
+        if key:
+            query = query.filter(tuple_(model.check_in_time, model.id) < tuple_(*key))
+        pages.append(query.limit(limit + 1).all())
+
+    rows = list(islice(heapq.merge(*pages, key=_sort_key, reverse=True), limit + 1))
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def page_size(value):
+    """Parse a requested page size, clamped to REPORT_MAX_PAGE_SIZE"""
+    try:
+        return max(1, min(int(value), REPORT_MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return REPORT_PAGE_SIZE
+
+
+EXPORT_HEADERS = [
+    'Recorded By', 'Email', 'Vehicle Type', 'Plate Number',
+    'Vehicle Model', 'Vehicle Color', 'Driver Name', 'Driver ID Type',
+    'Driver ID Number', 'Driver Phone', 'Driver Residence',
+    'Check-in Time (EAT)', 'Check-out Time (EAT)', 'Duration (Hours)',
+    'Status', 'Handover Status', 'Handler', 'Handover Time', 'Handover Notes'
+]
+
+
+class _EchoBuffer:
+    """File-like object whose write() hands the formatted line straight back"""
+
+    def write(self, value):
+        return value
+
+
+def export_csv(report_filter, batch_size=1000):
+    """Yield the report as CSV text, a batch of rows at a time.
+
+    Rows are read through a server-side cursor (yield_per) with the
+    recorded-by and handler usernames joined in SQL, so memory use stays
+    constant however many rows the range covers.
+    """
+    RecordedByUser = aliased(User, name='recorded_by')
+    HandlerUser = aliased(User, name='handler')
+
+    # One stream per table in range, merged back into a single newest-first
+    # order as the rows arrive
+    streams = [(db.session.query(model, RecordedByUser.username, RecordedByUser.email,
+                                 HandlerUser.username)
+                .join(RecordedByUser, model.user_id == RecordedByUser.id)
+                .outerjoin(HandlerUser, model.handler_id == HandlerUser.id)
+                .filter(*report_filter.clauses(model))
+                .order_by(model.check_in_time.desc(), model.id.desc())
+                .yield_per(batch_size))
+               for model in report_filter.models()]
+
+    writer = csv.writer(_EchoBuffer())
+    yield writer.writerow(EXPORT_HEADERS)
+
+    now = datetime.utcnow()
+    lines = []
+    rows = heapq.merge(*streams, key=lambda row: _sort_key(row[0]), reverse=True)
+    for vehicle, recorded_by, recorded_by_email, handler in rows:
+        if vehicle.status == 'completed':
+            duration = (vehicle.check_out_time - vehicle.check_in_time).total_seconds() / 3600
+        else:
+            duration = (now - vehicle.check_in_time).total_seconds() / 3600
+
+        lines.append(writer.writerow([
+            recorded_by,
+            recorded_by_email,
+            vehicle.vehicle_type,
+            vehicle.plate_number,
+            vehicle.vehicle_model,
+            vehicle.vehicle_color,
+            vehicle.driver_name,
+            vehicle.driver_id_type.replace('_', ' ').title(),
+            vehicle.driver_id_number,
+            vehicle.driver_phone,
+            vehicle.driver_residence,
+            vehicle.formatted_check_in_time(),
+            vehicle.formatted_check_out_time() or 'N/A',
+            f"{duration:.1f}",
+            vehicle.status.title(),
+            'Handed Over' if vehicle.handler_id else 'Not Handed Over',
+            handler or 'N/A',
+            vehicle.formatted_handover_time() or 'N/A',
+            vehicle.handover_notes or 'N/A'
+        ]))
+        if len(lines) >= batch_size:
+            yield ''.join(lines)
+            lines = []
+
+    if lines:
+        yield ''.join(lines)
+
+
+def report_summary(report_filter):
+    """Calculate report metrics and the vehicle type distribution.
+
+    Totals, handover counts and durations come from one aggregate query
+    grouped by vehicle type per table in range; space utilization from the
+    occupancy cache.
+    """
+    try:
+        now = datetime.utcnow()
+        totals = {}
+        for model in report_filter.models():
+            end_time = case((model.status == 'completed', model.check_out_time), else_=now)
+            duration = epoch_seconds(end_time) - epoch_seconds(model.check_in_time)
+            handed_over = model.handler_id.isnot(None)
+
+            for row in (db.session.query(
+                            model.vehicle_type,
+                            func.count(model.id),
+                            func.sum(case((handed_over, 1), else_=0)),
+                            func.sum(case((and_(handed_over, model.status == 'active'), 1), else_=0)),
+                            func.sum(duration))
+                        .filter(*report_filter.clauses(model))
+                        .group_by(model.vehicle_type)):
+                total = totals.setdefault(row[0], [0, 0, 0, 0])
+                for index, value in enumerate(row[1:]):
+                    total[index] += value or 0
+        rows = [(vehicle_type, *total) for vehicle_type, total in sorted(totals.items())]
+
+        total_vehicles = sum(row[1] for row in rows)
+        total_duration = sum(row[4] or 0 for row in rows)
+        avg_duration = total_duration / total_vehicles / 3600 if total_vehicles else 0
+
+        metrics = {
+            'total_vehicles': total_vehicles,
+            'total_handovers': sum(row[2] or 0 for row in rows),
+            'active_handovers': sum(row[3] or 0 for row in rows),
+            'avg_duration': round(avg_duration, 1),
+            'utilization': calculate_utilization()
+        }
+        vehicle_distribution = {
+            'labels': [row[0].title() for row in rows],
+            'data': [row[1] for row in rows]
+        }
+        return metrics, vehicle_distribution
+
+    except Exception as e:
+        logger.error(f"Error calculating report summary: {str(e)}")
+        db.session.rollback()
+        return {
+            'total_vehicles': 0,
+            'total_handovers': 0,
+            'active_handovers': 0,
+            'avg_duration': 0,
+            'utilization': 0
+        }, {'labels': [], 'data': []}
+
+
+def calculate_utilization():
+    """Current space utilization across all vehicle types, in percent"""
+    spaces = occupancy.get_spaces()
+    total_spaces = sum(space.total_spaces for space in spaces)
+    occupied = sum(space.occupied_spaces for space in spaces)
+    return round(occupied / total_spaces * 100, 1) if total_spaces else 0
+
+
+def calculate_checkins_trend(report_filter):
+    """Calculate the check-ins trend in hourly, daily or weekly EAT buckets.
+
+    All buckets are counted by one grouped query, over the hourly rollup
+    unless the filters need per-vehicle state; buckets without any
+    check-ins are filled with zeros so the chart keeps an even time axis.
+    """
+    try:
+        size, shift = TREND_GRANULARITIES[report_filter.granularity]
+        if report_filter.needs_rows:
+            sources = [(model.check_in_time, func.count(model.id), report_filter.clauses(model))
+                       for model in report_filter.models()]
+        else:
+            sources = [(HourlyStat.hour, func.sum(HourlyStat.check_ins), report_filter.stat_clauses())]
+
+        counts = {}
+        for timestamp, count, filters in sources:
+            local_seconds = epoch_seconds(timestamp) + int(EAT_OFFSET.total_seconds())
+            bucket = ((local_seconds + shift) // size).label('bucket')
+            for index, value in (db.session.query(bucket, count)
+                                 .filter(*filters)
+                                 .group_by(bucket)):
+                counts[index] = counts.get(index, 0) + value
+
+        def bucket_of(local_time):
+            return (int((local_time - EPOCH).total_seconds()) + shift) // size
+
+        first = bucket_of(report_filter.start_time + EAT_OFFSET)
+        last = bucket_of(report_filter.end_time + EAT_OFFSET - timedelta(seconds=1))
+        label_format = TREND_LABEL_FORMATS[report_filter.granularity]
+
+        labels = []
+        data = []
+        for index in range(first, last + 1):
+            labels.append((EPOCH + timedelta(seconds=index * size - shift)).strftime(label_format))
+            data.append(counts.get(index, 0))
+
+        return {
+            'labels': labels,
+            'data': data
+        }
+    except Exception as e:
+        logger.error(f"Error calculating check-ins trend: {str(e)}")
+        db.session.rollback()
+        return {'labels': [], 'data': []}
@@ -15,7 +15,9 @@ document.addEventListener('DOMContentLoaded', function() {
             if (!plateNumber.match(/^[A-Za-z0-9]{3,10}$/)) {
                 event.preventDefault();
                 alert('Please enter a valid plate number (3-10 alphanumeric characters)');
+                return;
             }
+            submitGateForm(event, checkInForm, 'Vehicle checked in successfully!');
         });
     }
 
@@ -25,10 +27,41 @@ document.addEventListener('DOMContentLoaded', function() {
             if (!plateNumber.match(/^[A-Za-z0-9]{3,10}$/)) {
                 event.preventDefault();
                 alert('Please enter a valid plate number (3-10 alphanumeric characters)');
+                return;
             }
+            submitGateForm(event, checkOutForm, 'Vehicle checked out successfully!');
         });
     }
 
+    const checkOutPlate = document.getElementById('checkOutPlateNumber');
+    if (checkOutPlate && checkOutPlate.dataset.search && window.fetch) {
+        let searchTimer = null;
+        checkOutPlate.addEventListener('input', function() {
+            clearTimeout(searchTimer);
+            searchTimer = setTimeout(() => suggestPlates(checkOutPlate), 150);
+        });
+    }
+
+    // Live occupancy on the dashboard
+    const gateMessages = document.getElementById('gateMessages');
+    if (gateMessages && gateMessages.dataset.events) {
+        openEventStream(gateMessages.dataset.events, {occupancy: updateOccupancy});
+    }
+
+    // Gate actions queued by the service worker while offline
+    if ('serviceWorker' in navigator) {
+        navigator.serviceWorker.addEventListener('message', event => {
+            if (event.data && event.data.type === 'gate-queue-replayed') {
+                showReplayResults(event.data);
+            }
+        });
+        const replay = () => navigator.serviceWorker.ready.then(registration => {
+            if (registration.active) registration.active.postMessage({type: 'replay-gate-queue'});
+        });
+        window.addEventListener('online', replay);
+        replay();
+    }
+
     // Auto-dismiss alerts after 3 seconds
     const alerts = document.querySelectorAll('.alert');
     alerts.forEach(alert => {
@@ -37,4 +70,135 @@ document.addEventListener('DOMContentLoaded', function() {
             setTimeout(() => alert.remove(), 150);
         }, 3000);
     });
-});
\ No newline at end of file
+});
+
+// Send a gate form to the JSON API so the action, its result and the new
+// occupancy cost one round trip instead of a post, redirect and re-render
+function submitGateForm(event, form, successMessage) {
+    if (!form.dataset.api || !window.fetch) return;
+    event.preventDefault();
+
+    const body = {};
+    new FormData(form).forEach((value, key) => { body[key] = value; });
+
+    fetch(form.dataset.api, {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json', 'Accept': 'application/json',
+                  'Idempotency-Key': newIdempotencyKey()},
+        credentials: 'same-origin',
+        body: JSON.stringify(body)
+    })
+        .then(response => response.json().then(data => ({ok: response.ok, data: data})))
+        .then(result => {
+            if (result.data.occupancy) {
+                updateOccupancy(result.data.occupancy);
+            }
+            if (result.data.queued) {
+                // Offline: the service worker keeps it and sends it later
+                form.reset();
+                showGateMessage(`Saved offline (${result.data.pending} waiting). ` +
+                                'It will be sent when the connection returns.', 'warning');
+            } else if (result.ok) {
+                form.reset();
+                showGateMessage(successMessage, 'success');
+            } else {
+                showGateMessage(result.data.error || 'Request failed', 'error');
+            }
+        })
+        .catch(() => {
+            // Fall back to the plain form post
+            form.submit();
+        });
+}
+
+// A fresh key per gate action; the server applies each key only once, so a
+// retried or replayed request cannot check a vehicle in or out twice
+function newIdempotencyKey() {
+    if (window.crypto && window.crypto.randomUUID) return window.crypto.randomUUID();
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
+
+function showReplayResults(data) {
+    if (data.occupancy) {
+        updateOccupancy(data.occupancy);
+    }
+    const refused = (data.results || []).filter(result => result.result !== 'ok');
+    const sent = (data.results || []).length - refused.length;
+    let message = `Sent ${sent} gate action${sent === 1 ? '' : 's'} saved while offline.`;
+    if (refused.length) {
+        message += ' Refused: ' + refused.map(result =>
+            `${result.plate_number || result.action} (${result.error})`).join(', ');
+    }
+    showGateMessage(message, refused.length ? 'warning' : 'success');
+}
+
+function updateOccupancy(occupancy) {
+    Object.keys(occupancy).forEach(vehicleType => {
+        const card = document.querySelector(`[data-vehicle-type="${vehicleType}"]`);
+        if (!card) return;
+        const space = occupancy[vehicleType];
+        const ratio = space.total ? space.occupied / space.total : 0;
+        card.querySelector('.space-indicator').textContent = `${space.occupied} / ${space.total}`;
+        card.querySelector('.space-available').textContent = `Nafasi Zilizopo: ${space.available}`;
+
+        const bar = card.querySelector('.progress-bar');
+        bar.style.width = `${Math.round(ratio * 100)}%`;
+        bar.classList.remove('bg-danger', 'bg-warning', 'bg-success');
+        bar.classList.add(ratio > 0.8 ? 'bg-danger' : ratio > 0.5 ? 'bg-warning' : 'bg-success');
+    });
+}
+
+function showGateMessage(message, category) {
+    const container = document.getElementById('gateMessages');
+    if (!container) return;
+    const alertEl = document.createElement('div');
+    alertEl.className = `alert alert-${category} alert-dismissible fade show`;
+    alertEl.textContent = message;
+    const close = document.createElement('button');
+    close.type = 'button';
+    close.className = 'btn-close';
+    close.setAttribute('data-bs-dismiss', 'alert');
+    alertEl.appendChild(close);
+    container.replaceChildren(alertEl);
+}
+
+// Fill the input's datalist with active plates matching what was typed so
+// far, including near misses, so a mistyped plate can still be checked out
+function suggestPlates(input) {
+    const list = document.getElementById(input.getAttribute('list'));
+    const query = input.value.trim();
+    if (!list) return;
+    if (query.length < 2) {
+        list.replaceChildren();
+        return;
+    }
+
+    fetch(`${input.dataset.search}?q=${encodeURIComponent(query)}`, {
+        headers: {'Accept': 'application/json'},
+        credentials: 'same-origin'
+    })
+        .then(response => response.ok ? response.json() : {matches: []})
+        .then(data => {
+            if (input.value.trim() !== query) return;  // superseded by later typing
+            list.replaceChildren(...data.matches
+                .filter(match => match.status === 'active')
+                .map(match => {
+                    const option = document.createElement('option');
+                    option.value = match.plate_number;
+                    option.label = match.vehicle_type;
+                    return option;
+                }));
+        })
+        .catch(() => list.replaceChildren());
+}
+
+// Subscribe to a Server-Sent Events stream, calling handlers[name] with the
+// parsed data of each named event. EventSource reconnects by itself.
+function openEventStream(url, handlers) {
+    if (!window.EventSource) return null;
+    const source = new EventSource(url, {withCredentials: true});
+    Object.keys(handlers).forEach(name => {
+        source.addEventListener(name, event => handlers[name](JSON.parse(event.data)));
+    });
+    return source;
+}
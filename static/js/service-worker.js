@@ -1,27 +1,30 @@
-const CACHE_NAME = 'chino-park-v1';
+const CACHE_NAME = 'chino-park-v2';
 const STATIC_RESOURCES = [
-    '/',
-    '/static/css/style.css',
-    '/static/js/parking.js',
-    '/static/icons/icon-192x192.svg',
-    '/static/icons/icon-512x512.svg',
     'https://cdn.replit.com/agent/bootstrap-agent-dark-theme.min.css',
     'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css',
     'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js',
     'https://cdn.jsdelivr.net/npm/chart.js'
 ];
 
+// Gate actions queued while offline are replayed to the batch endpoint
+// with the idempotency key each one was given when it was queued, so a
+// replay that is retried never checks a vehicle in or out twice
+const GATE_ENDPOINTS = {'/api/v1/check-in': 'check_in', '/api/v1/check-out': 'check_out'};
+const BATCH_ENDPOINT = '/api/v1/batch';
+const BATCH_MAX_ITEMS = 200;  // gate.BATCH_MAX_ITEMS
+const SYNC_TAG = 'gate-queue';
+const DB_NAME = 'chino-park';
+const QUEUE_STORE = 'gate-queue';
+
 // Install event - cache static resources
 self.addEventListener('install', event => {
     event.waitUntil(
         caches.open(CACHE_NAME)
-            .then(cache => {
-                console.log('Caching static resources');
-                return cache.addAll(STATIC_RESOURCES);
-            })
+            .then(cache => cache.addAll(STATIC_RESOURCES))
             .catch(error => {
                 console.error('Error caching static resources:', error);
             })
+            .then(() => self.skipWaiting())
     );
 });
 
@@ -29,61 +32,180 @@ self.addEventListener('install', event => {
 self.addEventListener('activate', event => {
     event.waitUntil(
         caches.keys()
-            .then(cacheNames => {
-                return Promise.all(
-                    cacheNames.map(cacheName => {
-                        if (cacheName !== CACHE_NAME) {
-                            console.log('Deleting old cache:', cacheName);
-                            return caches.delete(cacheName);
-                        }
-                    })
-                );
-            })
-            .then(() => {
-                console.log('Service Worker activated');
-                return self.clients.claim();
-            })
+            .then(cacheNames => Promise.all(
+                cacheNames
+                    .filter(cacheName => cacheName !== CACHE_NAME)
+                    .map(cacheName => caches.delete(cacheName))
+            ))
+            .then(() => self.clients.claim())
+            .then(() => replayQueue())
     );
 });
 
-// Fetch event - serve from cache, falling back to network
 self.addEventListener('fetch', event => {
-    // Skip non-GET requests
+    const url = new URL(event.request.url);
+
+    if (event.request.method === 'POST') {
+        if (url.origin === self.location.origin && GATE_ENDPOINTS[url.pathname]) {
+            event.respondWith(sendOrQueue(event.request, GATE_ENDPOINTS[url.pathname]));
+        }
+        return;
+    }
     if (event.request.method !== 'GET') return;
 
-    event.respondWith(
-        caches.match(event.request)
+    if (url.origin !== self.location.origin || url.pathname.startsWith('/static/build/')) {
+        // CDN files and fingerprinted assets never change under a URL
+        event.respondWith(cacheFirst(event.request));
+    } else if (event.request.mode === 'navigate') {
+        // Pages are always fetched fresh; the last copy only stands in
+        // while offline so the dashboard can still queue gate actions
+        event.respondWith(networkFirst(event.request));
+    }
+    // Everything else (APIs, event streams, exports) goes to the network
+});
+
+// Background Sync fires when connectivity returns, even with no page open
+self.addEventListener('sync', event => {
+    if (event.tag === SYNC_TAG) {
+        event.waitUntil(replayQueue());
+    }
+});
+
+// Pages ask for a replay when they load or come back online, for browsers
+// without Background Sync
+self.addEventListener('message', event => {
+    if (event.data && event.data.type === 'replay-gate-queue') {
+        event.waitUntil(replayQueue());
+    }
+});
+
+function cacheFirst(request) {
+    return caches.match(request).then(cached => cached || fetch(request).then(response => {
+        if (response.ok || response.type === 'opaque') {
+            const copy = response.clone();
+            caches.open(CACHE_NAME).then(cache => cache.put(request, copy));
+        }
+        return response;
+    }));
+}
+
+function networkFirst(request) {
+    return fetch(request)
+        .then(response => {
+            if (response.ok && !response.redirected) {
+                const copy = response.clone();
+                caches.open(CACHE_NAME).then(cache => cache.put(request, copy));
+            }
+            return response;
+        })
+        .catch(() => caches.match(request).then(cached => cached || Response.error()));
+}
+
+function sendOrQueue(request, action) {
+    const queued = request.clone();
+    return fetch(request).catch(() => queued.json().then(body => {
+        const operation = Object.assign({}, body, {
+            action: action,
+            idempotency_key: queued.headers.get('Idempotency-Key') || body.idempotency_key || newKey()
+        });
+        return enqueue(operation)
+            .then(() => self.registration.sync ? self.registration.sync.register(SYNC_TAG) : null)
+            .catch(() => null)
+            .then(() => countQueued())
+            .then(count => new Response(JSON.stringify({queued: true, pending: count}), {
+                status: 202,
+                headers: {'Content-Type': 'application/json'}
+            }));
+    }));
+}
+
+function newKey() {
+    if (self.crypto && self.crypto.randomUUID) return self.crypto.randomUUID();
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
+
+// Replays queued operations oldest first, one batch request at a time.
+// Items leave the queue only once the server has answered for them; a
+// failed or rejected request leaves them for the next attempt.
+let replaying = null;
+
+function replayQueue() {
+    if (!replaying) {
+        replaying = replayBatches().finally(() => { replaying = null; });
+    }
+    return replaying;
+}
+
+function replayBatches() {
+    return readQueue(BATCH_MAX_ITEMS).then(entries => {
+        if (!entries.length) return null;
+        return fetch(BATCH_ENDPOINT, {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json', 'Accept': 'application/json'},
+            credentials: 'same-origin',
+            body: JSON.stringify({operations: entries.map(entry => entry.operation)})
+        })
             .then(response => {
-                if (response) {
-                    console.log('Serving from cache:', event.request.url);
-                    return response;
-                }
-
-                // Clone the request because it's a stream and can only be consumed once
-                const fetchRequest = event.request.clone();
-
-                return fetch(fetchRequest)
-                    .then(response => {
-                        // Check if we received a valid response
-                        if (!response || response.status !== 200 || response.type !== 'basic') {
-                            return response;
-                        }
-
-                        // Clone the response because it's a stream and can only be consumed once
-                        const responseToCache = response.clone();
-
-                        caches.open(CACHE_NAME)
-                            .then(cache => {
-                                console.log('Caching new resource:', event.request.url);
-                                cache.put(event.request, responseToCache);
-                            });
-
-                        return response;
-                    })
-                    .catch(error => {
-                        console.error('Fetch error:', error);
-                        // You might want to return a custom offline page here
-                    });
+                // 401 means the session expired; keep the queue until the
+                // attendant logs in again
+                if (!response.ok) throw new Error(`Batch replay failed with ${response.status}`);
+                return response.json();
             })
-    );
-});
\ No newline at end of file
+            .then(data => removeQueued(entries.map(entry => entry.id))
+                .then(() => notifyClients({type: 'gate-queue-replayed', results: data.results,
+                                           occupancy: data.occupancy}))
+                .then(() => replayBatches()));
+    }).catch(error => {
+        console.error('Gate queue replay failed:', error);
+    });
+}
+
+function notifyClients(message) {
+    return self.clients.matchAll({type: 'window'})
+        .then(clients => countQueued().then(count => {
+            clients.forEach(client => client.postMessage(Object.assign({pending: count}, message)));
+        }));
+}
+
+// IndexedDB queue: {id (auto), operation, queuedAt}
+function openQueue() {
+    return new Promise((resolve, reject) => {
+        const request = indexedDB.open(DB_NAME, 1);
+        request.onupgradeneeded = () => {
+            request.result.createObjectStore(QUEUE_STORE, {keyPath: 'id', autoIncrement: true});
+        };
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+}
+
+function queueTransaction(mode, work) {
+    return openQueue().then(db => new Promise((resolve, reject) => {
+        const transaction = db.transaction(QUEUE_STORE, mode);
+        const result = work(transaction.objectStore(QUEUE_STORE));
+        transaction.oncomplete = () => {
+            db.close();
+            resolve(result && 'result' in result ? result.result : undefined);
+        };
+        transaction.onerror = () => {
+            db.close();
+            reject(transaction.error);
+        };
+    }));
+}
+
+function enqueue(operation) {
+    return queueTransaction('readwrite', store => store.add({operation: operation, queuedAt: Date.now()}));
+}
+
+function readQueue(limit) {
+    return queueTransaction('readonly', store => store.getAll(null, limit));
+}
+
+function countQueued() {
+    return queueTransaction('readonly', store => store.count());
+}
+
+function removeQueued(ids) {
+    return queueTransaction('readwrite', store => ids.forEach(id => store.delete(id)));
+}
@@ -0,0 +1,107 @@
+import logging
+from datetime import timedelta
+from sqlalchemy import func, case
+from models import db, Vehicle, VehicleArchive, HourlyStat
+from reports import EPOCH, epoch_seconds
+
+logger = logging.getLogger(__name__)
+
+# Rows per upsert executemany when rebuilding, bounding the memory held
+# for one round of parameters
+REBUILD_CHUNK_SIZE = 500
+
+
+def rebuild():
+    """Recompute the hourly rollup from the vehicle and archive tables.
+
+    Needed whenever vehicles were changed outside the gate code paths;
+    init_db() runs it once on a database upgraded to the rollup. Runs in a
+    single transaction, so readers see either the old or the new rollup.
+    """
+    sources = []
+    for model in (Vehicle, VehicleArchive):
+        sources += [
+            (model, model.check_in_time, {'check_ins': func.count(model.id)}, []),
+            (model, model.check_out_time, {
+                'check_outs': func.count(model.id),
+                'dwell_seconds': func.sum(epoch_seconds(model.check_out_time)
+                                          - epoch_seconds(model.check_in_time)),
+            }, [model.status == 'completed', model.check_out_time.isnot(None)]),
+            (model, model.handover_time, {'handovers': func.count(model.id)}, [model.handover_time.isnot(None)]),
+        ]
+
+    try:
+        db.session.query(HourlyStat).delete(synchronize_session=False)
+        rows = 0
+        for model, column, aggregates, filters in sources:
+            bucket = (epoch_seconds(column) // 3600).label('bucket')
+            query = (db.session.query(bucket, model.vehicle_type, model.user_id,
+                                      *[aggregate.label(name) for name, aggregate in aggregates.items()])
+                     .filter(*filters)
+                     .group_by(bucket, model.vehicle_type, model.user_id))
+
+            changes = []
+            for row in query:
+                counters = {name: int(getattr(row, name) or 0) for name in aggregates}
+                changes.append((EPOCH + timedelta(hours=row.bucket), row.vehicle_type, row.user_id, counters))
+                if len(changes) >= REBUILD_CHUNK_SIZE:
+                    HourlyStat.increment(changes)
+                    rows += len(changes)
+                    changes = []
+            HourlyStat.increment(changes)
+            rows += len(changes)
+        db.session.commit()
+        return rows
+    except Exception as e:
+        logger.error(f"Error rebuilding hourly stats: {str(e)}")
+        db.session.rollback()
+        raise
+
+
+def backfill():
+    """Rebuild the rollup if it is empty but sessions exist, as right after
+    upgrading; returns the number of rows written"""
+    if db.session.query(HourlyStat.hour).first() is not None:
+        return 0
+    if (db.session.query(Vehicle.id).first() is None
+            and db.session.query(VehicleArchive.id).first() is None):
+        return 0
+    rows = rebuild()
+    logger.info(f"Backfilled {rows} hourly stat rows")
+    return rows
+
+
+def activity_since(since, user_id=None):
+    """Summed counters and the busiest check-in hour from a UTC time onwards.
+
+    One grouped query over the rollup; returns (totals, peak_hour) where
+    peak_hour is the UTC hour with the most check-ins, or None.
+    """
+    query = (db.session.query(HourlyStat.hour,
+                              func.sum(HourlyStat.check_ins),
+                              func.sum(HourlyStat.check_outs),
+                              func.sum(HourlyStat.dwell_seconds))
+             .filter(HourlyStat.hour >= since))
+    if user_id is not None:
+        query = query.filter(HourlyStat.user_id == user_id)
+
+    totals = {'check_ins': 0, 'check_outs': 0, 'dwell_seconds': 0}
+    peak_hour, peak_check_ins = None, 0
+    for hour, check_ins, check_outs, dwell_seconds in query.group_by(HourlyStat.hour).order_by(HourlyStat.hour):
+        totals['check_ins'] += check_ins or 0
+        totals['check_outs'] += check_outs or 0
+        totals['dwell_seconds'] += dwell_seconds or 0
+        if (check_ins or 0) > peak_check_ins:
+            peak_hour, peak_check_ins = hour, check_ins
+    return totals, peak_hour
+
+
+def dashboard_totals(today):
+    """All-time check-ins plus today's check-ins and check-outs, in one query"""
+    is_today = HourlyStat.hour >= today
+    row = db.session.query(
+        func.coalesce(func.sum(HourlyStat.check_ins), 0),
+        func.coalesce(func.sum(case((is_today, HourlyStat.check_ins), else_=0)), 0),
+        func.coalesce(func.sum(case((is_today, HourlyStat.check_outs), else_=0)), 0),
+    ).one()
+    return {'total_check_ins': int(row[0]), 'today_check_ins': int(row[1]), 'today_check_outs': int(row[2])}
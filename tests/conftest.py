@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+# After the project root, so benchmarks/plate_search.py does not shadow the
+# app's plate_search module; the tests reuse the benchmark query lists
+sys.path.append(os.path.join(ROOT, 'benchmarks'))
+
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    """App on TEST_DATABASE_URL, or a fresh SQLite file, after init_db()"""
+    from app import create_app, init_db
+    from models import db
+
+    tmp_path = tmp_path_factory.mktemp('app')
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': os.environ.get('TEST_DATABASE_URL', f'sqlite:///{tmp_path}/test.db'),
+        'SECRET_KEY': 'test',
+        'SHARED_STATE_DIR': str(tmp_path / 'state'),
+        'METRICS_DIR': str(tmp_path / 'metrics'),
+    })
+    with app.app_context():
+        init_db()
+    yield app
+    with app.app_context():
+        db.engine.dispose()
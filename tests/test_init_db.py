@@ -0,0 +1,20 @@
+from datetime import datetime
+
+import gate
+from app import init_db
+from models import db, GateOperation
+
+
+def test_init_db_prunes_expired_idempotency_keys(app):
+    now = datetime.utcnow()
+    with app.app_context():
+        db.session.add_all([
+            GateOperation(user_id=1, idempotency_key='expired', action='check_in', vehicle_id=1,
+                          created_at=now - gate.OPERATION_RETENTION * 2),
+            GateOperation(user_id=1, idempotency_key='recent', action='check_in', vehicle_id=2,
+                          created_at=now),
+        ])
+        db.session.commit()
+        init_db()
+        keys = {operation.idempotency_key for operation in GateOperation.query}
+    assert keys == {'recent'}
@@ -0,0 +1,52 @@
+"""Per-endpoint SQL query budgets, from benchmarks/query_counts.py.
+
+The seeded vehicles are spread over many recorders and handlers, so a
+relationship loaded per row shows up as a blown budget.
+"""
+import pytest
+from query_counts import BUDGETS, CONDITIONAL, PASSWORDS, seed
+from sqlalchemy import event
+
+from models import db
+
+
+@pytest.fixture(scope='module')
+def clients(app):
+    """Logged-in test clients by login, and the list of statements issued"""
+    statements = []
+
+    def record(conn, cursor, statement, *rest):
+        statements.append(statement)
+
+    with app.app_context():
+        seed(60)
+        engine = db.engine
+    clients = {}
+    for login, password in PASSWORDS.items():
+        username = login if login == 'admin' else f'bench_{login}'
+        clients[login] = app.test_client()
+        clients[login].post('/login', data={'username': username, 'password': password})
+    event.listen(engine, 'before_cursor_execute', record)
+    yield clients, statements
+    event.remove(engine, 'before_cursor_execute', record)
+
+
+@pytest.mark.parametrize('login, path, budget', BUDGETS)
+def test_query_budget(clients, login, path, budget):
+    clients, statements = clients
+    statements.clear()
+    response = clients[login].get(path)
+    response.get_data()  # drain streamed responses
+    assert response.status_code == 200
+    assert len(statements) <= budget, statements
+
+
+@pytest.mark.parametrize('login, path', CONDITIONAL)
+def test_revalidation_runs_no_sql(clients, login, path):
+    clients, statements = clients
+    etag = clients[login].get(path).headers.get('ETag')
+    assert etag
+    statements.clear()
+    response = clients[login].get(path, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert not statements
@@ -0,0 +1,45 @@
+"""Every hot query shape in app.py is served by an index.
+
+Runs the query list of benchmarks/query_plans.py through EXPLAIN. Against
+Postgres (TEST_DATABASE_URL), sequential scans are disabled for the
+session so the plans show whether an index can serve each query at all.
+"""
+import pytest
+from query_plans import ORDERED_QUERIES, explain, hot_queries
+
+from app import create_indexes
+from models import db, Vehicle, VehicleArchive, GateOperation
+
+
+def test_hot_queries_use_an_index(app):
+    with app.app_context():
+        if db.engine.dialect.name == 'postgresql':
+            db.session.execute(db.text('SET enable_seqscan = off'))
+        scans = {}
+        for name, query in hot_queries(Vehicle, VehicleArchive, GateOperation, db):
+            uses_index, plan = explain(db, query, ordered=name in ORDERED_QUERIES)
+            if not uses_index:
+                scans[name] = plan
+        db.session.rollback()
+    assert not scans
+
+
+def test_ordered_check_rejects_a_sort(app):
+    with app.app_context():
+        if db.engine.dialect.name != 'sqlite':
+            pytest.skip('plan text checked is SQLite specific')
+        # The archive batch query as it was before it followed its index
+        query = db.session.query(Vehicle.id).filter(
+            Vehicle.status == 'completed', Vehicle.check_out_time < db.func.now()
+        ).order_by(Vehicle.id).limit(1000)
+        uses_index, plan = explain(db, query, ordered=True)
+    assert not uses_index, plan
+
+
+def test_create_indexes_adds_missing_indexes(app):
+    with app.app_context():
+        index = next(index for index in Vehicle.__table__.indexes if index.name == 'ix_vehicle_plate_status')
+        index.drop(db.engine)
+        create_indexes()
+        names = {index['name'] for index in db.inspect(db.engine).get_indexes('vehicle')}
+    assert 'ix_vehicle_plate_status' in names
@@ -0,0 +1,67 @@
+from flask import current_app
+from flask_login import UserMixin
+import versions
+from models import db, User
+
+# Longest a worker keeps a user without reloading; see
+# versions.VersionedCache
+USER_CACHE_TTL = 60.0
+USER_CACHE_SIZE = 1024
+
+
+class CachedUser(UserMixin):
+    """Detached copy of the User fields that requests read on every hit.
+
+    Only identity, role and account flags are kept. Views that need
+    anything else load the User row themselves.
+    """
+
+    # Plain attribute instead of UserMixin's property so it can be assigned
+    is_active = True
+
+    def __init__(self, user):
+        self.id = user.id
+        self.username = user.username
+        self.email = user.email
+        self.is_admin = user.is_admin
+        self.is_approved = user.is_approved
+        self.is_active = user.is_active
+
+    def has_role(self, role):
+        if role == 'admin':
+            return self.is_admin
+        return False
+
+    def __repr__(self):
+        return f'<User {self.username}>'
+
+
+def _version_name(user_id):
+    return f'user-{user_id}'
+
+
+def load_user(user_id):
+    user = db.session.get(User, user_id)
+    return CachedUser(user) if user else None
+
+
+def get_user(user_id):
+    """CachedUser for the id, or None if there is no such user.
+
+    Served from a process-local LRU. Each user has their own shared
+    version, bumped by invalidate() whenever an admin changes or deletes
+    the account, so every worker reloads that user on their next request.
+    A hit costs a stat() of the version file.
+    """
+    return current_app.extensions['user_cache'].get(_version_name(user_id), lambda: load_user(user_id))
+
+
+def invalidate(user_id):
+    """Drop the user here and in every other worker"""
+    current_app.extensions['user_cache'].invalidate(_version_name(user_id))
+
+
+def init_app(app):
+    """Give the app its own user cache"""
+    app.extensions['user_cache'] = versions.VersionedCache(USER_CACHE_TTL, size=USER_CACHE_SIZE,
+                                                           metric='user_cache')
@@ -0,0 +1,119 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _directory():
+    """SHARED_STATE_DIR of the current app, None when versions are off"""
+    return current_app.extensions['versions']
+
+
+def current(name):
+    """Cheap version token for a named piece of shared data.
+
+    Versions live as files in SHARED_STATE_DIR and bump() replaces the file,
+    so the token is the file's inode and modification time. Checking it is
+    a single stat() call, with no database round trip, and every gunicorn
+    worker on the host sees a bump made by any other worker.
+    """
+    directory = _directory()
+    if not directory:
+        return None
+    try:
+        stat = os.stat(os.path.join(directory, name))
+        return stat.st_ino, stat.st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def enabled():
+    """Whether versions are tracked at all; without a SHARED_STATE_DIR every
+    current() is None and bumps are lost"""
+    return bool(_directory())
+
+
+def bump(name):
+    """Mark a named piece of shared data as changed"""
+    directory = _directory()
+    if not directory:
+        return
+    path = os.path.join(directory, name)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(tmp_path, 'w') as f:
+            f.write(str(os.getpid()))
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.error(f"Error bumping version {name}: {str(e)}")
+
+
+def fresh(version, seen, loaded_at, max_age):
+    """Whether data loaded at loaded_at (time.monotonic()) under version
+    seen can still be used now that the version is version"""
+    return (loaded_at is not None and version == seen
+            and time.monotonic() - loaded_at < max_age)
+
+
+class VersionedCache:
+    """Process-local values, each kept until its shared version is bumped.
+
+    Values are cached under the name of their version. A value is also
+    reloaded once it is max_age seconds old: that bounds how stale it can
+    get when the version file is not shared, e.g. with workers spread over
+    several hosts. With size, only that many most recently used values are
+    kept. Hits and misses are counted as <metric>_hits_total and
+    <metric>_misses_total.
+    """
+
+    def __init__(self, max_age, size=None, metric=None):
+        self.lock = threading.Lock()
+        self.max_age = max_age
+        self.size = size
+        self.metric = metric
+        self.entries = OrderedDict()
+
+    def get(self, name, load):
+        """The value cached under name, calling load() to fetch it on a miss"""
+        version = current(name)
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is not None and fresh(version, entry[1], entry[2], self.max_age):
+                self.entries.move_to_end(name)
+                self._count('hits')
+                return entry[0]
+        self._count('misses')
+
+        # Loaded without holding the lock: a thread waiting on it may hold
+        # the last pooled connection the load needs. Concurrent misses each
+        # load, and the last one stored wins.
+        value = load()
+        with self.lock:
+            self.entries[name] = (value, version, time.monotonic())
+            self.entries.move_to_end(name)
+            while self.size is not None and len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return value
+
+    def invalidate(self, name):
+        """Drop the value here and in every other worker"""
+        bump(name)
+        with self.lock:
+            self.entries.pop(name, None)
+
+    def _count(self, outcome):
+        if self.metric:
+            metrics.increment(f'{self.metric}_{outcome}_total')
+
+
+def init_app(app):
+    """Use the app's SHARED_STATE_DIR for version files"""
+    directory = app.config.get('SHARED_STATE_DIR')
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    app.extensions['versions'] = directory